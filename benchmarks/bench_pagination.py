@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark OFFSET vs keyset pagination against the local PostgREST stand-in.
+
+Walks the whole stand-in table with both strategies through
+``extract._fetch_page`` and reports per-page latency at the start, middle
+and end of the table, split into server query time (measured inside the
+stand-in) and end-to-end client latency.  OFFSET query time grows with
+the offset; keyset query time stays flat.
+
+Usage
+-----
+    python benchmarks/bench_pagination.py --rows 300000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from postgrest_stub import STUB_COLUMNS, build_database, serve
+
+TABLE = "weather_history"
+
+
+def _walk(mode: str) -> list[float]:
+    """Fetch every page in ``mode`` and return per-page latencies (s)."""
+    from src.data import extract
+
+    latencies: list[float] = []
+    offset, last_id = 0, None
+    while True:
+        t0 = time.perf_counter()
+        if mode == "offset":
+            rows, _ = extract._fetch_page(TABLE, STUB_COLUMNS, offset,
+                                          extract.PAGE_SIZE, count=False)
+        else:
+            filters = [] if last_id is None else [("id", f"gt.{last_id}")]
+            rows, _ = extract._fetch_page(TABLE, STUB_COLUMNS, 0,
+                                          extract.PAGE_SIZE, filters=filters,
+                                          count=False)
+        latencies.append(time.perf_counter() - t0)
+        if not rows:
+            break
+        offset += len(rows)
+        last_id = rows[-1]["id"]
+        if len(rows) < extract.PAGE_SIZE:
+            break
+    return latencies
+
+
+def main(n_rows: int) -> None:
+    print(f"Building stand-in table with {n_rows} rows ...")
+    server = serve(build_database(n_rows))
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    db_times = server.RequestHandlerClass.db_times
+
+    print(f"{'mode':<8} {'metric':<7} {'pages':>6} {'first 10%':>10} "
+          f"{'middle':>10} {'last 10%':>10} {'last/first':>10} {'total s':>8}")
+    for mode in ("offset", "keyset"):
+        db_times.clear()
+        client = _walk(mode)
+        for metric, lat in (("query", list(db_times)), ("client", client)):
+            print(f"{mode:<8} {metric:<7} {len(lat):>6} " + _summarize(lat))
+    server.shutdown()
+
+
+def _summarize(lat: list[float]) -> str:
+    """Median latency of the first, middle and last tenth of the pages."""
+    k = max(1, len(lat) // 10)
+    mid = len(lat) // 2
+    first = statistics.median(lat[:k]) * 1000
+    middle = statistics.median(lat[mid - k // 2: mid + k // 2 + 1]) * 1000
+    last = statistics.median(lat[-k:]) * 1000
+    return (f"{first:>8.2f}ms {middle:>8.2f}ms {last:>8.2f}ms "
+            f"{last / first:>10.2f} {sum(lat):>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OFFSET vs keyset paging")
+    parser.add_argument("--rows", type=int, default=300_000)
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark the (city, date) joins of ``merge_daily``: pandas vs panel_join.
+
+Builds synthetic weather, air-quality and aggregated health frames for
+``n`` cities x ``days`` days (a few percent of rows missing from each, in
+shuffled order like freshly merged raw files), then times the two
+``merge_daily`` joins done with ``pd.merge(on=["city", "date"])`` and
+with ``src.data.panel_join.join``, and checks both give the same frame.
+
+Usage
+-----
+    python benchmarks/bench_panel_join.py                 # 27 and 5570 cities
+    python benchmarks/bench_panel_join.py --cities 27 --city-dtype str
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from src.data.panel_join import join
+from src.utils.config import CAPITALS
+
+N_VALUE_COLS = 6
+
+
+def _frame(names: np.ndarray, dates: pd.DatetimeIndex, prefix: str,
+           dtype: str, city_dtype: str, rng: np.random.Generator) -> pd.DataFrame:
+    """City-day frame with ``N_VALUE_COLS`` value columns, 3% rows dropped."""
+    n = len(names) * len(dates)
+    keep = np.sort(rng.permutation(n)[: int(n * 0.97)])
+    rng.shuffle(keep)
+    df = pd.DataFrame({
+        "city": np.repeat(names, len(dates))[keep],
+        "date": np.tile(dates.to_numpy(), len(names))[keep],
+    })
+    df["city"] = df["city"].astype("category" if city_dtype == "category" else str)
+    for j in range(N_VALUE_COLS):
+        df[f"{prefix}{j}"] = rng.integers(0, 100, len(df)).astype(dtype)
+    return df
+
+
+def _time(fn, repeats: int) -> tuple[float, pd.DataFrame]:
+    best, out = np.inf, None
+    for _ in range(repeats):
+        out = None
+        gc.collect()
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def run(n_cities: int, days: int, city_dtype: str, repeats: int) -> None:
+    rng = np.random.default_rng(0)
+    names = np.array(list(CAPITALS) + [f"Municipio {i:04d}" for i in range(n_cities)])
+    names = names[:n_cities]
+    dates = pd.date_range("2022-01-01", periods=days)
+    weather = _frame(names, dates, "wx", "float32", city_dtype, rng)
+    air_quality = _frame(names, dates, "aq", "float32", city_dtype, rng)
+    health = _frame(names, dates, "adm", "int32", city_dtype, rng)
+
+    def with_pandas():
+        daily = pd.merge(weather, air_quality, on=["city", "date"], how="inner",
+                         suffixes=("_wx", "_aq"))
+        return pd.merge(daily, health, on=["city", "date"], how="inner")
+
+    def with_keys():
+        daily = join(weather, air_quality, how="inner", suffixes=("_wx", "_aq"))
+        return join(daily, health, how="inner")
+
+    t_pd, expected = _time(with_pandas, repeats)
+    expected["city"] = expected["city"].astype(str)
+    t_keys, got = _time(with_keys, repeats)
+    got["city"] = got["city"].astype(str)
+    pd.testing.assert_frame_equal(expected, got)
+    print(f"{n_cities:>7} {len(weather):>10} {city_dtype:>9} {t_pd:>10.3f} "
+          f"{t_keys:>10.3f} {t_pd / t_keys:>8.1f}x")
+
+
+def main(cities: list[int], days: int, city_dtype: str, repeats: int) -> None:
+    print(f"{'cities':>7} {'rows':>10} {'city':>9} {'pd.merge':>10} "
+          f"{'join':>10} {'speedup':>9}")
+    for n in cities:
+        run(n, days, city_dtype, repeats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pd.merge vs panel_join.join")
+    parser.add_argument("--cities", type=int, nargs="+", default=[27, 5570])
+    parser.add_argument("--days", type=int, default=1461)
+    parser.add_argument("--city-dtype", choices=["category", "str"], default="category")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    main(args.cities, args.days, args.city_dtype, args.repeats)
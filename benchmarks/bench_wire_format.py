@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON vs CSV responses against the local PostgREST stand-in.
+
+Walks the whole stand-in table by keyset twice, once asking for JSON
+(``resp.json()`` + ``_rows_to_table``) and once for ``text/csv``
+(``pyarrow.csv`` straight into the declared schema), and reports the
+client CPU time per 1000 rows for each.  CPU time is measured with
+``time.thread_time`` on the calling thread only, so the stand-in's own
+work (it runs on server threads in this process) is not counted.
+
+Usage
+-----
+    python benchmarks/bench_wire_format.py --rows 200000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from postgrest_stub import STUB_COLUMNS, build_database, serve
+
+TABLE = "weather_history"
+
+
+def _walk(wire_format: str) -> tuple[int, list[float], list[float]]:
+    """
+    Fetch every page as ``wire_format`` and convert it to Arrow.
+
+    Returns the row count and per-page client CPU and wall times (s),
+    each covering the request, decoding and the conversion to the
+    declared schema.
+    """
+    from src.data import extract
+
+    schema = extract.arrow_schema(TABLE)
+    csv_schema = schema if wire_format == "csv" else None
+    cpu: list[float] = []
+    wall: list[float] = []
+    n_rows, last_id = 0, None
+    while True:
+        c0, t0 = time.thread_time(), time.perf_counter()
+        filters = [] if last_id is None else [("id", f"gt.{last_id}")]
+        page, _ = extract._fetch_page(TABLE, STUB_COLUMNS, 0, extract.PAGE_SIZE,
+                                      filters=filters, count=False,
+                                      schema=csv_schema)
+        if page and csv_schema is None:
+            extract._rows_to_table(page, schema)
+        cpu.append(time.thread_time() - c0)
+        wall.append(time.perf_counter() - t0)
+        if not page:
+            break
+        n_rows += len(page)
+        last_id = extract._last_value(page, "id")
+        if len(page) < extract.PAGE_SIZE:
+            break
+    return n_rows, cpu, wall
+
+
+def main(n_rows: int, repeats: int) -> None:
+    print(f"Building stand-in table with {n_rows} rows ...")
+    server = serve(build_database(n_rows))
+    os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{'format':<7} {'rows':>8} {'cpu ms/1k rows':>15} "
+          f"{'wall ms/1k rows':>16} {'cpu total s':>12}")
+    results = {}
+    for wire_format in ("json", "csv"):
+        runs = [_walk(wire_format) for _ in range(repeats)]
+        fetched = runs[0][0]
+        # Best of the repeats: least disturbed by the rest of the machine
+        cpu = min(sum(r[1]) for r in runs)
+        wall = min(sum(r[2]) for r in runs)
+        results[wire_format] = cpu
+        print(f"{wire_format:<7} {fetched:>8} {cpu / fetched * 1e6:>15.2f} "
+              f"{wall / fetched * 1e6:>16.2f} {cpu:>12.2f}")
+        page_cpu = statistics.median(runs[0][1]) * 1000
+        print(f"{'':<7} median page: {page_cpu:.2f} ms CPU")
+    print(f"CSV uses {results['csv'] / results['json']:.0%} of the JSON "
+          f"client CPU time.")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON vs CSV wire format")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    main(args.rows, args.repeats)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Minimal PostgREST-compatible stand-in backed by SQLite.
+
+Serves ``GET /rest/v1/<table>`` with the subset of the PostgREST query
+language used by ``src/data/extract.py``: ``select``, ``order``,
+``offset``/``limit``, the ``Range`` header, ``Prefer: count=exact``,
+``Accept: text/csv`` and horizontal filters (``col=op.value`` with eq, neq, gt, gte, lt, lte,
+like, ilike).  Because the rows live in a real SQL engine with an index
+on ``id``, OFFSET pages pay the same linear skip cost they do on
+Postgres, while ``id=gt.<last>`` pages are index range scans.
+
+Used only by the benchmarks in this directory; not part of the pipeline.
+
+Usage
+-----
+    python benchmarks/postgrest_stub.py --rows 200000 --port 8765
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+_OPS = {
+    "eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=",
+    "like": "LIKE", "ilike": "LIKE",
+}
+
+STUB_COLUMNS = [
+    "id", "city", "date", "lat", "lon",
+    "temperature_mean", "temperature_max", "temperature_min",
+    "apparent_temperature_max", "apparent_temperature_min",
+    "relative_humidity_mean", "pressure_mean",
+    "wind_speed_max", "wind_gusts_max", "wind_direction_dominant",
+    "precipitation_sum", "rain_sum", "precipitation_hours",
+    "shortwave_radiation_sum", "et0_fao_evapotranspiration",
+    "daylight_duration", "uv_index_max",
+]
+
+
+def build_database(n_rows: int, table: str = "weather_history",
+                   seed: int = 42, start: date = date(2015, 1, 1)) -> sqlite3.Connection:
+    """Create an in-memory table shaped like ``weather_history``."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    # ``id`` is a text key with a secondary index (like Supabase uuid keys),
+    # so skipped OFFSET rows are materialized from the table as on Postgres.
+    cols_sql = ", ".join(
+        f"{c} {'TEXT' if c in ('id', 'city', 'date') else 'REAL'}"
+        for c in STUB_COLUMNS
+    )
+    conn.execute(f"CREATE TABLE {table} ({cols_sql})")
+    conn.execute(f"CREATE UNIQUE INDEX {table}_id ON {table} (id)")
+    cities = [f"City {i:02d}" for i in range(27)]
+    rows = []
+    for i in range(1, n_rows + 1):
+        city = cities[i % len(cities)]
+        day = start + timedelta(days=i // len(cities))
+        values = [round(rng.uniform(-5, 40), 2) for _ in STUB_COLUMNS[3:]]
+        rows.append((f"{rng.getrandbits(64):016x}", city, day.isoformat(), *values))
+    placeholders = ", ".join("?" for _ in STUB_COLUMNS)
+    conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+    conn.commit()
+    return conn
+
+
+class _Handler(BaseHTTPRequestHandler):
+    conn: sqlite3.Connection
+    lock: threading.Lock
+    db_times: list[float]   # per-request query time (s), read by benchmarks
+
+    def log_message(self, *args) -> None:  # silence per-request logging
+        pass
+
+    def _send(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        parts = urlsplit(self.path)
+        table = parts.path.rsplit("/", 1)[-1]
+        params = parse_qsl(parts.query, keep_blank_values=True)
+
+        select, order, offset, limit = "*", None, 0, None
+        where, args = [], []
+        for key, value in params:
+            if key == "select":
+                select = value
+            elif key == "order":
+                col, _, direction = value.partition(".")
+                order = f"{col} {'DESC' if direction == 'desc' else 'ASC'}"
+            elif key == "offset":
+                offset = int(value)
+            elif key == "limit":
+                limit = int(value)
+            else:
+                op, _, operand = value.partition(".")
+                if op not in _OPS:
+                    self._send(400, b'{"message":"unsupported operator"}',
+                               {"Content-Type": "application/json"})
+                    return
+                if op in ("like", "ilike"):
+                    operand = operand.replace("*", "%")
+                col = f"lower({key})" if op == "ilike" else key
+                where.append(f"{col} {_OPS[op]} ?")
+                args.append(operand.lower() if op == "ilike" else operand)
+
+        rng = self.headers.get("Range")
+        if rng and limit is None:
+            lo, _, hi = rng.partition("-")
+            offset, limit = int(lo), int(hi) - int(lo) + 1
+
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        sql = f"SELECT {select} FROM {table}{where_sql}"
+        if order:
+            sql += f" ORDER BY {order}"
+        sql += f" LIMIT {limit if limit is not None else -1} OFFSET {offset}"
+
+        with self.lock:
+            t0 = time.perf_counter()
+            try:
+                cur = self.conn.execute(sql, args)
+            except sqlite3.OperationalError as exc:
+                # PostgREST answers 404 for an unknown table, view or column
+                body = json.dumps({"code": "PGRST205", "message": str(exc)})
+                self._send(404, body.encode(), {"Content-Type": "application/json"})
+                return
+            names = [d[0] for d in cur.description]
+            records = cur.fetchall()
+            self.db_times.append(time.perf_counter() - t0)
+            rows = [dict(zip(names, r)) for r in records]
+            total = "*"
+            if "count=exact" in self.headers.get("Prefer", ""):
+                total = str(self.conn.execute(
+                    f"SELECT count(*) FROM {table}{where_sql}", args
+                ).fetchone()[0])
+
+        if not rows and offset > 0:
+            self._send(416, b"[]", {"Content-Range": f"*/{total}"})
+            return
+        end = offset + len(rows) - 1
+        if "text/csv" in self.headers.get("Accept", ""):
+            content_type, body = "text/csv", _to_csv(names, records)
+        else:
+            content_type, body = "application/json", json.dumps(rows).encode()
+        self._send(200, body, {
+            "Content-Type": content_type,
+            "Content-Range": f"{offset}-{end}/{total}" if rows else f"*/{total}",
+        })
+
+
+def _to_csv(names: list[str], records: list[tuple]) -> bytes:
+    """Render rows as PostgREST does: header line, NULL as an empty field."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(names)
+    writer.writerows(records)
+    return buf.getvalue().encode()
+
+
+def serve(conn: sqlite3.Connection, port: int = 0) -> ThreadingHTTPServer:
+    """Start the stand-in on a background thread and return the server."""
+    handler = type("Handler", (_Handler,), {
+        "conn": conn, "lock": threading.Lock(), "db_times": [],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    srv = serve(build_database(args.rows), args.port)
+    print(f"Serving {args.rows} rows on http://127.0.0.1:{srv.server_port}")
+    threading.Event().wait()
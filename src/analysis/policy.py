@@ -28,7 +28,6 @@ import pandas as pd
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     TABLES_DIR,
     REPORTS_DIR,
@@ -43,6 +42,7 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("policy")
@@ -54,13 +54,14 @@ np.random.seed(RANDOM_SEED)
 # Load model and data
 # ---------------------------------------------------------------------------
 def load_model_and_panel() -> tuple:
-    """Load the fitted CausalForestDML and the full panel."""
+    """Load the fitted CausalForestDML and the panel columns it needs."""
     model_path = MODELS_DIR / f"cf_{OUTCOME_TOTAL}" / "model.pkl"
     logger.info("Loading model from %s", model_path)
     with open(model_path, "rb") as f:
         cf = pickle.load(f)
 
-    panel = pd.read_parquet(PROCESSED_DIR / "analysis_panel.parquet")
+    panel = panel_store.load_panel(panel_store.model_columns(
+        [OUTCOME_TOTAL], extra=["city", "pm25", "total_cost"]))
 
     # Build analysis subset
     available_moderators = [c for c in HETEROGENEITY_MODERATORS if c in panel.columns]
@@ -108,7 +109,7 @@ def prevented_fraction(
 
     city_summary = (
         subset_c
-        .groupby("city")
+        .groupby("city", observed=True)
         .agg(
             total_admissions=(OUTCOME_TOTAL, "sum"),
             treated_days=("treated", "sum"),
@@ -27,7 +27,6 @@ from econml.dml import CausalForestDML
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     TABLES_DIR,
     REPORTS_DIR,
@@ -45,6 +44,7 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("sensitivity")
@@ -55,9 +55,10 @@ np.random.seed(RANDOM_SEED)
 # ---------------------------------------------------------------------------
 # Shared helpers
 # ---------------------------------------------------------------------------
-def load_panel() -> pd.DataFrame:
-    path = PROCESSED_DIR / "analysis_panel.parquet"
-    return pd.read_parquet(path)
+def load_panel(filters=None) -> pd.DataFrame:
+    # city/date for the placebo lead and the jackknife, pm25 for thresholds
+    columns = panel_store.model_columns([OUTCOME_TOTAL], extra=["city", "date", "pm25"])
+    return panel_store.load_panel(columns, filters)
 
 
 def _fit_quick_cf(
@@ -136,7 +137,7 @@ def placebo_test(panel: pd.DataFrame) -> dict:
 
     df = panel.copy().sort_values(["city", "date"]).reset_index(drop=True)
     # Create lead-7 PM2.5 treatment
-    df["pm25_lead7"] = df.groupby("city")["pm25"].shift(-7)
+    df["pm25_lead7"] = df.groupby("city", observed=True)["pm25"].shift(-7)
     df["pm25_lead7_exceed"] = (df["pm25_lead7"] > WHO_PM25_THRESHOLD).astype(int)
     df = df.dropna(subset=["pm25_lead7_exceed"])
 
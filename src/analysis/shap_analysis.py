@@ -28,7 +28,6 @@ import shap
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     FIGURES_DIR,
     TABLES_DIR,
@@ -41,6 +40,7 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("shap_analysis")
@@ -60,7 +60,7 @@ def load_model_and_data(
     with open(model_path, "rb") as f:
         cf = pickle.load(f)
 
-    panel = pd.read_parquet(PROCESSED_DIR / "analysis_panel.parquet")
+    panel = panel_store.load_panel(panel_store.model_columns([outcome]))
 
     # Reproduce the same matrix construction
     available_moderators = [c for c in HETEROGENEITY_MODERATORS if c in panel.columns]
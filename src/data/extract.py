@@ -3,26 +3,50 @@
 Extract all five core tables from the Clima360 Supabase instance.
 
 Uses the Supabase PostgREST API directly via ``requests`` to handle
-pagination (default server limit is 1000 rows per request).  Each table
-is saved as a Parquet file in ``data/raw/``.
+pagination (default server limit is 1000 rows per request).  Pages are
+walked by keyset (``id=gt.<last id>``) unless ``config.TABLE_PAGINATION``
+or ``--pagination offset`` says otherwise; ``--workers`` above 1 plans
+page offsets up front and therefore always pages by offset.  Each table is
+saved as a Parquet file in ``data/raw/``; pages are streamed to disk as
+they arrive, so memory stays bounded regardless of table size, and
+committed in checkpoints so an interrupted run resumes where it stopped.
+Only rows that ``process.py`` keeps are requested
+(``config.TABLE_FILTERS``), and health is read pre-aggregated per city-day
+(``config.HEALTH_DAILY_VIEW``).
 
 Usage
 -----
     python src/data/extract.py          # extract all tables
     python src/data/extract.py weather  # extract only weather_history
+    python src/data/extract.py --workers 8    # fetch 8 pages concurrently
+    python src/data/extract.py --incremental  # append rows past watermark
+    python src/data/extract.py --full-history # no row filters
+    python src/data/extract.py --health-detail # per-CID health rows
+    python src/data/extract.py --no-resume    # ignore interrupted-run checkpoints
+    python src/data/extract.py --wire-format csv  # parse text/csv pages with Arrow
 """
 
 from __future__ import annotations
 
 import argparse
+import datetime as dt
 import json
 import logging
+import os
+import shutil
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import requests
 
 # ---------------------------------------------------------------------------
@@ -33,11 +57,28 @@ from src.utils.config import (
     SUPABASE_URL,
     SUPABASE_ANON_KEY,
     TABLES,
+    HEALTH_AGG_COLUMNS,
+    HEALTH_DAILY_VIEW,
+    RESPIRATORY_FILTER,
     TABLE_COLUMNS,
-    RAW_DIR,
+    TABLE_FILTERS,
+    TABLE_PAGINATION,
+    TABLE_SCHEMAS,
+    TABLE_WATERMARKS,
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data.raw_store import (
+    clear_fragments,
+    clear_staging,
+    load_checkpoint,
+    load_manifest,
+    new_fragment_path,
+    raw_path,
+    save_checkpoint,
+    save_manifest,
+    staging_dir,
+)
 
 # ---------------------------------------------------------------------------
 # Logging
@@ -52,6 +93,24 @@ PAGE_SIZE = 1000          # Supabase default row limit
 MAX_RETRIES = 5           # retries per page on transient errors
 RETRY_BACKOFF = 2.0       # exponential backoff base (seconds)
 REQUEST_TIMEOUT = 60      # seconds per HTTP request
+DEFAULT_WORKERS = 1       # concurrent page requests (1 = sequential)
+ROW_GROUP_ROWS = 64_000   # rows buffered per Parquet row group when streaming
+CHECKPOINT_ROWS = 10_000  # rows committed to the staging area per checkpoint
+WIRE_FORMATS = ("json", "csv")
+DEFAULT_WIRE_FORMAT = "json"
+
+_thread_local = threading.local()
+
+# A page is either decoded JSON rows or, for CSV responses, an Arrow table
+Page = list[dict[str, Any]] | pa.Table
+
+
+class PostgrestClientError(RuntimeError):
+    """A 4xx response that retrying cannot fix (bad filter, unknown relation)."""
+
+    def __init__(self, message: str, status: int) -> None:
+        super().__init__(message)
+        self.status = status
 
 
 # ---------------------------------------------------------------------------
@@ -68,45 +127,87 @@ def _build_headers() -> dict[str, str]:
     }
 
 
+def _get_session() -> requests.Session:
+    """
+    Return a ``requests.Session`` bound to the calling thread.
+
+    Sessions keep TCP/TLS connections alive between pages, so each worker
+    in the concurrent path pays the handshake cost once, not once per page.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+
 def _fetch_page(
     table: str,
     columns: list[str],
     offset: int,
     limit: int,
     order_col: str = "id",
-) -> tuple[list[dict[str, Any]], int | None]:
+    filters: list[tuple[str, str]] | None = None,
+    count: bool = True,
+    schema: pa.Schema | None = None,
+) -> tuple[Page, int | None]:
     """
     Fetch a single page from the Supabase REST endpoint.
 
+    Parameters
+    ----------
+    filters : list of (column, "op.value") or None
+        PostgREST horizontal filters, e.g. ``[("id", "gt.40581")]``.
+    count : bool
+        Ask the server for an exact total.  This costs a full count on
+        every request, so keyset paging only asks on its first page.
+    schema : pa.Schema or None
+        If given, the page is requested as ``text/csv`` and parsed
+        straight into an Arrow table with these column types
+        (``_csv_to_table``), skipping JSON decoding entirely.
+
     Returns
     -------
-    rows : list[dict]
-        The deserialized JSON rows.
+    rows : list[dict] or pa.Table
+        The deserialized JSON rows, or an Arrow table when ``schema`` is set.
     total : int or None
         Total row count (from Content-Range header), or None if unavailable.
     """
     url = f"{SUPABASE_URL}/rest/v1/{table}"
-    params = {
-        "select": ",".join(columns),
-        "order": f"{order_col}.asc",
-        "offset": str(offset),
-        "limit": str(limit),
-    }
+    params = [
+        ("select", ",".join(columns)),
+        ("order", f"{order_col}.asc"),
+        ("offset", str(offset)),
+        ("limit", str(limit)),
+    ]
+    params.extend(filters or [])
     headers = _build_headers()
+    if not count:
+        del headers["Prefer"]
     # Request exact count via Range header
     headers["Range-Unit"] = "items"
     headers["Range"] = f"{offset}-{offset + limit - 1}"
+    if schema is not None:
+        headers["Accept"] = "text/csv"
 
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.get(
+            resp = _get_session().get(
                 url, headers=headers, params=params, timeout=REQUEST_TIMEOUT
             )
             if resp.status_code == 416:
                 # Range not satisfiable — we've gone past the end
                 return [], 0
+            if 400 <= resp.status_code < 500 and resp.status_code not in (408, 429):
+                raise PostgrestClientError(
+                    f"{table}: HTTP {resp.status_code} {resp.text[:200]}",
+                    resp.status_code,
+                )
             resp.raise_for_status()
-            rows = resp.json()
+            if schema is not None:
+                rows = _csv_to_table(resp.content, schema)
+            else:
+                rows = resp.json()
 
             # Parse total from Content-Range: "0-999/40581"
             total = None
@@ -122,69 +223,735 @@ def _fetch_page(
         except requests.exceptions.RequestException as exc:
             wait = RETRY_BACKOFF ** attempt
             logger.warning(
-                "Attempt %d/%d for %s offset=%d failed: %s — retrying in %.1fs",
-                attempt, MAX_RETRIES, table, offset, exc, wait,
+                "Attempt %d/%d for %s offset=%d filters=%s failed: %s — "
+                "retrying in %.1fs",
+                attempt, MAX_RETRIES, table, offset, filters, exc, wait,
             )
             time.sleep(wait)
 
     raise RuntimeError(
-        f"Failed to fetch {table} offset={offset} after {MAX_RETRIES} attempts"
+        f"Failed to fetch {table} offset={offset} filters={filters} "
+        f"after {MAX_RETRIES} attempts"
     )
 
 
-def extract_table(table_key: str) -> pd.DataFrame:
+def _csv_to_table(body: bytes, schema: pa.Schema) -> pa.Table:
     """
-    Extract a full table from Supabase with automatic pagination.
+    Parse a PostgREST CSV page into an Arrow table with ``schema``.
 
-    Parameters
-    ----------
-    table_key : str
-        Friendly key in ``config.TABLES`` (e.g. ``"weather"``).
-
-    Returns
-    -------
-    pd.DataFrame
+    Column types come from the declared schema, so values are converted
+    once by the C++ CSV reader instead of going through Python objects.
+    PostgREST writes NULL as an empty unquoted field; a quoted ``""`` stays
+    an empty string.  Columns missing from the page are filled with nulls.
     """
-    table_name = TABLES[table_key]
-    columns = TABLE_COLUMNS[table_name]
-    logger.info("Extracting table '%s' (%s) ...", table_key, table_name)
+    if not body.strip():
+        return schema.empty_table()
+    table = pacsv.read_csv(
+        pa.py_buffer(body),
+        read_options=pacsv.ReadOptions(use_threads=False),
+        convert_options=pacsv.ConvertOptions(
+            column_types={field.name: field.type for field in schema},
+            null_values=[""],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,
+        ),
+    )
+    n = table.num_rows
+    arrays = [
+        table.column(field.name) if field.name in table.column_names
+        else pa.nulls(n, field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _last_value(page: Page, col: str) -> Any:
+    """Value of ``col`` in the last row of a JSON or Arrow page."""
+    if isinstance(page, pa.Table):
+        return page.column(col)[-1].as_py()
+    return page[-1][col]
 
-    all_rows: list[dict[str, Any]] = []
-    offset = 0
+
+def _log_progress(fetched: int, total_known: int | None) -> None:
+    """Log cumulative row count, with a percentage when the total is known."""
+    pct = (
+        f" ({fetched}/{total_known}, {100*fetched/total_known:.1f}%)"
+        if total_known
+        else ""
+    )
+    logger.info("  ... fetched %d rows so far%s", fetched, pct)
+
+
+def _iter_pages_sequential(
+    table_name: str,
+    columns: list[str],
+    filters: list[tuple[str, str]] | None = None,
+    start_offset: int = 0,
+    schema: pa.Schema | None = None,
+) -> Iterator[Page]:
+    """Yield pages one request at a time until a short page is returned."""
+    offset = start_offset
     total_known: int | None = None
 
     while True:
-        rows, total = _fetch_page(table_name, columns, offset, PAGE_SIZE)
+        rows, total = _fetch_page(table_name, columns, offset, PAGE_SIZE,
+                                  filters=filters, schema=schema)
         if total is not None:
             total_known = total
         if not rows:
             break
-        all_rows.extend(rows)
+        yield rows
         offset += len(rows)
+        _log_progress(offset, total_known)
 
-        pct = (
-            f" ({offset}/{total_known}, {100*offset/total_known:.1f}%)"
-            if total_known
-            else ""
+        # If we received fewer than PAGE_SIZE rows we are done
+        if len(rows) < PAGE_SIZE:
+            break
+
+
+def _iter_pages_keyset(
+    table_name: str,
+    columns: list[str],
+    filters: list[tuple[str, str]] | None = None,
+    key_col: str = "id",
+    start_key: Any = None,
+    schema: pa.Schema | None = None,
+) -> Iterator[Page]:
+    """
+    Yield pages using keyset (cursor) pagination on ``key_col``.
+
+    Each request filters ``key_col=gt.<last key seen>`` instead of using
+    OFFSET, so every page is an index range scan of the same cost and
+    rows inserted mid-run cannot shift page boundaries.  ``start_key``
+    resumes after a previously committed key.
+    """
+    if key_col not in columns:
+        columns = [key_col] + columns
+    last_key: Any = start_key
+    fetched = 0
+    total_known: int | None = None
+
+    while True:
+        cursor = [] if last_key is None else [(key_col, f"gt.{last_key}")]
+        rows, total = _fetch_page(
+            table_name, columns, 0, PAGE_SIZE, order_col=key_col,
+            filters=(filters or []) + cursor, count=fetched == 0,
+            schema=schema,
         )
-        logger.info("  ... fetched %d rows so far%s", offset, pct)
+        if total is not None and fetched == 0:
+            total_known = total
+        if not rows:
+            break
+        yield rows
+        fetched += len(rows)
+        last_key = _last_value(rows, key_col)
+        _log_progress(fetched, total_known)
 
-        # If we received fewer than PAGE_SIZE rows we are done
         if len(rows) < PAGE_SIZE:
             break
 
-    df = pd.DataFrame(all_rows)
+
+def _iter_pages_concurrent(
+    table_name: str,
+    columns: list[str],
+    workers: int,
+    filters: list[tuple[str, str]] | None = None,
+    start_offset: int = 0,
+    schema: pa.Schema | None = None,
+) -> Iterator[Page]:
+    """
+    Yield pages fetched by a bounded thread pool, in offset order.
+
+    The first page (at ``start_offset``) is fetched on its own to read the
+    exact total from ``Content-Range``; every remaining offset is then
+    planned up front and fetched without a count, so the server runs
+    ``COUNT(*)`` once per table rather than once per page.  At most
+    ``2 * workers`` pages are in flight at any time, so memory stays
+    bounded even when the consumer is slower than the network.
+    """
+    first, total = _fetch_page(table_name, columns, start_offset, PAGE_SIZE,
+                               filters=filters, schema=schema)
+    if not first:
+        return
+    yield first
+    _log_progress(start_offset + len(first), total)
+
+    if total is None:
+        # No count available: we cannot plan ranges, continue sequentially
+        logger.warning("  No Content-Range total for %s; falling back to "
+                       "sequential paging", table_name)
+        offset = start_offset + len(first)
+        while len(first) == PAGE_SIZE:
+            first, _ = _fetch_page(table_name, columns, offset, PAGE_SIZE,
+                                   filters=filters, count=False, schema=schema)
+            if not first:
+                break
+            yield first
+            offset += len(first)
+            _log_progress(offset, None)
+        return
+
+    offsets = deque(range(start_offset + len(first), total, PAGE_SIZE))
+    fetched = start_offset + len(first)
+    pending: deque[Future] = deque()
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix=f"extract-{table_name}") as pool:
+        while offsets or pending:
+            while offsets and len(pending) < 2 * workers:
+                pending.append(pool.submit(
+                    _fetch_page, table_name, columns, offsets.popleft(),
+                    PAGE_SIZE, filters=filters, count=False, schema=schema,
+                ))
+            rows, _ = pending.popleft().result()
+            if not rows:
+                continue
+            yield rows
+            fetched += len(rows)
+            _log_progress(fetched, total)
+
+
+def _arrow_type(type_name: str) -> pa.DataType:
+    """Resolve a type name from ``config.TABLE_SCHEMAS`` to an Arrow type."""
+    if type_name == "dictionary":
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.type_for_alias(type_name)
+
+
+def arrow_schema(table_name: str) -> pa.Schema:
+    """Declared Arrow schema for ``table_name`` from ``config.TABLE_SCHEMAS``."""
+    return pa.schema([
+        (col, _arrow_type(type_name))
+        for col, type_name in TABLE_SCHEMAS[table_name].items()
+    ])
+
+
+def _rows_to_table(rows: list[dict[str, Any]], schema: pa.Schema) -> pa.Table:
+    """
+    Convert one page of JSON rows to an Arrow table with ``schema``.
+
+    Types are first inferred from the page and then cast column by column,
+    so JSON integers land in float columns, ISO date strings become
+    ``date32``, codes served as JSON numbers become dictionary strings
+    and all-null columns still get their declared type.  Casts are safe:
+    an out-of-range value raises instead of wrapping.
+    """
+    inferred = pa.Table.from_pylist(rows)
+    n = inferred.num_rows
+    arrays = [
+        _cast(inferred.column(field.name), field.type)
+        if field.name in inferred.column_names
+        else pa.nulls(n, field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _cast(column: pa.ChunkedArray, type_: pa.DataType) -> pa.ChunkedArray:
+    """Cast one inferred column; numbers bound for a dictionary go via text."""
+    if (pa.types.is_dictionary(type_) and not pa.types.is_null(column.type)
+            and not pa.types.is_string(column.type)):
+        # e.g. ibge_code served as a JSON number; Arrow has no int -> dictionary cast
+        column = column.cast(pa.string())
+    return column.cast(type_)
+
+
+def row_filters(
+    table_name: str,
+    full_history: bool = False,
+    extra: list[tuple[str, str]] | None = None,
+) -> list[tuple[str, str]]:
+    """
+    PostgREST filters for ``table_name``: the predicates declared in
+    ``config.TABLE_FILTERS`` (unless ``full_history``) plus ``extra``.
+    """
+    base = [] if full_history else list(TABLE_FILTERS.get(table_name, []))
+    return base + list(extra or [])
+
+
+def _resolve_pagination(table_name: str, pagination: str | None,
+                        workers: int) -> str:
+    """Paging mode actually used (concurrent fetching needs offsets)."""
+    if workers > 1:
+        if (pagination or TABLE_PAGINATION.get(table_name, "offset")) == "keyset":
+            logger.warning("  %s: %d workers need offset paging; keyset paging "
+                           "is not used", table_name, workers)
+        return "offset"
+    if pagination is None:
+        return TABLE_PAGINATION.get(table_name, "offset")
+    return pagination
+
+
+def _table_pages(
+    table_key: str,
+    workers: int = 1,
+    pagination: str | None = None,
+    filters: list[tuple[str, str]] | None = None,
+    full_history: bool = False,
+    source: str | None = None,
+    start: dict[str, Any] | None = None,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> Iterator[pa.Table]:
+    """
+    Yield the pages of ``table_key`` in order as Arrow tables.
+
+    ``source`` reads another relation (e.g. ``HEALTH_DAILY_VIEW``) with its
+    own columns, schema and filters; by default ``TABLES[table_key]``.
+    ``start`` resumes a previous walk: ``{"offset": n}`` for offset paging
+    or ``{"last_key": k}`` for keyset paging.  ``wire_format="csv"``
+    requests ``text/csv`` pages that are parsed directly into ``schema``.
+    """
+    table_name = source or TABLES[table_key]
+    filters = row_filters(table_name, full_history, filters)
+    columns = TABLE_COLUMNS[table_name]
+    schema = arrow_schema(table_name)
+    pagination = _resolve_pagination(table_name, pagination, workers)
+    if wire_format not in WIRE_FORMATS:
+        raise ValueError(f"Unknown wire format '{wire_format}'")
+    csv_schema = schema if wire_format == "csv" else None
+    start = start or {}
+    logger.info("Extracting table '%s' (%s, %s paging, %s, workers=%d) ...",
+                table_key, table_name, pagination, wire_format, workers)
+    if filters:
+        logger.info("  Row filters: %s",
+                    "&".join(f"{col}={expr}" for col, expr in filters))
+
+    if start:
+        logger.info("  Resuming from %s", start)
+
+    if workers > 1:
+        pages = _iter_pages_concurrent(table_name, columns, workers, filters,
+                                       start_offset=start.get("offset", 0),
+                                       schema=csv_schema)
+    elif pagination == "keyset":
+        pages = _iter_pages_keyset(table_name, columns, filters,
+                                   start_key=start.get("last_key"),
+                                   schema=csv_schema)
+    elif pagination == "offset":
+        pages = _iter_pages_sequential(table_name, columns, filters,
+                                       start_offset=start.get("offset", 0),
+                                       schema=csv_schema)
+    else:
+        raise ValueError(f"Unknown pagination mode '{pagination}'")
+
+    for rows in pages:
+        if isinstance(rows, pa.Table):
+            # CSV pages are already typed; keyset may have added ``id``
+            yield rows.select(schema.names)
+        else:
+            yield _rows_to_table(rows, schema)
+
+
+def _log_throughput(table_key: str, n_rows: int, n_cols: int, elapsed: float) -> None:
     logger.info(
-        "Table '%s': %d rows x %d columns extracted.",
-        table_key, len(df), len(df.columns),
+        "Table '%s': %d rows x %d columns extracted in %.1f s (%.0f rows/s).",
+        table_key, n_rows, n_cols, elapsed,
+        n_rows / elapsed if elapsed > 0 else 0.0,
     )
+
+
+def extract_table(
+    table_key: str,
+    workers: int = 1,
+    pagination: str | None = None,
+    filters: list[tuple[str, str]] | None = None,
+    full_history: bool = False,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> pd.DataFrame:
+    """
+    Extract a full table from Supabase with automatic pagination.
+
+    Parameters
+    ----------
+    table_key : str
+        Friendly key in ``config.TABLES`` (e.g. ``"weather"``).
+    workers : int
+        Number of concurrent page requests.  ``1`` keeps the original
+        sequential loop; larger values plan every offset from the first
+        page's ``Content-Range`` total and fetch through a thread pool.
+        Pages are reassembled in offset order, so the result is identical.
+        Concurrent fetching needs planned offsets and therefore always
+        uses offset pagination.
+    pagination : {"keyset", "offset"} or None
+        Paging strategy; ``None`` uses ``config.TABLE_PAGINATION``.
+    filters : list of (column, "op.value") or None
+        Extra PostgREST row filters applied to every page, on top of the
+        table's predicates in ``config.TABLE_FILTERS``.
+    full_history : bool
+        Skip the ``config.TABLE_FILTERS`` predicates and download every
+        row (e.g. weather back to 2015, all CID categories).
+    wire_format : {"json", "csv"}
+        Response format requested from PostgREST.  ``"csv"`` sends
+        ``Accept: text/csv`` and parses pages with ``pyarrow.csv`` into
+        the declared schema, which costs far less client CPU than
+        decoding JSON into dicts for wide tables.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    schema = arrow_schema(TABLES[table_key])
+    t0 = time.perf_counter()
+    tables = list(_table_pages(table_key, workers, pagination, filters,
+                               full_history, wire_format=wire_format))
+    table = pa.concat_tables(tables) if tables else schema.empty_table()
+    elapsed = time.perf_counter() - t0
+
+    df = table.to_pandas()
+    _log_throughput(table_key, len(df), len(df.columns), elapsed)
     return df
 
 
+def _write_chunks(stage: Path, out_path: Path, schema: pa.Schema,
+                  n_chunks: int) -> None:
+    """Concatenate the committed chunks into ``out_path`` (atomic rename)."""
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    buffer: list[pa.Table] = []
+    buffered = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for i in range(1, n_chunks + 1):
+                chunk = pq.read_table(stage / f"chunk-{i:06d}.parquet")
+                buffer.append(chunk)
+                buffered += chunk.num_rows
+                if buffered >= ROW_GROUP_ROWS:
+                    writer.write_table(pa.concat_tables(buffer))
+                    buffer, buffered = [], 0
+            if buffer:
+                writer.write_table(pa.concat_tables(buffer))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, out_path)
+
+
+def extract_table_to_parquet(
+    table_key: str,
+    out_path: Path,
+    workers: int = 1,
+    pagination: str | None = None,
+    filters: list[tuple[str, str]] | None = None,
+    full_history: bool = False,
+    keep_empty: bool = True,
+    source: str | None = None,
+    resume: bool = True,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> int:
+    """
+    Stream a table from Supabase to a Parquet file, with checkpoints.
+
+    Pages are cast to the declared schema as they arrive and committed to
+    a staging directory (``raw_store.staging_dir``) every
+    ``CHECKPOINT_ROWS`` rows: the chunk file is written first, then
+    ``checkpoint.json`` is replaced atomically with the new row count and
+    paging position (last ``id`` for keyset paging, row offset otherwise).
+    If the run dies, rerunning the same extraction picks up after the
+    last committed chunk instead of starting over.  When every page is
+    in, the chunks are combined into ``out_path`` in ``ROW_GROUP_ROWS``
+    row groups under a temporary name, renamed into place, and the
+    staging directory is removed.
+
+    Arguments are as for ``extract_table``; with ``keep_empty=False`` no
+    file is left behind when no rows match.  ``source`` is passed on to
+    ``_table_pages``.  ``resume=False`` discards any existing checkpoint.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    table_name = source or TABLES[table_key]
+    schema = arrow_schema(table_name)
+    mode = _resolve_pagination(table_name, pagination, workers)
+    fingerprint = {
+        "source": table_name,
+        "columns": TABLE_COLUMNS[table_name],
+        "schema": schema.to_string(),
+        "pagination": mode,
+        "filters": [list(f) for f in row_filters(table_name, full_history, filters)],
+    }
+    stage = staging_dir(table_name, fingerprint)
+    # Checkpoints of a different request (other filters, schema, ...) can
+    # never be resumed by this one.
+    clear_staging(table_name, keep=stage)
+    checkpoint = load_checkpoint(stage) if resume else None
+    if checkpoint is None:
+        shutil.rmtree(stage, ignore_errors=True)
+        stage.mkdir(parents=True)
+        checkpoint = {"fingerprint": fingerprint, "chunks": 0, "rows": 0,
+                      "position": {}, "done": False}
+        save_checkpoint(stage, checkpoint)
+    else:
+        logger.info("Found checkpoint for '%s': %d rows in %d chunks.",
+                    table_name, checkpoint["rows"], checkpoint["chunks"])
+
+    def commit(buffer: list[pa.Table]) -> None:
+        chunk = pa.concat_tables(buffer)
+        n = checkpoint["chunks"] + 1
+        chunk_path = stage / f"chunk-{n:06d}.parquet"
+        tmp = chunk_path.with_name(chunk_path.name + ".tmp")
+        pq.write_table(chunk, tmp)
+        os.replace(tmp, chunk_path)
+        checkpoint["chunks"] = n
+        checkpoint["rows"] += chunk.num_rows
+        if mode == "keyset":
+            checkpoint["position"] = {"last_key": chunk.column("id")[-1].as_py()}
+        else:
+            checkpoint["position"] = {"offset": checkpoint["rows"]}
+        save_checkpoint(stage, checkpoint)
+
+    t0 = time.perf_counter()
+    resumed_rows = checkpoint["rows"]
+    if not checkpoint["done"]:
+        buffer: list[pa.Table] = []
+        buffered = 0
+        try:
+            for page in _table_pages(table_key, workers, pagination, filters,
+                                     full_history, source,
+                                     start=checkpoint["position"],
+                                     wire_format=wire_format):
+                buffer.append(page)
+                buffered += page.num_rows
+                if buffered >= CHECKPOINT_ROWS:
+                    commit(buffer)
+                    buffer, buffered = [], 0
+            if buffer:
+                commit(buffer)
+        except BaseException:
+            logger.error("Extraction of '%s' interrupted after %d committed "
+                         "rows; rerun to resume from %s.", table_name,
+                         checkpoint["rows"], stage)
+            raise
+        checkpoint["done"] = True
+        save_checkpoint(stage, checkpoint)
+    n_rows = checkpoint["rows"]
+    elapsed = time.perf_counter() - t0
+    _log_throughput(table_key, n_rows - resumed_rows, len(schema), elapsed)
+
+    if n_rows == 0 and not keep_empty:
+        shutil.rmtree(stage)
+        return 0
+    _write_chunks(stage, out_path, schema, checkpoint["chunks"])
+    shutil.rmtree(stage)
+    size_mb = out_path.stat().st_size / 1024 / 1024
+    logger.info("Saved %s (%.2f MB)", out_path, size_mb)
+    return n_rows
+
+
+# ---------------------------------------------------------------------------
+# Pre-aggregated health extraction
+# ---------------------------------------------------------------------------
+HEALTH_KEYS = ["city", "ibge_code", "date"]
+COMBINE_EVERY = 50        # pages of partial sums kept before re-aggregating
+
+
+def _frame_to_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Cast a DataFrame to ``schema`` column by column (checked casts)."""
+    arrays = [
+        pa.array(df[field.name], from_pandas=True).cast(field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _aggregate_health_locally(
+    out_path: Path,
+    workers: int = 1,
+    pagination: str | None = None,
+    filters: list[tuple[str, str]] | None = None,
+    full_history: bool = False,
+    keep_empty: bool = True,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> int:
+    """
+    Stream respiratory health rows and sum them per (city, ibge_code, date).
+
+    Fallback for when ``HEALTH_DAILY_VIEW`` is not deployed.  Each page is
+    reduced to partial sums on arrival and partials are re-combined every
+    ``COMBINE_EVERY`` pages, so memory is bounded by the number of
+    city-days rather than by the number of subcategory rows.  The output
+    has the same columns and ``id`` convention as the server-side view.
+    """
+    filters = list(filters or [])
+    if full_history:
+        # The aggregate is respiratory-only even without the window filter
+        filters.append(RESPIRATORY_FILTER)
+
+    t0 = time.perf_counter()
+    n_source = 0
+    parts: list[pd.DataFrame] = []
+    for page in _table_pages("health", workers, pagination, filters,
+                             full_history, wire_format=wire_format):
+        n_source += page.num_rows
+        df = page.select(HEALTH_KEYS + HEALTH_AGG_COLUMNS).to_pandas(
+            date_as_object=False
+        )
+        parts.append(df.groupby(HEALTH_KEYS, observed=True)[HEALTH_AGG_COLUMNS].sum())
+        if len(parts) >= COMBINE_EVERY:
+            parts = [pd.concat(parts).groupby(level=HEALTH_KEYS).sum()]
+
+    schema = arrow_schema(HEALTH_DAILY_VIEW)
+    if parts:
+        daily = (
+            pd.concat(parts).groupby(level=HEALTH_KEYS).sum()
+            .reset_index()
+            .sort_values(["ibge_code", "date"], ignore_index=True)
+        )
+        daily["city"] = daily["city"].astype(str)
+        daily["ibge_code"] = daily["ibge_code"].astype(str)
+        daily["id"] = daily["ibge_code"] + ":" + daily["date"].dt.strftime("%Y-%m-%d")
+        daily["cid_category"] = "respiratory"
+        table = _frame_to_table(daily, schema)
+    else:
+        table = schema.empty_table()
+    elapsed = time.perf_counter() - t0
+    logger.info("Aggregated %d health rows to %d city-days locally in %.1f s.",
+                n_source, table.num_rows, elapsed)
+
+    if table.num_rows == 0 and not keep_empty:
+        return 0
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, out_path)
+    logger.info("Saved %s (%.2f MB)", out_path, out_path.stat().st_size / 1024 / 1024)
+    return table.num_rows
+
+
+def extract_health_daily(
+    out_path: Path,
+    workers: int = 1,
+    pagination: str | None = None,
+    filters: list[tuple[str, str]] | None = None,
+    full_history: bool = False,
+    keep_empty: bool = True,
+    resume: bool = True,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> int:
+    """
+    Extract respiratory health already collapsed to one row per city-day.
+
+    Reads ``config.HEALTH_DAILY_VIEW`` so the server does the aggregation
+    ``process.merge_daily`` would otherwise do after downloading every
+    CID subcategory row.  If the view does not exist (HTTP 404) the
+    subcategory rows are streamed and summed locally instead.  Either way
+    the file has the health columns ``process.py`` expects, with
+    ``cid_category == "respiratory"``.  Only the view read is checkpointed
+    (``resume``); the local fallback keeps its partial sums in memory.
+
+    Returns
+    -------
+    int
+        Number of city-day rows written.
+    """
+    try:
+        return extract_table_to_parquet(
+            "health", out_path, workers=workers, pagination=pagination,
+            filters=filters, full_history=full_history, keep_empty=keep_empty,
+            source=HEALTH_DAILY_VIEW, resume=resume, wire_format=wire_format,
+        )
+    except PostgrestClientError as exc:
+        if exc.status != 404:
+            raise
+        logger.warning("View '%s' is not available (%s); aggregating "
+                       "health_hospitalizations locally.", HEALTH_DAILY_VIEW, exc)
+    return _aggregate_health_locally(out_path, workers, pagination, filters,
+                                     full_history, keep_empty, wire_format)
+
+
+# ---------------------------------------------------------------------------
+# Incremental extraction (high-water marks)
+# ---------------------------------------------------------------------------
+def compute_watermark(df: pd.DataFrame, table_name: str) -> dict[str, Any] | None:
+    """
+    Return the high-water mark of ``df`` for ``config.TABLE_WATERMARKS``.
+
+    Multi-column marks (fleet's ``(year, month)``) are compared
+    lexicographically, so the mark is the last row in sorted order.
+    Dates and timestamps are stored as ISO strings (a bare date when the
+    time is midnight), numbers as plain ints/floats.
+    """
+    cols = TABLE_WATERMARKS[table_name]
+    if df.empty or not set(cols).issubset(df.columns):
+        return None
+    valid = df.dropna(subset=cols)
+    if valid.empty:
+        return None
+    last = valid.sort_values(cols).iloc[-1]
+    mark: dict[str, Any] = {}
+    for col in cols:
+        value = last[col]
+        if isinstance(value, dt.date):      # date, datetime, pd.Timestamp
+            ts = pd.Timestamp(value)
+            bare = ts.tz is None and ts == ts.normalize()
+            mark[col] = ts.date().isoformat() if bare else ts.isoformat()
+        elif hasattr(value, "item"):
+            mark[col] = value.item()
+        else:
+            mark[col] = str(value)
+    return mark
+
+
+def watermark_filters(table_name: str, mark: dict[str, Any]) -> list[tuple[str, str]]:
+    """
+    Translate a high-water mark into PostgREST filters for newer rows.
+
+    ``{"date": "2025-10-16"}`` becomes ``date=gt.2025-10-16``;
+    ``{"year": 2025, "month": 6}`` becomes
+    ``or=(year.gt.2025,and(year.eq.2025,month.gt.6))``.
+
+    The filter is strict: rows added or revised later for dates at or
+    before the mark are never fetched again.  SIH/SUS admissions keep
+    arriving and being revised for months after the admission date, so
+    the health tables need a periodic full run to pick those up.
+    """
+    cols = TABLE_WATERMARKS[table_name]
+    if len(cols) == 1:
+        return [(cols[0], f"gt.{mark[cols[0]]}")]
+    # Lexicographic "greater than" over the mark columns
+    terms = []
+    for i, col in enumerate(cols):
+        eqs = [f"{c}.eq.{mark[c]}" for c in cols[:i]]
+        gt = f"{col}.gt.{mark[col]}"
+        terms.append(f"and({','.join(eqs + [gt])})" if eqs else gt)
+    return [("or", f"({','.join(terms)})")]
+
+
+def _update_manifest(
+    manifest: dict[str, Any],
+    table_name: str,
+    path: Path | None,
+    n_rows: int,
+    mode: str,
+    filters: list[tuple[str, str]],
+    source: str,
+) -> None:
+    """
+    Record the new high-water mark and row counts for ``table_name``.
+
+    The mark is computed from the file just written at ``path``, reading
+    only the watermark columns.  The source relation and row filters in
+    force are stored too, so an incremental run never extends a base
+    extracted from a different relation or under different predicates.
+    """
+    entry = manifest.setdefault(table_name, {"rows": 0})
+    entry["source"] = source
+    entry["filters"] = [list(f) for f in filters]
+    if path is not None and n_rows:
+        marks = pd.read_parquet(path, columns=TABLE_WATERMARKS[table_name])
+        mark = compute_watermark(marks, table_name)
+        if mark is not None:
+            entry["watermark"] = mark
+    entry["rows"] = (entry["rows"] if mode == "incremental" else 0) + n_rows
+    entry["last_run"] = {
+        "mode": mode,
+        "rows": n_rows,
+        "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
 def save_parquet(df: pd.DataFrame, table_key: str) -> Path:
     """Save a DataFrame as Parquet in ``data/raw/``."""
     table_name = TABLES[table_key]
-    out_path = RAW_DIR / f"{table_name}.parquet"
+    out_path = raw_path(table_name)
     df.to_parquet(out_path, index=False, engine="pyarrow")
     size_mb = out_path.stat().st_size / 1024 / 1024
     logger.info("Saved %s (%.2f MB)", out_path, size_mb)
@@ -194,7 +961,16 @@ def save_parquet(df: pd.DataFrame, table_key: str) -> Path:
 # ---------------------------------------------------------------------------
 # Main entry point
 # ---------------------------------------------------------------------------
-def main(table_keys: list[str] | None = None) -> None:
+def main(
+    table_keys: list[str] | None = None,
+    workers: int = DEFAULT_WORKERS,
+    pagination: str | None = None,
+    incremental: bool = False,
+    full_history: bool = False,
+    health_detail: bool = False,
+    resume: bool = True,
+    wire_format: str = DEFAULT_WIRE_FORMAT,
+) -> None:
     """
     Extract tables from Supabase and write Parquet files.
 
@@ -203,17 +979,77 @@ def main(table_keys: list[str] | None = None) -> None:
     table_keys : list[str] or None
         Subset of keys from ``config.TABLES`` to extract.  If ``None``,
         extract all five tables.
+    workers : int
+        Concurrent page requests per table (see ``extract_table``).
+    pagination : {"keyset", "offset"} or None
+        Override ``config.TABLE_PAGINATION`` for every table.
+    incremental : bool
+        Request only rows past each table's high-water mark in the
+        manifest and append them as a new fragment.  Tables without a
+        recorded mark (or without a base file) are extracted in full.
+    full_history : bool
+        Disable the row predicates in ``config.TABLE_FILTERS``.
+    health_detail : bool
+        Download every CID-subcategory row of ``health_hospitalizations``
+        instead of the respiratory city-day aggregate (``extract_health_daily``).
+    resume : bool
+        Continue interrupted extractions from their on-disk checkpoints
+        (see ``extract_table_to_parquet``); ``False`` starts every table
+        from scratch.
+    wire_format : {"json", "csv"}
+        Response format requested from PostgREST (see ``extract_table``).
     """
     if table_keys is None:
         table_keys = list(TABLES.keys())
+    manifest = load_manifest()
 
     for key in table_keys:
         if key not in TABLES:
             logger.error("Unknown table key '%s'. Valid keys: %s", key, list(TABLES.keys()))
             continue
         t0 = time.time()
-        df = extract_table(key)
-        save_parquet(df, key)
+        table_name = TABLES[key]
+        aggregate = key == "health" and not health_detail
+        source = HEALTH_DAILY_VIEW if aggregate else table_name
+        extract_fn = extract_health_daily if aggregate else partial(
+            extract_table_to_parquet, key)
+
+        entry = manifest.get(table_name, {})
+        mark = entry.get("watermark")
+        filters = row_filters(source, full_history)
+        same_filters = (entry.get("source", table_name) == source
+                        and entry.get("filters") == [list(f) for f in filters])
+        if incremental and mark and not same_filters:
+            logger.info("Source or row filters for '%s' changed since the "
+                        "last run; extracting in full.", key)
+
+        if incremental and mark and same_filters and raw_path(table_name).exists():
+            logger.info("Incremental extraction of '%s' past %s", key, mark)
+            out_path = new_fragment_path(table_name)
+            n_rows = extract_fn(
+                out_path, workers=workers, pagination=pagination,
+                filters=watermark_filters(table_name, mark),
+                full_history=full_history, keep_empty=False, resume=resume,
+                wire_format=wire_format,
+            )
+            if n_rows == 0:
+                logger.info("Table '%s' is up to date.", key)
+            _update_manifest(manifest, table_name, out_path, n_rows,
+                             "incremental", filters, source)
+        else:
+            out_path = raw_path(table_name)
+            n_rows = extract_fn(
+                out_path, workers=workers, pagination=pagination,
+                full_history=full_history, resume=resume,
+                wire_format=wire_format,
+            )
+            removed = clear_fragments(table_name)
+            if removed:
+                logger.info("Removed %d stale fragments for '%s'", removed, key)
+            _update_manifest(manifest, table_name, out_path, n_rows,
+                             "full", filters, source)
+        save_manifest(manifest)
+
         elapsed = time.time() - t0
         logger.info("Table '%s' done in %.1f s.\n", key, elapsed)
 
@@ -228,5 +1064,54 @@ if __name__ == "__main__":
         default=None,
         help=f"Table keys to extract (default: all). Choices: {list(TABLES.keys())}",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Concurrent page requests per table (default: %(default)s = sequential); "
+             "more than one implies offset paging",
+    )
+    parser.add_argument(
+        "--pagination",
+        choices=["keyset", "offset"],
+        default=None,
+        help="Paging strategy (default: per-table config.TABLE_PAGINATION)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Fetch only rows past each table's recorded high-water mark "
+             "(late or revised rows at or before the mark are missed; "
+             "rerun in full periodically, e.g. for health)",
+    )
+    parser.add_argument(
+        "--full-history",
+        action="store_true",
+        help="Download every row, ignoring the analysis-window and "
+             "respiratory filters in config.TABLE_FILTERS",
+    )
+    parser.add_argument(
+        "--health-detail",
+        action="store_true",
+        help="Download per-CID-subcategory health rows instead of the "
+             "server-side respiratory city-day aggregate",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Discard checkpoints of interrupted runs and start over",
+    )
+    parser.add_argument(
+        "--wire-format",
+        choices=list(WIRE_FORMATS),
+        default=DEFAULT_WIRE_FORMAT,
+        help="Response format requested from PostgREST (default: %(default)s)",
+    )
     args = parser.parse_args()
-    main(args.tables if args.tables else None)
+    if args.pagination == "keyset" and args.workers > 1:
+        parser.error("--pagination keyset fetches one page at a time; "
+                     "use --workers 1 or --pagination offset")
+    main(args.tables if args.tables else None, workers=args.workers,
+         pagination=args.pagination, incremental=args.incremental,
+         full_history=args.full_history, health_detail=args.health_detail,
+         resume=not args.no_resume, wire_format=args.wire_format)
@@ -0,0 +1,365 @@
+"""
+Vectorized per-city time-series features for the analysis panel.
+
+The panel is sorted once by ``(city, date)``; each city is then a
+contiguous block of rows and every lag is an array offset masked at
+block boundaries.  Moving averages step through the rows of the longest
+city once, advancing every city, variable and window together.  Either
+way the cost does not grow with the number of cities beyond the array
+work (no per-group Python).
+
+``calendar_lag_features`` does the same on a dense per-city day axis, so
+gaps in the panel are respected instead of silently skipped.
+
+``FeatureRegistry`` maps derived columns to the inputs they need and the
+function that builds them, so a caller can ask for a list of columns and
+get exactly those plus whatever they depend on.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+def block_positions(keys: np.ndarray) -> np.ndarray:
+    """
+    Position of each row within its run of equal ``keys``.
+
+    ``keys`` must be grouped (e.g. sorted), so that each group is one
+    contiguous block; the first row of every block gets position 0.
+    """
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    return np.arange(n) - np.repeat(starts, lengths)
+
+
+def _shifted(values: np.ndarray, k: int, valid: np.ndarray) -> np.ndarray:
+    """``values`` shifted down ``k`` rows, NaN where ``valid`` is False."""
+    out = np.full_like(values, np.nan)
+    if k < len(values):
+        out[k:] = values[: len(values) - k]
+    out[~valid] = np.nan
+    return out
+
+
+def rolling_means(
+    values: np.ndarray, pos: np.ndarray, windows: Sequence[int]
+) -> np.ndarray:
+    """
+    Trailing means of ``values`` over each of ``windows`` rows, per block.
+
+    ``values`` is ``(n_vars, n_rows)`` float64 and ``pos`` the
+    ``block_positions`` of the rows.  Reproduces the arithmetic of pandas'
+    ``rolling(w, min_periods=1).mean()`` run on each block separately:
+    a Kahan-compensated running sum (separate compensation for added and
+    removed values), NaNs skipped, a window of identical values returning
+    that value, and a mean of values of one sign clipped at zero.  The
+    result is bit-identical; only the loop differs, one step per row of
+    the longest block with every block, variable and window advanced at
+    once.
+
+    Returns
+    -------
+    np.ndarray
+        ``(len(windows), n_vars, n_rows)`` float64 means.
+    """
+    n = values.shape[1]
+    out = np.full((len(windows), *values.shape), np.nan)
+    if n == 0:
+        return out
+    starts = np.flatnonzero(pos == 0)
+    lengths = np.diff(np.r_[starts, n])
+    w = np.asarray(windows, dtype=np.int64)[:, None, None]
+    shape = (len(windows), values.shape[0], len(starts))
+
+    total = np.zeros(shape)
+    comp_add = np.zeros(shape)
+    comp_remove = np.zeros(shape)
+    nobs = np.zeros(shape, dtype=np.int64)
+    negative = np.zeros(shape, dtype=np.int64)
+    same = np.zeros(shape, dtype=np.int64)
+    prev = np.full(shape, np.nan)
+    for t in range(int(lengths.max())):
+        live = lengths > t
+        rows = starts + np.minimum(t, lengths - 1)
+        new = np.where(live, values[:, rows], np.nan)[None]
+
+        # Value leaving each window: row t - w of the same block
+        back = np.minimum(np.maximum(t - w[:, :, 0], 0), lengths - 1)
+        old = values[:, starts + back].transpose(1, 0, 2)
+        old = np.where(live & (t >= w), old, np.nan)
+        ok = ~np.isnan(old)
+        y = -old - comp_remove
+        updated = total + y
+        comp_remove = np.where(ok, updated - total - y, comp_remove)
+        total = np.where(ok, updated, total)
+        nobs -= ok
+        negative -= ok & np.signbit(old)
+
+        ok = np.broadcast_to(~np.isnan(new), shape)
+        y = new - comp_add
+        updated = total + y
+        comp_add = np.where(ok, updated - total - y, comp_add)
+        total = np.where(ok, updated, total)
+        nobs += ok
+        negative += ok & np.signbit(new)
+        same = np.where(ok, np.where(new == prev, same + 1, 1), same)
+        prev = np.where(ok, new, prev)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / nobs
+        mean = np.where(same >= nobs, prev, mean)
+        mean = np.where((same < nobs) & (negative == 0) & (mean < 0), 0.0, mean)
+        mean = np.where((same < nobs) & (negative == nobs) & (mean > 0), 0.0, mean)
+        mean = np.where(nobs > 0, mean, np.nan)
+        out[:, :, rows[live]] = mean[:, :, live]
+    return out
+
+
+def lag_features(
+    df: pd.DataFrame,
+    variables: list[str],
+    max_lag: int | Sequence[int],
+    windows: list[int],
+    by: str = "city",
+) -> pd.DataFrame:
+    """
+    Lags 1..``max_lag`` and trailing moving averages of ``variables``.
+
+    ``max_lag`` may also be an explicit sequence of lags to build.
+
+    Equivalent to ``groupby(by)[var].shift(lag)`` and
+    ``groupby(by)[var].transform(lambda s: s.rolling(w, min_periods=1).mean())``
+    on a frame already sorted by ``(by, date)``, bit for bit: lags keep
+    the dtype, and moving averages are float64 means computed by
+    ``rolling_means`` with pandas' own summation.
+
+    Returns
+    -------
+    pd.DataFrame
+        New columns on ``df.index``, ordered ``{var}_lag{k}`` (lag-major)
+        then ``{var}_ma{w}`` (window-major), as the original panel laid
+        them out.
+    """
+    codes = pd.factorize(df[by], sort=False)[0]
+    pos = block_positions(codes)
+
+    lags = range(1, max_lag + 1) if isinstance(max_lag, int) else max_lag
+    columns: dict[str, np.ndarray] = {}
+    arrays = {var: df[var].to_numpy() for var in variables}
+    for lag in lags:
+        valid = pos >= lag
+        for var in variables:
+            values = arrays[var]
+            if not np.issubdtype(values.dtype, np.floating):
+                values = values.astype(np.float64)
+            columns[f"{var}_lag{lag}"] = _shifted(values, lag, valid)
+
+    if windows:
+        stacked = np.stack([np.asarray(arrays[var], dtype=np.float64)
+                            for var in variables])
+        means = rolling_means(stacked, pos, windows)
+        for i, window in enumerate(windows):
+            for j, var in enumerate(variables):
+                columns[f"{var}_ma{window}"] = means[i, j]
+
+    return pd.DataFrame(columns, index=df.index)
+
+
+def calendar_lag_features(
+    df: pd.DataFrame,
+    variables: list[str],
+    max_lag: int | Sequence[int],
+    windows: list[int],
+    by: str = "city",
+    date_col: str = "date",
+) -> pd.DataFrame:
+    """
+    Calendar-day lags and moving averages of ``variables``.
+
+    Each city is laid out on a dense integer day axis from its first to
+    its last observed date; observed rows are scattered onto it, missing
+    days stay NaN, and ``lag_features`` runs on that dense frame before
+    the results are gathered back to the observed rows.  ``{var}_lag{k}``
+    is therefore the value exactly ``k`` days earlier (NaN if that day is
+    absent) and ``{var}_ma{w}`` averages the observed values of the last
+    ``w`` calendar days.  Without gaps the output equals ``lag_features``.
+
+    ``df`` must be sorted by ``(by, date_col)`` with unique pairs.  The
+    dense axis costs (cities x span) rows, e.g. ~1.4k days x 5.5k
+    municipalities, and everything stays O(rows) array work.
+    """
+    codes = pd.factorize(df[by], sort=False)[0]
+    day = (
+        df[date_col].to_numpy("datetime64[D]").astype(np.int64)
+        if len(df) else np.zeros(0, dtype=np.int64)
+    )
+    pos = block_positions(codes)
+    if len(df) and np.any(np.diff(day)[pos[1:] > 0] <= 0):
+        raise ValueError(f"{date_col} must be strictly increasing within each {by}")
+
+    # Dense layout: city c occupies [base[c], base[c] + span[c])
+    n_blocks = codes.max() + 1 if len(df) else 0
+    first = np.full(n_blocks, np.iinfo(np.int64).max)
+    last = np.full(n_blocks, np.iinfo(np.int64).min)
+    np.minimum.at(first, codes, day)
+    np.maximum.at(last, codes, day)
+    span = last - first + 1
+    base = np.r_[0, np.cumsum(span)[:-1]] if n_blocks else np.zeros(0, np.int64)
+    dense_idx = base[codes] + (day - first[codes])
+
+    n_dense = int(span.sum()) if n_blocks else 0
+    dense = {by: np.repeat(np.arange(n_blocks), span)}
+    for var in variables:
+        values = df[var].to_numpy()
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+        column = np.full(n_dense, np.nan, dtype=dtype)
+        column[dense_idx] = values
+        dense[var] = column
+
+    out = lag_features(pd.DataFrame(dense), variables, max_lag, windows, by=by)
+    return pd.DataFrame(
+        {col: out[col].to_numpy()[dense_idx] for col in out.columns},
+        index=df.index,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Feature registry
+# ---------------------------------------------------------------------------
+Builder = Callable[[pd.DataFrame, list[str]], Mapping[str, Any]]
+
+
+@dataclass(frozen=True)
+class Feature:
+    """
+    A group of derived columns built together.
+
+    ``build(df, columns)`` receives the frame (holding every column in
+    ``inputs``) and the subset of ``outputs`` actually requested, and
+    returns a mapping of column name to array-like for at least those.
+    """
+
+    outputs: tuple[str, ...]
+    inputs: tuple[str, ...]
+    build: Builder
+
+
+class FeatureRegistry:
+    """
+    Derived columns, their inputs and builders.
+
+    Features are registered in the order their columns should appear in
+    the output; an input may be a raw column or another feature's output.
+    """
+
+    def __init__(self) -> None:
+        self._features: list[Feature] = []
+        self._owner: dict[str, Feature] = {}
+
+    def register(
+        self, outputs: Iterable[str], inputs: Iterable[str] = ()
+    ) -> Callable[[Builder], Builder]:
+        """Decorator registering ``build`` as the builder of ``outputs``."""
+        def decorator(build: Builder) -> Builder:
+            feature = Feature(tuple(outputs), tuple(inputs), build)
+            for col in feature.outputs:
+                if col in self._owner:
+                    raise ValueError(f"Feature '{col}' is registered twice")
+                self._owner[col] = feature
+            self._features.append(feature)
+            return build
+        return decorator
+
+    def __contains__(self, column: str) -> bool:
+        return column in self._owner
+
+    @property
+    def columns(self) -> list[str]:
+        """Every column the registry can build, in registration order."""
+        return [col for feature in self._features for col in feature.outputs]
+
+    def resolve(
+        self, requested: Iterable[str], available: Iterable[str]
+    ) -> list[tuple[Feature, list[str]]]:
+        """
+        Features needed for ``requested`` and the columns each must build.
+
+        Walks the inputs transitively; columns already in ``available``
+        are not rebuilt.  The result is in dependency order.
+
+        Raises
+        ------
+        KeyError
+            If a column is neither available nor registered.
+        ValueError
+            If the features depend on each other in a cycle.
+        """
+        available = set(available)
+        needed: dict[int, set[str]] = {}
+        order: list[Feature] = []
+        visiting: set[int] = set()
+
+        def visit(col: str) -> None:
+            if col in available:
+                return
+            feature = self._owner.get(col)
+            if feature is None:
+                raise KeyError(f"Unknown feature '{col}': not a raw column "
+                               "and no builder is registered for it")
+            key = id(feature)
+            if key in needed:
+                if key in visiting:
+                    raise ValueError(f"Feature '{col}' depends on itself")
+                needed[key].add(col)
+                return
+            needed[key] = {col}
+            visiting.add(key)
+            for dep in feature.inputs:
+                visit(dep)
+            visiting.discard(key)
+            order.append(feature)
+
+        for col in requested:
+            visit(col)
+        return [
+            (feature, [c for c in feature.outputs if c in needed[id(feature)]])
+            for feature in order
+        ]
+
+    def build(self, df: pd.DataFrame, requested: Iterable[str]) -> pd.DataFrame:
+        """
+        ``df`` with the requested derived columns added.
+
+        Columns are assigned on ``df`` itself as they are built (later
+        builders read earlier outputs); intermediate columns built only as
+        inputs are dropped again, and the requested ones come after the
+        existing columns in registration order.
+        """
+        requested = list(dict.fromkeys(requested))
+        plan = self.resolve(requested, df.columns)
+        built: list[str] = []
+        for feature, columns in plan:
+            values = feature.build(df, columns)
+            for col in columns:
+                df[col] = values[col]
+            built.extend(columns)
+
+        keep = set(requested)
+        for col in built:
+            if col not in keep:
+                del df[col]
+        # Move the new columns into registration order one at a time;
+        # selecting a reordered frame would copy every column.
+        for col in self.columns:
+            if col in keep and col in built:
+                df[col] = df.pop(col)
+        return df
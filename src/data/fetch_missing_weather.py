@@ -1,40 +1,66 @@
 #!/usr/bin/env python3
 """
-Fetch missing weather data from Open-Meteo Archive API for 10 capitals
-that lack weather_history coverage in Clima360 for 2022-2025.
+Backfill gaps in weather_history from the Open-Meteo Archive API.
 
-Fetches the same 19 daily variables as the existing weather_history table
-and appends them to the raw parquet file.
+Scans the raw weather table against every capital in ``config.CAPITALS``
+and each day of the analysis window, and requests only the missing
+(city, date-range) intervals, so rerunning after a complete backfill
+fetches nothing.  Fetches the same 19 daily variables as the existing
+weather_history table and appends them to the raw store as a new
+fragment (only the new rows are written); ``--compact`` then folds
+fragments into the base file, keeping one row per (city, date).  Cities
+are fetched concurrently under a token-bucket rate limit; 429 responses
+honour ``Retry-After``, and ``--batch-size`` packs several coordinates
+into one request.  Responses are kept in the shared HTTP cache
+(``src/utils/http_cache.py``), so historical ranges are downloaded once;
+``HTTP_OFFLINE=1`` runs from the cache alone.
+
+Usage
+-----
+    python src/data/fetch_missing_weather.py
+    python src/data/fetch_missing_weather.py --batch-size 5 --rate 2
+    python src/data/fetch_missing_weather.py --compact
 """
 
+from __future__ import annotations
+
+import argparse
+import asyncio
 import sys
+import threading
 import time
-import uuid
 import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import Any
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.utils.config import (
+    ANALYSIS_END,
+    ANALYSIS_START,
+    CAPITAL_COORDS,
+    CAPITALS,
+    TABLE_KEYS,
+)
+from src.utils import http_cache
+from src.data.raw_store import (
+    append_fragment,
+    compact,
+    key_ids,
+    list_raw_files,
+    read_raw,
+)
 
 logging.basicConfig(format="%(asctime)s %(name)s %(levelname)s %(message)s", level=logging.INFO)
 logger = logging.getLogger("fetch_missing_weather")
 
-# Coordinates for the 10 missing capitals
-MISSING_CAPITALS = {
-    "Boa Vista":     {"lat": 2.8195,   "lon": -60.6714},
-    "Fortaleza":     {"lat": -3.7172,  "lon": -38.5433},
-    "João Pessoa":   {"lat": -7.1195,  "lon": -34.8450},
-    "Maceió":        {"lat": -9.6658,  "lon": -35.7353},
-    "Palmas":        {"lat": -10.1689, "lon": -48.3317},
-    "Porto Alegre":  {"lat": -30.0346, "lon": -51.2177},
-    "Recife":        {"lat": -8.0476,  "lon": -34.8770},
-    "São Luís":      {"lat": -2.5297,  "lon": -44.2825},
-    "Teresina":      {"lat": -5.0892,  "lon": -42.8019},
-    "Vitória":       {"lat": -20.3155, "lon": -40.3128},
-}
-
 # Open-Meteo variable mapping (API name -> our column name)
 DAILY_VARS = [
     "temperature_2m_mean",
@@ -68,85 +94,448 @@ RENAME_MAP = {
 }
 
 API_URL = "https://archive-api.open-meteo.com/v1/archive"
-START_DATE = "2022-01-01"
-END_DATE = "2025-12-31"
+START_DATE = ANALYSIS_START
+END_DATE = ANALYSIS_END
+ARCHIVE_LAG_DAYS = 5      # the archive trails real time by a few days
+BRIDGE_DAYS = 7           # merge gaps separated by up to this many present days
 
 
-def fetch_city(city: str, lat: float, lon: float, max_retries: int = 5) -> pd.DataFrame:
-    """Fetch daily weather for one city from Open-Meteo Archive API with retry."""
+# ---------------------------------------------------------------------------
+# Gap detection
+# ---------------------------------------------------------------------------
+def find_gaps(
+    existing: pd.DataFrame,
+    cities: list[str] | None = None,
+    start_date: str = START_DATE,
+    end_date: str = END_DATE,
+) -> list[tuple[str, str, str]]:
+    """
+    Missing (city, first day, last day) intervals in ``existing``.
+
+    The calendar runs from ``start_date`` to ``end_date`` (clipped to
+    ``ARCHIVE_LAG_DAYS`` before today).  For each city every run of
+    consecutive days without a row becomes one interval, which is the
+    smallest set of date ranges that covers exactly the missing days.
+    A city with no rows at all yields a single full-window interval.
+    """
+    if cities is None:
+        cities = list(CAPITALS)
+    latest = pd.Timestamp.today().normalize() - pd.Timedelta(days=ARCHIVE_LAG_DAYS)
+    calendar = pd.date_range(start_date, min(pd.Timestamp(end_date), latest), freq="D")
+    if calendar.empty:
+        return []
+
+    dates = pd.to_datetime(existing["date"]).dt.normalize()
+    present = dates.groupby(existing["city"].astype(str)).unique()
+
+    gaps: list[tuple[str, str, str]] = []
+    for city in cities:
+        missing = ~calendar.isin(present.get(city, []))
+        if not missing.any():
+            continue
+        # Run boundaries: +1 where a missing run starts, -1 after it ends
+        edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        gaps.extend(
+            (city, calendar[a].strftime("%Y-%m-%d"), calendar[b].strftime("%Y-%m-%d"))
+            for a, b in zip(starts, ends)
+        )
+    return gaps
+
+
+def coalesce_gaps(
+    gaps: list[tuple[str, str, str]],
+    bridge_days: int = BRIDGE_DAYS,
+) -> list[tuple[str, str, str]]:
+    """
+    Merge a city's gaps separated by at most ``bridge_days`` present days.
+
+    Scattered single missing days would otherwise cost one request each;
+    the few already-present days pulled in by a merged request are
+    dropped again before writing.
+    """
+    merged: list[tuple[str, str, str]] = []
+    for city, start, end in gaps:
+        if merged and merged[-1][0] == city and (
+            pd.Timestamp(start) - pd.Timestamp(merged[-1][2])
+        ).days - 1 <= bridge_days:
+            merged[-1] = (city, merged[-1][1], end)
+        else:
+            merged.append((city, start, end))
+    return merged
+
+
+def city_coords(existing: pd.DataFrame) -> dict[str, dict[str, float]]:
+    """
+    Coordinates per city: stored lat/lon first, then ``CAPITAL_COORDS``.
+
+    Reusing the stored coordinates keeps backfilled rows on the same
+    ERA5 grid cell as the rows already in the table.
+    """
+    coords = {city: dict(c) for city, c in CAPITAL_COORDS.items()}
+    if {"lat", "lon"}.issubset(existing.columns):
+        stored = (
+            existing.dropna(subset=["lat", "lon"])
+            .groupby(existing["city"].astype(str), observed=True)[["lat", "lon"]]
+            .first()
+        )
+        for city, row in stored.iterrows():
+            coords[city] = {"lat": float(row["lat"]), "lon": float(row["lon"])}
+    return coords
+
+
+# ---------------------------------------------------------------------------
+# Open-Meteo client
+# ---------------------------------------------------------------------------
+# Request pacing.  Open-Meteo's free tier allows 600 calls/minute; a
+# multi-location request counts once per location, so the bucket is
+# charged per coordinate rather than per HTTP request.
+RATE_PER_SECOND = 5.0     # token refill rate (locations per second)
+BURST = 10                # bucket capacity (locations)
+MAX_CONCURRENCY = 4       # HTTP requests in flight at once
+BATCH_SIZE = 1            # coordinates per request (comma-separated lists)
+MAX_RETRIES = 5
+RETRY_BACKOFF = 2.0       # exponential backoff base (seconds) without Retry-After
+REQUEST_TIMEOUT = 120
+
+_thread_local = threading.local()
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket shared by all requests of one run.
+
+    Tokens refill continuously at ``rate`` per second up to ``capacity``;
+    ``acquire(n)`` waits until ``n`` tokens are available.  ``pause``
+    blocks every caller until a deadline, which is how a ``Retry-After``
+    received by one request throttles all the others.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for ``seconds`` and drain the bucket."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self, n: float = 1.0) -> None:
+        n = min(n, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                await asyncio.sleep((n - self._tokens) / self.rate)
+
+
+def _get_session() -> requests.Session:
+    """``requests.Session`` bound to the calling worker thread."""
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+
+def _fetch_sync(params: dict[str, Any], ttl: float | None) -> requests.Response:
+    """Cached GET run on a worker thread with that thread's own session."""
+    return http_cache.get(API_URL, params, ttl=ttl, session=_get_session(),
+                          timeout=REQUEST_TIMEOUT)
+
+
+def _retry_after(resp: requests.Response) -> float | None:
+    """Seconds to wait from a ``Retry-After`` header (delta or HTTP date)."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _to_frame(data: dict[str, Any], city: str) -> pd.DataFrame:
+    """Turn one location of an Open-Meteo response into weather rows."""
+    df = pd.DataFrame(data["daily"])
+    df.rename(columns={"time": "date"}, inplace=True)
+    df.rename(columns=RENAME_MAP, inplace=True)
+
+    df["city"] = city
+    df["lat"] = data["latitude"]
+    df["lon"] = data["longitude"]
+    df["id"] = key_ids(df, TABLE_KEYS["weather_history"])
+
+    if df.empty:
+        logger.warning("  %s -> no rows", city)
+    else:
+        logger.info("  %s -> %d rows (%s to %s)", city, len(df),
+                    df["date"].iloc[0], df["date"].iloc[-1])
+    return df
+
+
+async def _fetch_batch(
+    batch: list[tuple[str, dict[str, float]]],
+    bucket: TokenBucket,
+    semaphore: asyncio.Semaphore,
+    start_date: str,
+    end_date: str,
+) -> list[pd.DataFrame]:
+    """
+    Fetch one request's worth of cities (one or more coordinates).
+
+    With several coordinates Open-Meteo returns a list of per-location
+    objects in request order.  Responses go through ``http_cache``
+    (archive ranges older than a week never expire), and cache hits skip
+    the rate limiter.  429 responses wait for ``Retry-After`` (pausing
+    the whole bucket); 5xx and network errors back off exponentially.
+    """
+    names = [city for city, _ in batch]
     params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": START_DATE,
-        "end_date": END_DATE,
+        "latitude": ",".join(str(c["lat"]) for _, c in batch),
+        "longitude": ",".join(str(c["lon"]) for _, c in batch),
+        "start_date": start_date,
+        "end_date": end_date,
         "daily": ",".join(DAILY_VARS),
         "timezone": "America/Sao_Paulo",
     }
+    ttl = http_cache.archive_ttl(end_date)
+
+    cached = http_cache.lookup(API_URL, params)
+    if cached is not None:
+        logger.info("Cached %s (%s to %s)", ", ".join(names), start_date, end_date)
+        return _to_frames(cached.json(), names)
 
-    for attempt in range(1, max_retries + 1):
-        logger.info("Fetching %s (%.4f, %.4f) [attempt %d]...", city, lat, lon, attempt)
+    for attempt in range(1, MAX_RETRIES + 1):
+        await bucket.acquire(len(batch))
+        logger.info("Fetching %s [attempt %d]...", ", ".join(names), attempt)
         try:
-            resp = requests.get(API_URL, params=params, timeout=120)
-            if resp.status_code == 429 or resp.status_code >= 500:
-                wait = 10 * attempt
-                logger.warning("  Status %d, waiting %ds...", resp.status_code, wait)
-                time.sleep(wait)
+            async with semaphore:
+                resp = await asyncio.to_thread(_fetch_sync, params, ttl)
+            if resp.status_code == 429:
+                wait = _retry_after(resp) or RETRY_BACKOFF ** attempt
+                logger.warning("  429 for %s, retrying in %.1fs", names, wait)
+                bucket.pause(wait)
+                continue
+            if resp.status_code >= 500:
+                wait = RETRY_BACKOFF ** attempt
+                logger.warning("  Status %d for %s, retrying in %.1fs",
+                               resp.status_code, names, wait)
+                await asyncio.sleep(wait)
                 continue
             resp.raise_for_status()
             data = resp.json()
             break
-        except (requests.exceptions.JSONDecodeError, requests.exceptions.RequestException) as e:
-            wait = 10 * attempt
-            logger.warning("  Error: %s, waiting %ds...", e, wait)
-            time.sleep(wait)
-            if attempt == max_retries:
+        except (requests.exceptions.JSONDecodeError,
+                requests.exceptions.RequestException) as e:
+            if attempt == MAX_RETRIES:
                 raise
+            wait = RETRY_BACKOFF ** attempt
+            logger.warning("  Error for %s: %s, retrying in %.1fs", names, e, wait)
+            await asyncio.sleep(wait)
+    else:
+        raise RuntimeError(f"Failed to fetch {names} after {MAX_RETRIES} attempts")
 
-    daily = data["daily"]
-    df = pd.DataFrame(daily)
-    df.rename(columns={"time": "date"}, inplace=True)
-    df.rename(columns=RENAME_MAP, inplace=True)
+    return _to_frames(data, names)
 
-    df["city"] = city
-    df["lat"] = data["latitude"]
-    df["lon"] = data["longitude"]
-    df["id"] = [str(uuid.uuid4()) for _ in range(len(df))]
 
-    logger.info("  -> %d rows (%s to %s)", len(df), df["date"].iloc[0], df["date"].iloc[-1])
-    return df
+def _to_frames(data: dict[str, Any] | list[dict[str, Any]],
+               names: list[str]) -> list[pd.DataFrame]:
+    """Split a (possibly multi-location) response into per-city frames."""
+    locations = data if isinstance(data, list) else [data]
+    return [_to_frame(loc, city) for loc, city in zip(locations, names)]
+
 
+async def fetch_intervals(
+    gaps: list[tuple[str, str, str]],
+    coords: dict[str, dict[str, float]],
+    rate: float = RATE_PER_SECOND,
+    burst: int = BURST,
+    max_concurrency: int = MAX_CONCURRENCY,
+    batch_size: int = BATCH_SIZE,
+) -> list[pd.DataFrame]:
+    """
+    Fetch daily weather for many (city, start, end) intervals concurrently.
 
-def main():
-    raw_path = Path(__file__).resolve().parents[2] / "data" / "raw" / "weather_history.parquet"
+    Parameters
+    ----------
+    gaps : list of (city, start_date, end_date)
+        Intervals to fetch, e.g. from ``find_gaps``.
+    coords : dict
+        City name -> ``{"lat": ..., "lon": ...}``.
+    rate, burst : float, int
+        Token-bucket refill rate (locations/s) and capacity.
+    max_concurrency : int
+        Maximum HTTP requests in flight.
+    batch_size : int
+        Coordinates per request.  Values above 1 use Open-Meteo's
+        comma-separated ``latitude``/``longitude`` lists; only intervals
+        with the same date range share a request.
 
-    # Load existing
-    existing = pd.read_parquet(raw_path)
+    Returns
+    -------
+    list[pd.DataFrame]
+        One frame per interval, grouped by date range.
+    """
+    bucket = TokenBucket(rate, burst)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    by_range: dict[tuple[str, str], list[tuple[str, dict[str, float]]]] = {}
+    for city, start, end in gaps:
+        by_range.setdefault((start, end), []).append((city, coords[city]))
+    requests_ = [
+        (items[i:i + batch_size], start, end)
+        for (start, end), items in by_range.items()
+        for i in range(0, len(items), batch_size)
+    ]
+    results = await asyncio.gather(*(
+        _fetch_batch(batch, bucket, semaphore, start, end)
+        for batch, start, end in requests_
+    ))
+    return [df for frames in results for df in frames]
+
+
+async def fetch_cities(
+    cities: dict[str, dict[str, float]],
+    start_date: str = START_DATE,
+    end_date: str = END_DATE,
+    **kwargs: Any,
+) -> list[pd.DataFrame]:
+    """Fetch the same date range for every city (see ``fetch_intervals``)."""
+    gaps = [(city, start_date, end_date) for city in cities]
+    return await fetch_intervals(gaps, cities, **kwargs)
+
+
+def fetch_city(city: str, lat: float, lon: float) -> pd.DataFrame:
+    """Fetch daily weather for one city from Open-Meteo Archive API with retry."""
+    return asyncio.run(fetch_cities({city: {"lat": lat, "lon": lon}}))[0]
+
+
+def _to_schema(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Cast fetched rows to the schema of the stored file, column by column."""
+    arrays = [
+        pa.array(df[field.name], from_pandas=True).cast(field.type)
+        if field.name in df.columns
+        else pa.nulls(len(df), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def main(
+    rate: float = RATE_PER_SECOND,
+    max_concurrency: int = MAX_CONCURRENCY,
+    batch_size: int = BATCH_SIZE,
+    start_date: str = START_DATE,
+    end_date: str = END_DATE,
+    compact_store: bool = False,
+) -> None:
+    table_name = "weather_history"
+
+    # Only keys and coordinates are needed to find and place the gaps
+    existing = read_raw(table_name, columns=["city", "date", "lat", "lon"])
     logger.info("Existing weather data: %d rows, %d cities", len(existing), existing["city"].nunique())
 
-    # Fetch missing
-    new_frames = []
-    for city, coords in MISSING_CAPITALS.items():
-        df = fetch_city(city, coords["lat"], coords["lon"])
-        new_frames.append(df)
-        time.sleep(5)  # rate limit courtesy
+    gaps = find_gaps(existing, start_date=start_date, end_date=end_date)
+    if not gaps:
+        logger.info("No gaps between %s and %s; nothing to fetch.",
+                    start_date, end_date)
+    else:
+        n_days = sum(
+            (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+            for _, start, end in gaps
+        )
+        logger.info("Found %d missing intervals (%d city-days) in %d cities",
+                    len(gaps), n_days, len({city for city, _, _ in gaps}))
+        _backfill(existing, gaps, table_name, rate, max_concurrency, batch_size)
 
-    new_data = pd.concat(new_frames, ignore_index=True)
+    if compact_store:
+        n_rows = compact(table_name)
+        logger.info("Compacted %s: %d rows", table_name, n_rows)
 
-    # Align columns to match existing
-    for col in existing.columns:
-        if col not in new_data.columns:
-            new_data[col] = None
-    new_data = new_data[existing.columns]
 
-    # Append and save
-    combined = pd.concat([existing, new_data], ignore_index=True)
-    combined.to_parquet(raw_path, index=False)
+def _backfill(
+    existing: pd.DataFrame,
+    gaps: list[tuple[str, str, str]],
+    table_name: str,
+    rate: float,
+    max_concurrency: int,
+    batch_size: int,
+) -> None:
+    """Fetch ``gaps`` and append the missing city-days as one fragment."""
+    coords = city_coords(existing)
+    unknown = sorted({city for city, _, _ in gaps if city not in coords})
+    if unknown:
+        logger.warning("No coordinates for %s; skipping them.", unknown)
+        gaps = [g for g in gaps if g[0] not in unknown]
+        if not gaps:
+            return
+
+    # Fetch missing
+    intervals = coalesce_gaps(gaps)
+    t0 = time.perf_counter()
+    new_frames = asyncio.run(fetch_intervals(
+        intervals, coords, rate=rate, max_concurrency=max_concurrency,
+        batch_size=batch_size,
+    ))
+    logger.info("Fetched %d intervals in %.1f s", len(new_frames),
+                time.perf_counter() - t0)
+
+    # Keep only the city-days that are actually missing (merged intervals
+    # may span a few days that already exist)
+    new_data = pd.concat(new_frames, ignore_index=True)
+    have = pd.MultiIndex.from_arrays([
+        existing["city"].astype(str), pd.to_datetime(existing["date"]).dt.normalize(),
+    ])
+    fetched = pd.MultiIndex.from_arrays([
+        new_data["city"], pd.to_datetime(new_data["date"]),
+    ])
+    new_data = new_data[~fetched.isin(have)].reset_index(drop=True)
+    if new_data.empty:
+        logger.info("Open-Meteo returned no rows for the missing days.")
+        return
 
-    logger.info("Combined weather data: %d rows, %d cities",
-                len(combined), combined["city"].nunique())
-    logger.info("New cities added: %s", sorted(new_data["city"].unique()))
-    logger.info("Saved to %s", raw_path)
+    # Cast to the stored schema so typed (date32, dictionary) and legacy
+    # files both stay concatenable, then write only the new rows
+    schema = pq.read_schema(list_raw_files(table_name)[0])
+    out_path = append_fragment(_to_schema(new_data, schema), table_name)
+    logger.info("Appended %d rows for %s to %s", len(new_data),
+                sorted(new_data["city"].unique()), out_path)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Backfill weather from Open-Meteo")
+    parser.add_argument("--rate", type=float, default=RATE_PER_SECOND,
+                        help="Locations requested per second (default: %(default)s)")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="HTTP requests in flight (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Coordinates per request (default: %(default)s)")
+    parser.add_argument("--start", default=START_DATE,
+                        help="First day of the calendar to fill (default: %(default)s)")
+    parser.add_argument("--end", default=END_DATE,
+                        help="Last day of the calendar to fill (default: %(default)s)")
+    parser.add_argument("--compact", action="store_true",
+                        help="Fold fragments into the base file, one row per (city, date)")
+    args = parser.parse_args()
+    main(rate=args.rate, max_concurrency=args.max_concurrency,
+         batch_size=args.batch_size, start_date=args.start, end_date=args.end,
+         compact_store=args.compact)
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+Build the weather and air-quality tables from local gridded reanalysis.
+
+The Clima360 tables (and ``fetch_missing_weather.py``) get daily series
+from one Open-Meteo request per city.  This script samples the same
+reanalyses from files on disk instead: ERA5 hourly single-level fields
+(``config.GRIDDED_DIRS["weather"]``) and CAMS global reanalysis surface
+fields (``config.GRIDDED_DIRS["air_quality"]``), as NetCDF (``*.nc``) or
+Zarr (``*.zarr``) files split by time and/or variable in any way.  Every
+point is extracted in one pass, so 27 capitals or 5.5k municipality
+centroids cost the same number of reads.
+
+- Files are opened lazily with the optional ``xarray`` package (no
+  dask): nothing is read until a block is requested, NetCDF-3 files are
+  memory-mapped and NetCDF-4/Zarr reads touch only the chunks of a block.
+- The positions of the points on each grid are computed once
+  (``GridIndex``): the nearest grid point, or the four surrounding points
+  and their bilinear weights.  Only the lat/lon window around the points
+  is read.
+- Time is read ``GRIDDED_BLOCK_DAYS`` local days at a time, sampled at
+  the points and reduced to daily values (``WEATHER_FIELDS``,
+  ``AIR_QUALITY_FIELDS``), so memory is bounded by one block of the
+  window around the points.
+
+Days are local days, ``GRIDDED_UTC_OFFSET_HOURS`` from UTC.  A day is
+only reduced when every time step of it is in the files (24 for hourly
+ERA5, 8 for 3-hourly CAMS); otherwise that field is left empty for the
+day, e.g. the last day of the window unless the files extend a few hours
+past it.
+The result replaces the table's raw file, in the stored schema; columns
+the reanalysis does not provide are left empty.
+
+Usage
+-----
+    python src/data/gridded.py                       # weather and air quality
+    python src/data/gridded.py weather --interpolation nearest
+    python src/data/gridded.py --points municipalities.csv   # city,lat,lon
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections.abc import Callable
+from contextlib import ExitStack
+from functools import reduce
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ---------------------------------------------------------------------------
+# Project imports
+# ---------------------------------------------------------------------------
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.utils.config import (
+    ANALYSIS_END,
+    ANALYSIS_START,
+    CAPITAL_COORDS,
+    GRIDDED_BLOCK_DAYS,
+    GRIDDED_DIRS,
+    GRIDDED_INTERPOLATION,
+    GRIDDED_UTC_OFFSET_HOURS,
+    TABLES,
+    LOG_FORMAT,
+    LOG_DATE_FORMAT,
+)
+from src.data.extract import arrow_schema
+from src.data.raw_store import clear_fragments, key_ids, load_manifest, raw_path, save_manifest
+
+# ---------------------------------------------------------------------------
+# Logging
+# ---------------------------------------------------------------------------
+logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
+logger = logging.getLogger("gridded")
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+SOURCE = "gridded"                    # manifest "source" of the tables
+INTERPOLATION_METHODS = ("nearest", "bilinear")
+GRID_SUFFIXES = (".nc", ".nc4", ".netcdf", ".zarr")
+TIME_NAMES = ("valid_time", "time")
+LAT_NAMES = ("latitude", "lat")
+LON_NAMES = ("longitude", "lon")
+
+# CAMS concentrations -> ug/m3.  Mass mixing ratios (kg/kg) are converted
+# with a standard near-surface air density of 1.2 kg/m3.
+AIR_DENSITY = 1.2
+CONCENTRATION_SCALE = {
+    "kg m**-3": 1e9, "kg m-3": 1e9,
+    "kg kg**-1": 1e9 * AIR_DENSITY, "kg kg-1": 1e9 * AIR_DENSITY,
+    "ug m-3": 1.0, "ug m**-3": 1.0, "µg m-3": 1.0, "µg/m3": 1.0,
+}
+
+Hourly = dict[str, np.ndarray]
+Field = tuple[tuple[str, ...], Callable[[Hourly], np.ndarray], str]
+
+
+def _relative_humidity(h: Hourly) -> np.ndarray:
+    """Relative humidity (%) from 2 m temperature and dew point (Magnus)."""
+    t, td = h["t2m"] - 273.15, h["d2m"] - 273.15
+    return 100 * np.exp(17.625 * td / (243.04 + td) - 17.625 * t / (243.04 + t))
+
+
+def _wet_hours(h: Hourly) -> np.ndarray:
+    """1 for hours with at least 0.1 mm of precipitation."""
+    mm = h["tp"] * 1000
+    return np.where(np.isnan(mm), np.nan, mm >= 0.1)
+
+
+# Panel column -> (source variables, hourly value, daily reduction), in
+# the units of the Open-Meteo tables (deg C, %, hPa, km/h, mm, MJ/m2).
+# ERA5 accumulations (tp, ssrd) are per hour in the hourly product.
+WEATHER_FIELDS: dict[str, Field] = {
+    "temperature_mean":        (("t2m",), lambda h: h["t2m"] - 273.15, "mean"),
+    "temperature_max":         (("t2m",), lambda h: h["t2m"] - 273.15, "max"),
+    "temperature_min":         (("t2m",), lambda h: h["t2m"] - 273.15, "min"),
+    "relative_humidity_mean":  (("t2m", "d2m"), _relative_humidity, "mean"),
+    "pressure_mean":           (("msl",), lambda h: h["msl"] / 100, "mean"),
+    "wind_speed_max":          (("u10", "v10"),
+                                lambda h: np.hypot(h["u10"], h["v10"]) * 3.6, "max"),
+    "wind_gusts_max":          (("i10fg",), lambda h: h["i10fg"] * 3.6, "max"),
+    "wind_direction_dominant": (("u10", "v10"),
+                                lambda h: h["u10"] + 1j * h["v10"], "direction"),
+    "precipitation_sum":       (("tp",), lambda h: h["tp"] * 1000, "sum"),
+    "precipitation_hours":     (("tp",), _wet_hours, "sum"),
+    "shortwave_radiation_sum": (("ssrd",), lambda h: h["ssrd"] / 1e6, "sum"),
+}
+AIR_QUALITY_FIELDS: dict[str, Field] = {
+    col: ((var,), lambda h, var=var: h[var], "mean")
+    for col, var in [("pm25", "pm2p5"), ("pm10", "pm10"), ("o3", "go3"),
+                     ("no2", "no2"), ("so2", "so2"), ("co", "co")]
+}
+FIELDS = {"weather": WEATHER_FIELDS, "air_quality": AIR_QUALITY_FIELDS}
+STATIC_COLUMNS = {"air_quality": {"source": "cams"}}
+
+
+def _xarray() -> Any:
+    try:
+        import xarray
+    except ImportError as exc:
+        raise ImportError(
+            "Reading gridded files needs the optional 'xarray' package "
+            "(pip install xarray netCDF4, plus zarr for .zarr stores)"
+        ) from exc
+    return xarray
+
+
+# ---------------------------------------------------------------------------
+# Point index
+# ---------------------------------------------------------------------------
+def _fractional(coord: np.ndarray, values: np.ndarray, name: str) -> np.ndarray:
+    """Fractional positions of ``values`` along a monotonic coordinate."""
+    coord = np.asarray(coord, dtype=np.float64)
+    step = 1 if coord[-1] >= coord[0] else -1        # ERA5 latitudes descend
+    ascending, positions = coord[::step], np.arange(len(coord))[::step]
+    outside = (values < ascending[0]) | (values > ascending[-1])
+    if outside.any():
+        raise ValueError(f"{int(outside.sum())} points lie outside the grid's {name} "
+                         f"range [{ascending[0]}, {ascending[-1]}]")
+    return np.interp(values, ascending, positions)
+
+
+class GridIndex:
+    """
+    Where a set of points falls on one lat/lon grid.
+
+    ``window`` is the (lat, lon) slice pair that covers every point and
+    its neighbours, and ``sample`` takes a block cut to that window,
+    ``(..., n_lat, n_lon)``, to the values at the points, ``(..., n_points)``.
+    Longitudes are matched to the grid's convention (-180..180 or 0..360).
+    """
+
+    def __init__(
+        self,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        points_lat: np.ndarray,
+        points_lon: np.ndarray,
+        method: str = GRIDDED_INTERPOLATION,
+    ) -> None:
+        if method not in INTERPOLATION_METHODS:
+            raise ValueError(f"Unknown interpolation '{method}'; "
+                             f"expected one of {INTERPOLATION_METHODS}")
+        points_lon = np.asarray(points_lon, dtype=np.float64)
+        if np.nanmax(lon) > 180:
+            points_lon = points_lon % 360
+        fy = _fractional(lat, np.asarray(points_lat, dtype=np.float64), "latitude")
+        fx = _fractional(lon, points_lon, "longitude")
+
+        if method == "nearest" or min(len(lat), len(lon)) < 2:
+            iy, ix = np.rint(fy).astype(np.int64), np.rint(fx).astype(np.int64)
+            corners = [(iy, ix, np.ones(len(fy)))]
+        else:
+            y0 = np.minimum(np.floor(fy).astype(np.int64), len(lat) - 2)
+            x0 = np.minimum(np.floor(fx).astype(np.int64), len(lon) - 2)
+            wy, wx = fy - y0, fx - x0
+            corners = [
+                (y0, x0, (1 - wy) * (1 - wx)), (y0 + 1, x0, wy * (1 - wx)),
+                (y0, x0 + 1, (1 - wy) * wx), (y0 + 1, x0 + 1, wy * wx),
+            ]
+        y_min = min(int(c[0].min()) for c in corners)
+        x_min = min(int(c[1].min()) for c in corners)
+        y_max = max(int(c[0].max()) for c in corners)
+        x_max = max(int(c[1].max()) for c in corners)
+        self.window = (slice(y_min, y_max + 1), slice(x_min, x_max + 1))
+        self.corners = [(iy - y_min, ix - x_min, w) for iy, ix, w in corners]
+
+    def sample(self, block: np.ndarray) -> np.ndarray:
+        return reduce(np.add, (w * block[..., iy, ix] for iy, ix, w in self.corners))
+
+
+# ---------------------------------------------------------------------------
+# Files
+# ---------------------------------------------------------------------------
+class _Source(NamedTuple):
+    """One variable in one file, ready to be read block by block."""
+    array: Any               # lazy xarray.DataArray, dims (time, lat, lon)
+    times: np.ndarray        # datetime64, ascending
+    index: GridIndex
+    scale: float
+    step: np.timedelta64     # typical spacing of ``times``
+
+
+def list_grid_files(directory: Path) -> list[Path]:
+    """NetCDF files and Zarr stores in ``directory``, sorted by name."""
+    if not directory.exists():
+        return []
+    return sorted(p for p in directory.iterdir() if p.suffix.lower() in GRID_SUFFIXES)
+
+
+def _open(path: Path) -> Any:
+    xr = _xarray()
+    # chunks=None: lazily indexed arrays, no dask; cache=False: a block is
+    # not kept in memory once it has been sampled
+    if path.suffix.lower() == ".zarr":
+        return xr.open_zarr(path, chunks=None)
+    return xr.open_dataset(path, chunks=None, cache=False)
+
+
+def _dim(array: Any, names: tuple[str, ...]) -> str:
+    for name in names:
+        if name in array.dims:
+            return name
+    raise ValueError(f"{array.name} has none of the dimensions {names} (dims: {array.dims})")
+
+
+def _catalog(
+    key: str,
+    files: list[Path],
+    points: pd.DataFrame,
+    method: str,
+    stack: ExitStack,
+) -> dict[str, list[_Source]]:
+    """
+    Every needed variable found in ``files``, indexed for ``points``.
+
+    The datasets stay open (their arrays are read lazily) until ``stack``
+    is closed.
+    """
+    needed = {v for variables, _, _ in FIELDS[key].values() for v in variables}
+    indexes: dict[tuple[bytes, bytes], GridIndex] = {}
+    sources: dict[str, list[_Source]] = {}
+    for path in files:
+        ds = stack.enter_context(_open(path))
+        for var in sorted(needed & set(ds.data_vars)):
+            da = ds[var]
+            dims = [_dim(da, names) for names in (TIME_NAMES, LAT_NAMES, LON_NAMES)]
+            extra = [d for d in da.dims if d not in dims]
+            if any(da.sizes[d] > 1 for d in extra):
+                raise ValueError(f"{path.name}:{var} has extra dimensions {extra}; "
+                                 "select one level before ingesting")
+            da = da.isel({d: 0 for d in extra}).transpose(*dims)
+            times = ds[dims[0]].values
+            steps = np.diff(times)
+            if np.any(steps < np.timedelta64(0)):
+                raise ValueError(f"{path.name}: time is not ascending")
+            step = np.median(steps) if len(steps) else np.timedelta64(1, "h")
+
+            lat, lon = ds[dims[1]].values, ds[dims[2]].values
+            grid = (lat.tobytes(), lon.tobytes())
+            if grid not in indexes:
+                indexes[grid] = GridIndex(lat, lon, points["lat"].to_numpy(),
+                                          points["lon"].to_numpy(), method)
+            scale = 1.0
+            if key == "air_quality":
+                units = da.attrs.get("units")
+                if units is None:
+                    raise ValueError(f"{path.name}:{var} has no units attribute")
+                if units not in CONCENTRATION_SCALE:
+                    raise ValueError(f"{path.name}:{var} has unsupported units '{units}'")
+                scale = CONCENTRATION_SCALE[units]
+            sources.setdefault(var, []).append(_Source(da, times, indexes[grid], scale, step))
+    return sources
+
+
+def _read(sources: list[_Source], t0: np.datetime64, t1: np.datetime64
+          ) -> tuple[np.ndarray, np.ndarray]:
+    """Times in [t0, t1) and the values at the points, ``(n_times, n_points)``."""
+    times, values = [], []
+    for src in sources:
+        i0, i1 = np.searchsorted(src.times, [t0, t1])
+        if i0 == i1:
+            continue
+        ys, xs = src.index.window
+        block = src.array[i0:i1, ys, xs].values
+        times.append(src.times[i0:i1])
+        values.append(src.index.sample(block) * src.scale)
+    if not times:
+        return np.array([], dtype="datetime64[ns]"), np.empty((0, 0))
+    times_all, values_all = np.concatenate(times), np.concatenate(values)
+    # Files may overlap in time: keep each time once
+    times_all, first = np.unique(times_all, return_index=True)
+    return times_all, values_all[first]
+
+
+# ---------------------------------------------------------------------------
+# Daily reduction
+# ---------------------------------------------------------------------------
+def reduce_daily(values: np.ndarray, day: np.ndarray, n_days: int, how: str) -> np.ndarray:
+    """
+    Reduce ``(n_times, n_points)`` values to ``(n_days, n_points)``.
+
+    ``day`` is the day (0..n_days-1) of each time, ascending.  Missing
+    values are skipped; days without any value are NaN.  ``how`` is
+    "mean", "sum", "max", "min" or "direction" (meteorological direction
+    of the mean of ``u + iv`` wind vectors, in degrees).
+    """
+    out = np.full((n_days, values.shape[1]), np.nan)
+    if not len(day):
+        return out
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    if how in ("max", "min"):
+        ufunc = np.fmax if how == "max" else np.fmin      # NaN-skipping
+        out[day[starts]] = ufunc.reduceat(values, starts, axis=0)
+        return out
+    valid = ~np.isnan(values)
+    total = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+    count = np.add.reduceat(valid, starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if how == "sum":
+            daily = np.where(count > 0, total, np.nan)
+        elif how == "mean":
+            daily = total / count
+        elif how == "direction":
+            mean = total / count
+            daily = np.degrees(np.arctan2(-mean.real, -mean.imag)) % 360
+        else:
+            raise ValueError(f"Unknown daily reduction '{how}'")
+    out[day[starts]] = np.real(daily)
+    return out
+
+
+def steps_per_day(sources: list[_Source]) -> int:
+    """Time steps in a complete day of the coarsest of ``sources``."""
+    step = max(src.step for src in sources)
+    return max(1, int(np.timedelta64(1, "D") // step))
+
+
+def extract_daily(
+    key: str,
+    files: list[Path],
+    points: pd.DataFrame,
+    method: str = GRIDDED_INTERPOLATION,
+    start: str = ANALYSIS_START,
+    end: str = ANALYSIS_END,
+    block_days: int = GRIDDED_BLOCK_DAYS,
+) -> pd.DataFrame:
+    """
+    Daily ``FIELDS[key]`` columns at ``points`` (city, lat, lon) from
+    ``files``, one row per (city, local day) with any value.  A field is
+    NaN on days with fewer time steps than ``steps_per_day``.
+    """
+    with ExitStack() as stack:
+        sources = _catalog(key, files, points, method, stack)
+        fields = {col: spec for col, spec in FIELDS[key].items()
+                  if all(v in sources for v in spec[0])}
+        missing = sorted(set(FIELDS[key]) - set(fields))
+        if not fields:
+            raise FileNotFoundError(f"No {key} variables in {[f.name for f in files]}")
+        if missing:
+            logger.warning("No source variables for %s; left empty.", missing)
+        expected = {col: min(steps_per_day(sources[v]) for v in spec[0])
+                    for col, spec in fields.items()}
+
+        offset = np.timedelta64(GRIDDED_UTC_OFFSET_HOURS, "h")
+        first, last = np.datetime64(start, "D"), np.datetime64(end, "D")
+        n_days = int((last - first).astype(np.int64)) + 1
+        frames = []
+        for b0 in range(0, n_days, block_days):
+            d0 = first + b0
+            nd = min(block_days, n_days - b0)
+            # Local day d covers UTC [d - offset, d + 1 - offset)
+            t0 = (d0 - offset).astype("datetime64[ns]")
+            t1 = (d0 + nd - offset).astype("datetime64[ns]")
+            hourly = {var: _read(srcs, t0, t1) for var, srcs in sources.items()}
+
+            daily = {}
+            for col, (variables, value, how) in fields.items():
+                times = reduce(np.intersect1d, [hourly[v][0] for v in variables])
+                if not len(times):
+                    continue
+                h = {v: hourly[v][1][np.searchsorted(hourly[v][0], times)]
+                     for v in variables}
+                day = ((times + offset).astype("datetime64[D]") - d0).astype(np.int64)
+                values = reduce_daily(value(h), day, nd, how)
+                partial_days = np.bincount(day, minlength=nd) < expected[col]
+                values[partial_days] = np.nan
+                daily[col] = values
+            if not daily:
+                continue
+
+            block = pd.DataFrame({
+                "city": np.tile(points["city"].to_numpy(), nd),
+                "date": np.repeat(d0 + np.arange(nd), len(points)).astype("datetime64[ns]"),
+                "lat": np.tile(points["lat"].to_numpy(), nd),
+                "lon": np.tile(points["lon"].to_numpy(), nd),
+                **{col: values.ravel() for col, values in daily.items()},
+            })
+            frames.append(block.dropna(subset=list(daily), how="all"))
+            logger.info("  %s %s..%s: %d city-days", key, d0, d0 + nd - 1, len(frames[-1]))
+
+    if not frames:
+        return pd.DataFrame(columns=["city", "date", "lat", "lon", *fields])
+    return (pd.concat(frames, ignore_index=True)
+            .sort_values(["city", "date"], ignore_index=True))
+
+
+# ---------------------------------------------------------------------------
+# Ingestion
+# ---------------------------------------------------------------------------
+def load_points(path: Path | None = None) -> pd.DataFrame:
+    """Points to sample: a CSV with city, lat, lon, or the capitals."""
+    if path is not None:
+        points = pd.read_csv(path, usecols=["city", "lat", "lon"])
+    else:
+        points = pd.DataFrame([{"city": city, **c} for city, c in CAPITAL_COORDS.items()])
+    if points["city"].duplicated().any():
+        raise ValueError("Duplicate city names in the points table")
+    return points
+
+
+def _to_schema(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Cast rows to ``schema`` column by column; absent columns are null."""
+    arrays = [
+        pa.array(df[field.name], from_pandas=True).cast(field.type)
+        if field.name in df.columns
+        else pa.nulls(len(df), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def ingest(
+    table_keys: list[str] | None = None,
+    points_path: Path | None = None,
+    method: str = GRIDDED_INTERPOLATION,
+    block_days: int = GRIDDED_BLOCK_DAYS,
+) -> dict[str, int]:
+    """
+    Rebuild the raw ``weather`` and/or ``air_quality`` tables from the
+    files in ``config.GRIDDED_DIRS``.  Returns the rows written per table.
+    """
+    table_keys = table_keys or list(GRIDDED_DIRS)
+    unknown = sorted(set(table_keys) - set(GRIDDED_DIRS))
+    if unknown:
+        raise ValueError(f"Unknown tables {unknown}; expected {list(GRIDDED_DIRS)}")
+    points = load_points(points_path)
+    manifest = load_manifest()
+    written = {}
+    for key in table_keys:
+        t0 = time.time()
+        files = list_grid_files(GRIDDED_DIRS[key])
+        if not files:
+            raise FileNotFoundError(f"No NetCDF/Zarr files in {GRIDDED_DIRS[key]}")
+        logger.info("Sampling %s at %d points (%s) from %d files", key, len(points),
+                    method, len(files))
+        df = extract_daily(key, files, points, method, block_days=block_days)
+        for col, value in STATIC_COLUMNS.get(key, {}).items():
+            df[col] = value
+        df["id"] = key_ids(df, ["city", "date"])
+
+        table_name = TABLES[key]
+        table = _to_schema(df, arrow_schema(table_name))
+        out_path = raw_path(table_name)
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, out_path)
+        removed = clear_fragments(table_name)
+        if removed:
+            logger.info("Removed %d stale fragments of %s", removed, table_name)
+        manifest[table_name] = {
+            "source": f"{SOURCE}:{GRIDDED_DIRS[key].name}",
+            "filters": [["date", f"gte.{ANALYSIS_START}"], ["date", f"lte.{ANALYSIS_END}"]],
+            "rows": table.num_rows,
+            "files": len(files),
+            "last_run": {"mode": "full", "rows": table.num_rows,
+                         "at": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+        }
+        save_manifest(manifest)
+        written[key] = table.num_rows
+        logger.info("Saved %s: %d rows (%.1f s)", out_path, table.num_rows,
+                    time.time() - t0)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build weather/air-quality tables from local ERA5/CAMS files")
+    parser.add_argument(
+        "tables",
+        nargs="*",
+        default=None,
+        help=f"Tables to build (default: all). Choices: {list(GRIDDED_DIRS)}",
+    )
+    parser.add_argument(
+        "--points",
+        type=Path,
+        default=None,
+        help="CSV of city,lat,lon to sample (default: the capitals)",
+    )
+    parser.add_argument(
+        "--interpolation",
+        choices=list(INTERPOLATION_METHODS),
+        default=GRIDDED_INTERPOLATION,
+        help="Value at a point: nearest grid point or bilinear (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--block-days",
+        type=int,
+        default=GRIDDED_BLOCK_DAYS,
+        help="Local days of fields read per block (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    ingest(args.tables or None, points_path=args.points,
+           method=args.interpolation, block_days=args.block_days)
@@ -0,0 +1,214 @@
+"""
+Out-of-core aggregation of the raw health table to city-days.
+
+The in-memory path of ``process.py`` loads every hospitalization row,
+filters it and runs one ``groupby``; with SIH/SUS municipality microdata
+that is tens of millions of rows held at once.  ``stream_health`` reads
+the raw files batch by batch instead (row groups outside the analysis
+window are skipped by their statistics), applies the date window and the
+respiratory filter to each batch, and adds the batch's sums into a
+``CityDayAccumulator``: one dense slot per (municipality, day) of the
+window and aggregated column.  Memory is bounded by the size of the
+aggregated output, whatever the size of the input.
+
+The result equals ``groupby(["city", "date", "ibge_code"],
+observed=True)[HEALTH_AGG_COLUMNS].sum()`` on the filtered table: same
+rows, order and dtypes (missing values count as zero, dates are whole
+days).
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import logging
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.data.raw_store import iter_raw_batches
+from src.utils.config import (
+    ANALYSIS_END,
+    ANALYSIS_START,
+    HEALTH_AGG_COLUMNS,
+    HEALTH_STREAM_BATCH_ROWS,
+    TABLES,
+)
+
+logger = logging.getLogger("health_stream")
+
+
+def respiratory_mask(cid: pd.Series) -> np.ndarray:
+    """Rows whose ``cid_category`` names a respiratory diagnosis."""
+    # cid_category uses descriptive names ("respiratory", "cardiovascular")
+    if isinstance(cid.dtype, pd.CategoricalDtype):
+        # Match the few categories once instead of every row
+        hits = cid.cat.categories.str.lower().str.contains("respiratory", na=False)
+        codes = cid.cat.codes.to_numpy()
+        return np.asarray(hits, dtype=bool)[codes] & (codes >= 0)
+    return cid.str.lower().str.contains("respiratory", na=False).to_numpy(dtype=bool)
+
+
+# ---------------------------------------------------------------------------
+# Accumulator
+# ---------------------------------------------------------------------------
+class CityDayAccumulator:
+    """
+    Running (city, ibge_code, day) sums over a fixed window of days.
+
+    Each (city, ibge_code) unit owns a block of ``n_days`` slots per
+    column; blocks are added as new units appear (capacity grows by a
+    quarter, so growing is amortized without overshooting the output by
+    much).  Integer columns are summed at their own width (at least
+    int32), the width ``groupby().sum()`` returns.  ``add`` folds in one
+    batch, ``result`` returns the observed cells as a DataFrame.
+
+    Parameters
+    ----------
+    start, end : first and last day of the window (inclusive).
+    columns : columns to sum.
+    """
+
+    def __init__(self, start: str, end: str, columns: list[str]) -> None:
+        self.start = np.datetime64(start, "D")
+        self.n_days = int((np.datetime64(end, "D") - self.start).astype(np.int64)) + 1
+        self.columns = list(columns)
+        self._units: dict[tuple, int] = {}
+        self._capacity = 0
+        self._sums: dict[str, np.ndarray] = {}
+        self._seen = np.zeros(0, dtype=bool)
+        self._dtypes: dict[str, np.dtype] = {}
+        self._categories: dict[str, set] = {"city": set(), "ibge_code": set()}
+
+    def _grow(self, n_units: int) -> None:
+        capacity = max(n_units, self._capacity + max(self._capacity // 4, 64))
+        extra = (capacity - self._capacity) * self.n_days
+        for col in self.columns:
+            dtype = (np.float64 if self._dtypes[col].kind == "f"
+                     else np.promote_types(self._dtypes[col], np.int32))
+            self._sums[col] = np.concatenate(
+                [self._sums.get(col, np.zeros(0, dtype)), np.zeros(extra, dtype)])
+        self._seen = np.concatenate([self._seen, np.zeros(extra, dtype=bool)])
+        self._capacity = capacity
+
+    def _unit_ids(self, city: pd.Series, ibge: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+        """Unit of every row (-1 where city or code is missing)."""
+        city_codes, city_values = pd.factorize(city)
+        ibge_codes, ibge_values = pd.factorize(ibge)
+        valid = (city_codes >= 0) & (ibge_codes >= 0)
+        pair = city_codes.astype(np.int64) * len(ibge_values) + ibge_codes
+        pairs, inverse = np.unique(pair[valid], return_inverse=True)
+        ids = np.empty(len(pairs), dtype=np.int64)
+        for i, p in enumerate(pairs):
+            key = (city_values[p // len(ibge_values)], ibge_values[p % len(ibge_values)])
+            ids[i] = self._units.setdefault(key, len(self._units))
+        if len(self._units) > self._capacity:
+            self._grow(len(self._units))
+        return ids[inverse], valid
+
+    def add(self, batch: pd.DataFrame, days: np.ndarray) -> None:
+        """
+        Add the rows of ``batch`` (already filtered) on day offsets ``days``.
+        """
+        for col in self.columns:
+            self._dtypes.setdefault(col, batch[col].dtype)
+        for key in self._categories:
+            values = batch[key]
+            self._categories[key].update(
+                values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype)
+                else values.dropna().unique())
+        if not len(batch):
+            return
+
+        units, valid = self._unit_ids(batch["city"], batch["ibge_code"])
+        cells, inverse = np.unique(units * self.n_days + days[valid], return_inverse=True)
+        for col in self.columns:
+            values = batch[col].to_numpy(dtype=np.float64, na_value=0.0)[valid]
+            sums = np.bincount(inverse, weights=values, minlength=len(cells))
+            acc = self._sums[col]
+            acc[cells] += sums.astype(acc.dtype) if acc.dtype.kind == "i" else sums
+        self._seen[cells] = True
+
+    def result(self) -> pd.DataFrame:
+        """Observed cells as one row per (city, date, ibge_code), sorted."""
+        cells = np.flatnonzero(self._seen)
+        units, days = np.divmod(cells, self.n_days)
+        keys = list(self._units)
+        cities = pd.Categorical([k[0] for k in keys],
+                                categories=sorted(self._categories["city"]))
+        codes = pd.Categorical([k[1] for k in keys],
+                               categories=sorted(self._categories["ibge_code"]))
+        order = np.lexsort((codes.codes[units], days, cities.codes[units]))
+        units, days, cells = units[order], days[order], cells[order]
+
+        out = pd.DataFrame({
+            "city": cities.take(units),
+            "date": (self.start + days).astype("datetime64[ns]"),
+            "ibge_code": codes.take(units),
+        })
+        for col in self.columns:
+            out[col] = self._sums.pop(col)[cells].astype(self._dtypes[col])
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Streaming aggregation
+# ---------------------------------------------------------------------------
+def _day_offsets(dates: pd.Series, start: np.datetime64) -> np.ndarray:
+    """Days since ``start`` (NaT and unparsable dates become -1)."""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors="coerce")
+    days = dates.to_numpy("datetime64[D]")
+    return np.where(np.isnat(days), -1, (days - start).astype(np.int64))
+
+
+def _scan_filter(
+    schema: pa.Schema, cities: list[str] | None,
+) -> pc.Expression | None:
+    """
+    Row filter for one raw file, built from that file's schema.
+
+    The date window is only pushed down when ``date`` is a date or
+    timestamp column; legacy extracts that stored it as a string are
+    scanned whole and windowed by ``_day_offsets`` instead.
+    """
+    expr = None
+    date_type = schema.field("date").type
+    if pa.types.is_date(date_type) or pa.types.is_timestamp(date_type):
+        expr = (pc.field("date") >= pa.scalar(dt.date.fromisoformat(ANALYSIS_START))) & (
+            pc.field("date") <= pa.scalar(dt.date.fromisoformat(ANALYSIS_END)))
+    if cities is not None:
+        in_cities = pc.field("city").isin(list(cities))
+        expr = in_cities if expr is None else expr & in_cities
+    return expr
+
+
+def stream_health(
+    cities: list[str] | None = None,
+    batch_rows: int = HEALTH_STREAM_BATCH_ROWS,
+) -> pd.DataFrame:
+    """
+    Respiratory admissions per (city, date, ibge_code), read batch by batch.
+
+    ``cities`` restricts the scan to those cities (one shard of a
+    parallel build).
+    """
+    acc = CityDayAccumulator(ANALYSIS_START, ANALYSIS_END, HEALTH_AGG_COLUMNS)
+    filters = partial(_scan_filter, cities=cities)
+
+    n_rows = n_kept = 0
+    columns = ["city", "date", "ibge_code", "cid_category", *HEALTH_AGG_COLUMNS]
+    for batch in iter_raw_batches(TABLES["health"], columns, filters, batch_rows):
+        df = batch.to_pandas(date_as_object=False)
+        days = _day_offsets(df["date"], acc.start)
+        keep = respiratory_mask(df["cid_category"]) & (days >= 0) & (days < acc.n_days)
+        acc.add(df.loc[keep], days[keep])
+        n_rows += len(df)
+        n_kept += int(keep.sum())
+
+    health = acc.result()
+    logger.info("Streamed health: %d rows scanned, %d respiratory -> %d city-dates",
+                n_rows, n_kept, len(health))
+    return health
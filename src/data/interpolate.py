@@ -0,0 +1,233 @@
+"""
+Vectorized annual-to-daily interpolation for the annual tables.
+
+Demographics and fleet come as one row per (city, year); the panel needs
+a value per city-day.  ``annual_to_daily`` places every annual figure on
+an integer day axis (its anchor date), lays all cities end to end on that
+axis, and interpolates every target row at once with ``searchsorted``
+plus array arithmetic, with no per-city Python.  Columns share the
+lookup of the target rows, so each extra column costs a couple of
+gathers.
+
+Modes
+-----
+step
+    Each year's value holds for the whole calendar year; years without a
+    value take the previous year's (the first year's before it).  This is
+    what the panel used before ``linear`` became the default.
+linear
+    Piecewise linear between anchor dates, constant beyond the first and
+    last anchor of each city.
+spline
+    Monotone piecewise cubic (PCHIP, as ``scipy.interpolate.PchipInterpolator``),
+    constant beyond the end anchors.  Smooth, with no overshoot between
+    anchors.
+
+Missing values are skipped per column and city; a city with no value at
+all for a column stays NaN.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+INTERPOLATION_MODES = ("linear", "step", "spline")
+
+
+def _anchor_days(years: np.ndarray, month_day: str) -> np.ndarray:
+    """Day numbers (days since 1970-01-01) of ``{year}-{month_day}``."""
+    month, day = (int(part) for part in month_day.split("-"))
+    months = (np.asarray(years, dtype=np.int64) - 1970) * 12 + (month - 1)
+    dates = months.astype("datetime64[M]").astype("datetime64[D]") + (day - 1)
+    return dates.astype(np.int64)
+
+
+def _edge_slopes(h0, h1, m0, m1) -> np.ndarray:
+    """One-sided three-point end slopes, limited to preserve shape."""
+    d = ((2 * h0 + h1) * m0 - h0 * m1) / (h0 + h1)
+    flip = np.sign(d) != np.sign(m0)
+    steep = (np.sign(m0) != np.sign(m1)) & (np.abs(d) > 3 * np.abs(m0)) & ~flip
+    d[flip] = 0.0
+    d[steep] = 3 * m0[steep]
+    return d
+
+
+def _pchip_slopes(code: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    PCHIP derivatives at every anchor, each city handled independently.
+
+    Anchors are sorted by (code, x); the formulas are those of
+    ``scipy.interpolate.PchipInterpolator`` (Fritsch-Carlson weighted
+    harmonic mean inside, shape-limited one-sided slopes at the ends).
+    """
+    n = len(x)
+    d = np.zeros(n)
+    if n < 2:
+        return d
+    same = code[1:] == code[:-1]                    # interval i -> i+1 in one city
+    h = np.diff(x).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m = np.where(same, np.diff(y) / np.where(same, h, 1.0), np.nan)
+    left = np.r_[False, same]                       # anchor has a left interval
+    right = np.r_[same, False]                      # ... and a right one
+
+    i = np.flatnonzero(left & right)
+    if len(i):
+        m0, m1, h0, h1 = m[i - 1], m[i], h[i - 1], h[i]
+        w1, w2 = 2 * h1 + h0, h1 + 2 * h0
+        flat = (np.sign(m0) != np.sign(m1)) | (m0 == 0) | (m1 == 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            whmean = (w1 / m0 + w2 / m1) / (w1 + w2)
+            d[i] = np.where(flat, 0.0, 1.0 / whmean)
+
+    # End anchors: two-anchor cities are linear, longer ones use edge slopes
+    first = np.flatnonzero(~left & right)
+    pair = ~right[first + 1]
+    d[first[pair]] = m[first[pair]]
+    f = first[~pair]
+    d[f] = _edge_slopes(h[f], h[f + 1], m[f], m[f + 1])
+
+    last = np.flatnonzero(left & ~right)
+    pair = ~left[last - 1]
+    d[last[pair]] = m[last[pair] - 1]
+    g = last[~pair]
+    d[g] = _edge_slopes(h[g - 1], h[g - 2], m[g - 1], m[g - 2])
+    return d
+
+
+def _locate(
+    a_code: np.ndarray,
+    a_day: np.ndarray,
+    q_code: np.ndarray,
+    q_day: np.ndarray,
+) -> tuple[np.ndarray, ...]:
+    """
+    Bracketing anchors of every query point.
+
+    Anchors must be sorted by (code, day).  Each code is looked up only
+    among its own anchors: codes are laid out end to end on one axis
+    (``code * span + day``) and queries are clamped to their code's anchor
+    range first.  Returns ``(has, seg, nxt, t, h)``: which queries have
+    any anchor, the left and right anchor index, the position between
+    them in [0, 1] and the gap in days.
+    """
+    n_blocks = int(max(a_code.max(initial=-1), q_code.max(initial=-1))) + 1
+    counts = np.bincount(a_code, minlength=n_blocks)
+    start = np.r_[0, np.cumsum(counts)[:-1]]
+    has = counts[q_code] > 0
+    qc = q_code[has]
+    first, last = start[qc], start[qc] + counts[qc] - 1
+    if not len(qc):
+        empty = np.zeros(0, dtype=np.int64)
+        return has, empty, empty, np.zeros(0), np.zeros(0)
+    x = np.clip(q_day[has], a_day[first], a_day[last])
+
+    origin = a_day.min()
+    span = int(a_day.max() - origin) + 1
+    a_key = a_code.astype(np.int64) * span + (a_day - origin)
+    q_key = qc.astype(np.int64) * span + (x - origin)
+    seg = np.searchsorted(a_key, q_key, side="right") - 1
+    nxt = np.minimum(seg + 1, last)
+    h = (a_day[nxt] - a_day[seg]).astype(np.float64)
+    t = np.divide(x - a_day[seg], h, out=np.zeros_like(h), where=h > 0)
+    return has, seg, nxt, t, h
+
+
+def _evaluate(
+    located: tuple[np.ndarray, ...],
+    a_val: np.ndarray,
+    mode: str,
+    slopes: np.ndarray | None = None,
+) -> np.ndarray:
+    """Interpolated values at the points returned by ``_locate``."""
+    has, seg, nxt, t, h = located
+    out = np.full(len(has), np.nan)
+    y0 = a_val[seg]
+    if mode == "step":
+        out[has] = y0
+    elif mode == "linear":
+        out[has] = y0 + t * (a_val[nxt] - y0)
+    else:
+        t2, t3 = t * t, t * t * t
+        out[has] = ((2 * t3 - 3 * t2 + 1) * y0 + (t3 - 2 * t2 + t) * h * slopes[seg]
+                    + (-2 * t3 + 3 * t2) * a_val[nxt] + (t3 - t2) * h * slopes[nxt])
+    return out
+
+
+def annual_to_daily(
+    annual: pd.DataFrame,
+    targets: pd.DataFrame,
+    value_cols: list[str],
+    mode: str = "linear",
+    anchor: str = "07-01",
+    by: str = "city",
+    time_col: str = "year",
+    date_col: str = "date",
+) -> pd.DataFrame:
+    """
+    Interpolate annual values to the (city, date) rows of ``targets``.
+
+    Parameters
+    ----------
+    annual : DataFrame with ``by``, ``time_col`` and ``value_cols``;
+        duplicated (city, year) rows keep the last one.
+    targets : DataFrame with ``by`` and a datetime ``date_col``.
+    value_cols : columns to interpolate.
+    mode : "linear", "step" or "spline" (see module docstring).
+    anchor : month-day each annual value refers to in ``linear`` and
+        ``spline`` mode (IBGE population estimates are dated 1 July).
+        ``step`` always covers the calendar year.
+
+    Returns
+    -------
+    DataFrame of ``value_cols`` on ``targets.index``: float columns keep
+    their dtype, everything else becomes float64.
+    """
+    if mode not in INTERPOLATION_MODES:
+        raise ValueError(f"Unknown interpolation mode '{mode}'")
+    annual = annual.drop_duplicates([by, time_col], keep="last")
+
+    codes, _ = pd.factorize(np.concatenate([
+        targets[by].astype(str).to_numpy(), annual[by].astype(str).to_numpy(),
+    ]))
+    q_code, a_code = codes[: len(targets)], codes[len(targets):]
+    q_day = targets[date_col].to_numpy("datetime64[D]").astype(np.int64)
+    a_day = _anchor_days(annual[time_col].to_numpy(),
+                         "01-01" if mode == "step" else anchor)
+
+    order = np.lexsort((a_day, a_code))
+    a_code, a_day = a_code[order], a_day[order]
+    values = {col: annual[col].to_numpy(dtype=np.float64, na_value=np.nan)[order]
+              for col in value_cols}
+
+    # Step and linear: fill missing anchors from their city's other anchors
+    # (exact for both: the filled points lie on the same step/line), so
+    # every column shares one lookup of the target rows.  Spline knots
+    # change the curve, so there columns are grouped by missing pattern.
+    groups: dict[bytes, list[str]] = {}
+    for col in value_cols:
+        keep = ~np.isnan(values[col])
+        if mode != "spline" and not keep.all():
+            filled = _evaluate(_locate(a_code[keep], a_day[keep], a_code, a_day),
+                               values[col][keep], mode)
+            values[col] = filled
+            keep = np.ones(len(keep), dtype=bool)
+        groups.setdefault(keep.tobytes(), []).append(col)
+
+    columns = {}
+    for cols in groups.values():
+        keep = ~np.isnan(values[cols[0]]) if mode == "spline" else slice(None)
+        located = _locate(a_code[keep], a_day[keep], q_code, q_day)
+        for col in cols:
+            a_val = values[col][keep]
+            slopes = (_pchip_slopes(a_code[keep], a_day[keep], a_val)
+                      if mode == "spline" else None)
+            result = _evaluate(located, a_val, mode, slopes)
+            # Keep float32 measurements float32; integer counts become float64
+            dtype = annual[col].dtype
+            columns[col] = (result.astype(dtype)
+                            if isinstance(dtype, np.dtype) and dtype.kind == "f"
+                            else result)
+    columns = {col: columns[col] for col in value_cols}
+    return pd.DataFrame(columns, index=targets.index)
@@ -0,0 +1,183 @@
+"""
+Joins on integer-encoded (city, date) panel keys.
+
+``pd.merge(on=["city", "date"])`` hashes the city strings and dates of
+every row on both sides for every merge.  Here each side is encoded once:
+
+- ``city`` becomes a small integer code from one vocabulary shared by all
+  frames of the join (``config.CAPITALS`` order first, so the 27 capitals
+  always get codes 0..26, then any other names sorted, e.g.
+  municipalities).  Categorical columns are recoded through their
+  categories, other columns are factorized once; integer columns such as
+  an IBGE municipality code work the same way;
+- ``date`` becomes a day ordinal relative to the earliest day of the
+  join;
+- both are combined into one dense int64 key, ``code * n_days + day``.
+
+``join`` then matches the keys with a direct-index lookup table when the
+key space is small relative to the frames (always the case for a
+city-day panel), or by sorting the right-hand keys and ``searchsorted``
+otherwise.  Rows with a missing city or date never match (``pd.merge``
+would pair NaN with NaN).
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.config import CAPITALS
+
+logger = logging.getLogger("panel_join")
+
+# Use a lookup table while it has at most this many slots per joined row
+DIRECT_INDEX_FACTOR = 8
+
+
+# ---------------------------------------------------------------------------
+# Key encoding
+# ---------------------------------------------------------------------------
+def city_codes(*columns: pd.Series) -> list[np.ndarray]:
+    """
+    Integer codes for several city columns over one shared vocabulary.
+
+    The vocabulary is ``config.CAPITALS`` in order, followed by every
+    other value found in ``columns`` in sorted order.  Missing values get
+    code -1.
+    """
+    local = []
+    for col in columns:
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            local.append((col.cat.codes.to_numpy(), col.cat.categories))
+        else:
+            codes, uniques = pd.factorize(col)
+            local.append((codes, pd.Index(uniques)))
+
+    vocab = {name: i for i, name in enumerate(CAPITALS)}
+    others = set().union(*(set(uniques) for _, uniques in local)) - vocab.keys()
+    for name in sorted(others, key=str):
+        vocab[name] = len(vocab)
+
+    out = []
+    for codes, uniques in local:
+        mapping = np.array([vocab[name] for name in uniques], dtype=np.int64)
+        out.append(np.where(codes >= 0, mapping[codes] if len(mapping) else -1, -1))
+    return out
+
+
+def day_ordinals(dates: pd.Series) -> np.ndarray:
+    """Days since 1970-01-01 as int64 (NaT becomes the int64 minimum)."""
+    return dates.to_numpy("datetime64[D]").astype(np.int64)
+
+
+def panel_keys(
+    frames: Sequence[pd.DataFrame],
+    on: tuple[str, str] = ("city", "date"),
+) -> tuple[list[np.ndarray], int]:
+    """
+    Dense int64 (city, date) keys for ``frames``, encoded consistently.
+
+    Returns one key array per frame and the size of the key space; keys
+    lie in ``[0, size)`` and rows with a missing city or date get -1.
+    """
+    city, date = on
+    codes = city_codes(*(df[city] for df in frames))
+    days = [day_ordinals(df[date]) for df in frames]
+    nat = np.iinfo(np.int64).min
+    valid = [(c >= 0) & (d != nat) for c, d in zip(codes, days)]
+
+    present = [d[v] for d, v in zip(days, valid) if v.any()]
+    if not present:
+        return [np.full(len(df), -1, dtype=np.int64) for df in frames], 0
+    first = min(int(d.min()) for d in present)
+    n_days = max(int(d.max()) for d in present) - first + 1
+    n_codes = max(int(c.max()) for c in codes) + 1
+
+    keys = [
+        np.where(v, c * n_days + (d - first), -1)
+        for c, d, v in zip(codes, days, valid)
+    ]
+    return keys, n_codes * n_days
+
+
+# ---------------------------------------------------------------------------
+# Join
+# ---------------------------------------------------------------------------
+def _match(
+    left_keys: np.ndarray, right_keys: np.ndarray, size: int
+) -> np.ndarray | None:
+    """
+    Row of ``right_keys`` holding each left key (-1 if none).
+
+    Returns None when a key occurs more than once on the right.
+    """
+    right_rows = np.flatnonzero(right_keys >= 0)
+    rk = right_keys[right_rows]
+    if size <= DIRECT_INDEX_FACTOR * (len(left_keys) + len(right_keys)):
+        if len(rk) and np.bincount(rk, minlength=size).max() > 1:
+            return None
+        lookup = np.full(size + 1, -1, dtype=np.int64)   # slot ``size``: no match
+        lookup[rk] = right_rows
+        return lookup[np.where(left_keys >= 0, left_keys, size)]
+
+    order = np.argsort(rk, kind="stable")
+    sorted_keys = rk[order]
+    if np.any(sorted_keys[1:] == sorted_keys[:-1]):
+        return None
+    if not len(sorted_keys):
+        return np.full(len(left_keys), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_keys, left_keys), len(sorted_keys) - 1)
+    hit = (sorted_keys[pos] == left_keys) & (left_keys >= 0)
+    return np.where(hit, right_rows[order[pos]], -1)
+
+
+def join(
+    left: pd.DataFrame,
+    right: pd.DataFrame,
+    on: tuple[str, str] = ("city", "date"),
+    how: str = "inner",
+    suffixes: tuple[str, str] = ("_x", "_y"),
+) -> pd.DataFrame:
+    """
+    Many-to-one join of ``right`` onto ``left`` by (city, date).
+
+    Same rows, order and columns as ``pd.merge(left, right, on=list(on),
+    how=how, suffixes=suffixes)`` (left order, left key columns, then the
+    other right columns; clashing names get ``suffixes``).  The key
+    columns are ``left``'s, unchanged: ``pd.merge`` turns categoricals with
+    differing categories into strings.  ``right`` must have at most one
+    row per key; otherwise this falls back to ``pd.merge``.
+
+    Parameters
+    ----------
+    how : "inner" or "left"
+    """
+    if how not in ("inner", "left"):
+        raise ValueError(f"Unsupported join type '{how}'")
+    (left_keys, right_keys), size = panel_keys([left, right], on)
+    match = _match(left_keys, right_keys, size)
+    if match is None:
+        logger.warning("Right side has duplicate (%s, %s) keys; using pd.merge",
+                       *on)
+        return pd.merge(left, right, on=list(on), how=how, suffixes=suffixes)
+
+    if how == "inner":
+        rows = np.flatnonzero(match >= 0)
+        out = left.take(rows).reset_index(drop=True)
+        match = match[rows]
+    else:
+        out = left.reset_index(drop=True)
+
+    right_cols = [c for c in right.columns if c not in on]
+    clash = set(right_cols) & set(left.columns)
+    if clash:
+        out = out.rename(columns={c: c + suffixes[0] for c in clash})
+    fill = how == "left" and bool((match < 0).any())
+    for col in right_cols:
+        values = right[col].array
+        name = col + suffixes[1] if col in clash else col
+        out[name] = values.take(match, allow_fill=fill)
+    return out
@@ -0,0 +1,309 @@
+"""
+On-disk layout of the analysis panel and the shared panel loader.
+
+``process.py`` writes the panel as a Hive-partitioned Parquet dataset,
+``data/processed/analysis_panel/region=<R>/uf=<UF>/year=<Y>/part-*.parquet``,
+next to the single-file ``analysis_panel.parquet``.  The partition columns
+live only in the directory names (``year`` is derived from ``date``); the
+full schema, panel column order included, is kept in ``_common_metadata``
+at the dataset root.
+
+``load_panel`` is how the model and analysis scripts read the panel: it
+scans the dataset (or the single file when there is no dataset) with
+Arrow, reading only the requested columns and pushing row predicates into
+the scan, so a per-region run opens only that region's files and a
+moderator table reads nine columns instead of the whole panel.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.utils.config import (
+    ALL_CONFOUNDERS,
+    CAPITALS,
+    HETEROGENEITY_MODERATORS,
+    PANEL_DATASET_DIR,
+    PANEL_PARTITIONS,
+    PROCESSED_DIR,
+    TREATMENT_PM25,
+)
+
+logger = logging.getLogger("panel_store")
+
+PANEL_PATH = PROCESSED_DIR / "analysis_panel.parquet"
+SCHEMA_FILE = "_common_metadata"
+SORT_KEYS = ("city", "date")
+
+# IBGE municipality codes start with the two-digit code of their state;
+# every state has one capital, which gives the prefix -> state table.
+_UF_BY_IBGE_PREFIX = {meta["ibge"][:2]: meta["uf"] for meta in CAPITALS.values()}
+_REGION_BY_UF = {meta["uf"]: meta["region"] for meta in CAPITALS.values()}
+
+
+# ---------------------------------------------------------------------------
+# States
+# ---------------------------------------------------------------------------
+def city_uf(city: pd.Series, ibge_code: pd.Series) -> pd.Series:
+    """
+    UF of each row: from ``CAPITALS`` by city name, otherwise from the
+    state prefix of the IBGE municipality code.
+    """
+    by_name = city.map({name: meta["uf"] for name, meta in CAPITALS.items()})
+    by_code = ibge_code.astype(str).str[:2].map(_UF_BY_IBGE_PREFIX)
+    return by_name.fillna(by_code)
+
+
+def uf_region(uf: pd.Series) -> pd.Series:
+    """Macro-region (N, NE, CO, SE, S) of each UF."""
+    return uf.map(_REGION_BY_UF)
+
+
+# ---------------------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------------------
+def _path_field(field: pa.Field) -> pa.Field:
+    """Partition keys are parsed from paths as plain values, not dictionaries."""
+    if pa.types.is_dictionary(field.type):
+        return field.with_type(field.type.value_type)
+    return field
+
+
+def _partitioning(schema: pa.Schema) -> ds.Partitioning:
+    return ds.partitioning(
+        pa.schema([_path_field(schema.field(name)) for name in PANEL_PARTITIONS]),
+        flavor="hive",
+    )
+
+
+def _with_year(table: pa.Table) -> pa.Table:
+    if "year" in table.column_names:
+        return table
+    return table.append_column("year", pc.year(table["date"]).cast(pa.int16()))
+
+
+def write_panel_dataset(
+    df: pd.DataFrame,
+    root: Path = PANEL_DATASET_DIR,
+    basename: str = "part",
+    write_schema: bool = True,
+) -> pa.Schema:
+    """
+    Write ``df`` into the partitioned dataset at ``root``.
+
+    Files are named ``<basename>-<i>.parquet`` and existing files with
+    other names are left alone, so several writers (the shards of a
+    parallel build) can fill one dataset.  Returns the full schema;
+    ``write_schema=False`` leaves writing ``_common_metadata`` (see
+    ``write_panel_schema``) to the caller.
+    """
+    table = _with_year(pa.Table.from_pandas(df, preserve_index=False))
+    root.mkdir(parents=True, exist_ok=True)
+    ds.write_dataset(
+        table, root, format="parquet",
+        partitioning=_partitioning(table.schema),
+        basename_template=f"{basename}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    if write_schema:
+        write_panel_schema(table.schema, root)
+    return table.schema
+
+
+def write_panel_schema(schema: pa.Schema, root: Path = PANEL_DATASET_DIR) -> Path:
+    """Write the dataset's full schema to ``root/_common_metadata``."""
+    path = root / SCHEMA_FILE
+    pq.write_metadata(schema, path)
+    return path
+
+
+@contextmanager
+def staged_dataset(root: Path = PANEL_DATASET_DIR) -> Iterator[Path]:
+    """
+    Yield an empty directory to write a new dataset into; it replaces
+    ``root`` only if the block completes, and is removed otherwise.
+    """
+    tmp_dir = root.with_name(f".{root.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    try:
+        yield tmp_dir
+        shutil.rmtree(root, ignore_errors=True)
+        os.replace(tmp_dir, root)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+def panel_dataset(root: Path = PANEL_DATASET_DIR) -> ds.Dataset:
+    """
+    The panel as an Arrow dataset.
+
+    The partitioned dataset when ``root`` holds one, otherwise the
+    single-file panel.
+    """
+    schema_path = root / SCHEMA_FILE
+    if schema_path.exists():
+        schema = pq.read_schema(schema_path)
+        for name in PANEL_PARTITIONS:
+            i = schema.get_field_index(name)
+            schema = schema.set(i, _path_field(schema.field(i)))
+        return ds.dataset(root, schema=schema, format="parquet",
+                          partitioning=_partitioning(schema))
+    if not PANEL_PATH.exists():
+        raise FileNotFoundError(
+            f"No analysis panel in {root} or {PANEL_PATH}; run src/data/process.py"
+        )
+    return ds.dataset(PANEL_PATH, format="parquet")
+
+
+def _expression(filters: Any) -> pc.Expression | None:
+    if filters is None or isinstance(filters, pc.Expression):
+        return filters
+    return pq.filters_to_expression(filters)
+
+
+def _sort_indices(table: pa.Table, keys: list[str]) -> pa.Array:
+    """Row order by ``keys``; Arrow cannot sort dictionary columns, so
+    those are compared by value."""
+    columns = {}
+    for k in keys:
+        col = table[k]
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        columns[k] = col
+    return pc.sort_indices(pa.table(columns), sort_keys=[(k, "ascending") for k in keys])
+
+
+def load_panel(
+    columns: Iterable[str] | None = None,
+    filters: Any = None,
+    sort: bool = True,
+    root: Path = PANEL_DATASET_DIR,
+) -> pd.DataFrame:
+    """
+    Read the analysis panel, or the part of it a caller needs.
+
+    Parameters
+    ----------
+    columns : columns to read (default: every panel column).  Columns the
+        panel lacks are skipped, as the model scripts use whichever
+        confounders and moderators exist.  ``year`` (a partition key) is
+        returned only when asked for.
+    filters : row predicate pushed into the scan, as
+        ``pyarrow.parquet.read_table`` filters (``[("region", "=", "NE")]``,
+        ``[("city", "in", cities)]``, DNF lists of those) or a
+        ``pyarrow.compute`` expression.  Predicates on ``region``, ``uf``
+        and ``year`` skip whole files.
+    sort : return rows ordered by (city, date), the order of the
+        single-file panel; otherwise in file order.
+
+    Categorical columns (and partition keys stored as categoricals) come
+    back with sorted categories, whichever files the rows came from.
+    """
+    dataset = panel_dataset(root)
+    names = dataset.schema.names
+    if columns is None:
+        wanted = [c for c in names if c != "year"]
+    else:
+        wanted = list(dict.fromkeys(c for c in columns if c in names))
+    keys = [k for k in SORT_KEYS if k in names] if sort else []
+    scan = wanted + [k for k in keys if k not in wanted]
+
+    table = dataset.to_table(columns=scan, filter=_expression(filters))
+    if keys:
+        table = table.take(_sort_indices(table, keys))
+    table = table.select(wanted)
+    source = root if (root / SCHEMA_FILE).exists() else PANEL_PATH
+    logger.info("Panel: %d rows x %d cols from %s", table.num_rows,
+                table.num_columns, source)
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    categorical = _categorical_partitions(root) if source == root else []
+    for col in df.columns:
+        if col in categorical:
+            df[col] = df[col].astype("category")
+        elif isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
+def _categorical_partitions(root: Path) -> list[str]:
+    """Partition keys whose stored type is a dictionary (pandas categorical)."""
+    schema = pq.read_schema(root / SCHEMA_FILE)
+    return [name for name in PANEL_PARTITIONS
+            if pa.types.is_dictionary(schema.field(name).type)]
+
+
+def write_panel_file(
+    root: Path = PANEL_DATASET_DIR,
+    path: Path = PANEL_PATH,
+    cities_per_batch: int = 64,
+) -> Path:
+    """
+    Write the dataset at ``root`` out as the single-file panel at ``path``.
+
+    Rows are read with ``load_panel`` a batch of cities at a time, in
+    (city, date) order, so the file matches the one the serial build
+    writes while only one batch is in memory.  Categorical columns get
+    the categories of the whole dataset in every batch, so all row
+    groups share one schema.  Written under a temporary name and renamed.
+    """
+    dataset = panel_dataset(root)
+    cities = sorted(pc.unique(dataset.to_table(columns=["city"])["city"]
+                              .combine_chunks()).to_pylist())
+    schema = pq.read_schema(root / SCHEMA_FILE)
+    dictionaries = [f.name for f in schema if pa.types.is_dictionary(f.type)]
+    table = dataset.to_table(columns=dictionaries)
+    categories = {}
+    for name in dictionaries:
+        column = table[name]       # partition keys come back as plain values
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        categories[name] = sorted(pc.unique(column).drop_null().to_pylist())
+    del table
+
+    tmp = path.with_name(path.name + ".tmp")
+    writer = None
+    try:
+        for i in range(0, len(cities), cities_per_batch):
+            batch = load_panel(filters=[("city", "in", cities[i:i + cities_per_batch])],
+                               root=root)
+            for name, values in categories.items():
+                batch[name] = batch[name].cat.set_categories(values)
+            table = pa.Table.from_pandas(
+                batch, schema=writer.schema if writer else None, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"No rows in {root}; {path} was not written")
+    os.replace(tmp, path)
+    return path
+
+
+def model_columns(
+    outcomes: Sequence[str],
+    treatment: str = TREATMENT_PM25,
+    extra: Sequence[str] = (),
+) -> list[str]:
+    """Panel columns the causal models read: Y, T, W, X plus ``extra``."""
+    return list(dict.fromkeys([*outcomes, treatment, *ALL_CONFOUNDERS,
+                               *HETEROGENEITY_MODERATORS, *extra]))
@@ -8,30 +8,51 @@ Pipeline:
     3. Filter health to respiratory CID codes (J*)
     4. Merge weather + air_quality + health on (city, date)
     5. Merge annual demographics and fleet (interpolated to daily)
-    6. Compute derived features (DTR, lags, moving averages, Fourier, etc.)
+    6. Compute the derived features the models use (DTR, Fourier, etc.)
     7. Construct treatment indicators (PM2.5 and O3 WHO exceedances)
     8. Apply quality filters
-    9. Save analysis_panel.parquet
+    9. Save analysis_panel.parquet and the dataset analysis_panel/ partitioned
+       by region/uf/year (+ per-stage memory and per-column dtype reports
+       in data/interim)
+
+With ``--shards`` steps 1-8 run per shard of cities (one state or one
+city each) in a process pool, and every shard is written straight into
+the partitioned dataset; the single file is then written from the
+dataset.
 
 Usage:
     python src/data/process.py
+    python src/data/process.py --lag-mode calendar   # lags in calendar days
+    python src/data/process.py --features pm25_lag1 pm25_ma7   # extra columns
+    python src/data/process.py --interpolation step   # annual values held per year
+    python src/data/process.py --trace-memory         # tracemalloc peaks per stage
+    python src/data/process.py --shards uf --workers 32   # per-state shards in parallel
+    python src/data/process.py --compact-dtypes       # categoricals, int8, float32
+    python src/data/process.py --stream-health        # out-of-core health aggregation
 """
 
 from __future__ import annotations
 
+import argparse
+import json
 import logging
+import multiprocessing
+import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    RAW_DIR,
     PROCESSED_DIR,
+    PANEL_DATASET_DIR,
+    PANEL_PARTITIONS,
     INTERIM_DIR,
     TABLES,
     ANALYSIS_START,
@@ -39,28 +60,68 @@ from src.utils.config import (
     WHO_PM25_THRESHOLD,
     WHO_O3_THRESHOLD,
     CID_RESPIRATORY,
+    HEALTH_AGG_COLUMNS,
     MAX_LAG_DAYS,
     MOVING_AVG_WINDOWS,
+    LAG_MODE,
+    ANNUAL_INTERPOLATION,
+    ANNUAL_ANCHOR,
+    STREAM_HEALTH,
+    COMPACT_PANEL_DTYPES,
+    PANEL_CATEGORICAL_COLUMNS,
+    PANEL_FLOAT64_COLUMNS,
     FOURIER_PERIODS,
     CAPITALS,
     REGION_ORDER,
+    ALL_CONFOUNDERS,
+    HETEROGENEITY_MODERATORS,
+    PANEL_EXTRA_FEATURES,
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data.features import FeatureRegistry, calendar_lag_features, lag_features
+from src.data.health_stream import respiratory_mask, stream_health
+from src.data.interpolate import INTERPOLATION_MODES, annual_to_daily
+from src.data.panel_join import join
+from src.data.panel_store import (
+    city_uf,
+    staged_dataset,
+    uf_region,
+    write_panel_dataset,
+    write_panel_file,
+    write_panel_schema,
+)
+from src.data.raw_store import list_raw_files, raw_path, read_raw
+from src.utils.memory import StageMemory, column_bytes, frame_mb
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("process")
 
+# Exposures that get lagged and moving-average versions
+LAG_VARIABLES = ["pm25", "o3", "temperature_mean"]
+
 
 # =========================================================================
 # 1. Load raw tables
 # =========================================================================
-def load_raw(table_key: str) -> pd.DataFrame:
-    """Load a raw Parquet file."""
+def load_raw(
+    table_key: str,
+    columns: list[str] | None = None,
+    cities: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Load a raw table (base Parquet file plus incremental fragments).
+
+    ``columns`` reads only those columns and ``cities`` only those cities'
+    rows (all by default).
+    """
     table_name = TABLES[table_key]
-    path = RAW_DIR / f"{table_name}.parquet"
-    logger.info("Loading %s", path)
-    df = pd.read_parquet(path)
+    files = list_raw_files(table_name)
+    logger.info("Loading %s (%d file%s%s)", raw_path(table_name),
+                len(files), "" if len(files) == 1 else "s",
+                "" if cities is None else f", {len(cities)} cities")
+    filters = None if cities is None else [("city", "in", list(cities))]
+    df = read_raw(table_name, columns=columns, filters=filters)
     logger.info("  -> %d rows x %d cols", len(df), len(df.columns))
     return df
 
@@ -69,9 +130,12 @@ def load_raw(table_key: str) -> pd.DataFrame:
 # 2-3. Pre-filter helper
 # =========================================================================
 def _parse_dates(df: pd.DataFrame, col: str = "date") -> pd.DataFrame:
-    """Parse date column to datetime and filter to analysis window."""
-    df = df.copy()
-    df[col] = pd.to_datetime(df[col], errors="coerce")
+    """Parse date column to datetime (in place) and filter to analysis window."""
+    if pd.api.types.is_datetime64_any_dtype(df[col]):
+        # Typed raw files (date32) arrive already parsed; only unify the unit
+        df[col] = df[col].astype("datetime64[ns]")
+    else:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
     mask = (df[col] >= ANALYSIS_START) & (df[col] <= ANALYSIS_END)
     before = len(df)
     df = df.loc[mask].reset_index(drop=True)
@@ -81,8 +145,7 @@ def _parse_dates(df: pd.DataFrame, col: str = "date") -> pd.DataFrame:
 
 def _filter_respiratory(health: pd.DataFrame) -> pd.DataFrame:
     """Keep only respiratory hospitalization rows."""
-    # cid_category uses descriptive names ("respiratory", "cardiovascular")
-    mask = health["cid_category"].str.lower().str.contains("respiratory", na=False)
+    mask = respiratory_mask(health["cid_category"])
     before = len(health)
     health = health.loc[mask].reset_index(drop=True)
     logger.info("  Respiratory filter: %d -> %d rows", before, len(health))
@@ -96,119 +159,89 @@ def merge_daily(
     weather: pd.DataFrame,
     air_quality: pd.DataFrame,
     health: pd.DataFrame,
+    health_aggregated: bool = False,
 ) -> pd.DataFrame:
     """
     Inner merge weather + air_quality + health on (city, date).
 
     Health is first aggregated by (city, date) across CID sub-categories
     to produce a single row per city-day with total respiratory admissions.
+    When extraction already pre-aggregated it (``HEALTH_DAILY_VIEW``) this
+    is a no-op; ``health_aggregated`` skips it for input that is known to
+    be aggregated (``stream_health``).
+
+    The inputs are consumed: when nothing else refers to them, each frame
+    is released as soon as it has been merged.
     """
     # Aggregate health to one row per city-date
-    health_agg_cols = [
-        "admissions", "admissions_age_0_14", "admissions_age_15_59",
-        "admissions_age_60_plus", "admissions_female", "admissions_male",
-        "deaths", "deaths_age_0_14", "deaths_age_15_59",
-        "deaths_age_60_plus", "deaths_female", "deaths_male",
-        "total_cost",
-    ]
-    health_grouped = (
-        health
-        .groupby(["city", "date", "ibge_code"], as_index=False)[health_agg_cols]
-        .sum()
-    )
+    if health_aggregated:
+        health_grouped = health
+    else:
+        health_grouped = (
+            health
+            .groupby(["city", "date", "ibge_code"], as_index=False, observed=True)
+            [HEALTH_AGG_COLUMNS]
+            .sum()
+        )
+    del health
     logger.info("Health aggregated to %d city-dates", len(health_grouped))
 
-    # Merge weather + air quality
-    daily = pd.merge(
-        weather, air_quality,
-        on=["city", "date"],
-        how="inner",
-        suffixes=("_wx", "_aq"),
-    )
+    # Merge weather + air quality (integer (city, date) keys; see panel_join.py)
+    daily = join(weather, air_quality, how="inner", suffixes=("_wx", "_aq"))
+    del weather, air_quality
     logger.info("Weather + AQ merge: %d rows", len(daily))
 
     # Merge with health
-    daily = pd.merge(
-        daily, health_grouped,
-        on=["city", "date"],
-        how="inner",
-    )
+    daily = join(daily, health_grouped, how="inner")
+    del health_grouped
     logger.info("+ Health merge: %d rows", len(daily))
+
+    # Typed raw files carry city as a categorical; the panel keeps plain
+    # labels so downstream groupby/map calls behave as before.
+    daily["city"] = daily["city"].astype(str)
     return daily
 
 
 # =========================================================================
 # 5. Merge annual tables (demographics + fleet)
 # =========================================================================
-def _interpolate_annual_to_daily(
-    annual_df: pd.DataFrame,
-    daily_dates: pd.DataFrame,
-    value_cols: list[str],
-    time_col: str = "year",
-) -> pd.DataFrame:
-    """
-    For each city, linearly interpolate annual values to daily resolution.
-
-    Parameters
-    ----------
-    annual_df : DataFrame with city, year, and value columns.
-    daily_dates : DataFrame with city, date (unique city-date pairs).
-    value_cols : columns to interpolate.
-
-    Returns
-    -------
-    DataFrame with city, date, and interpolated value columns.
-    """
-    daily_dates = daily_dates[["city", "date"]].drop_duplicates()
-    daily_dates["year"] = daily_dates["date"].dt.year
-
-    # Merge on year (floor) — gives the value at start of each year
-    merged = pd.merge(daily_dates, annual_df[["city", time_col] + value_cols],
-                       on=["city", time_col], how="left")
-
-    # For rows with missing values, try year+1 / year-1 fallback
-    # then forward-fill and back-fill within each city
-    for col in value_cols:
-        merged[col] = (
-            merged.groupby("city")[col]
-            .transform(lambda s: s.ffill().bfill())
-        )
-
-    return merged[["city", "date"] + value_cols]
-
-
 def merge_annual(
     daily: pd.DataFrame,
     demographics: pd.DataFrame,
     fleet: pd.DataFrame,
+    interpolation: str = ANNUAL_INTERPOLATION,
 ) -> pd.DataFrame:
-    """Attach annual demographics and fleet data to the daily panel."""
+    """
+    Attach annual demographics and fleet data to the daily panel.
+
+    Annual values are interpolated to each city-day (``interpolation``:
+    "linear", "step" or "spline"; see ``src/data/interpolate.py``) and
+    added to ``daily`` in place.
+    """
     # Demographics: one row per city-year
     demo_cols = [
         "population", "density", "pop_0_14", "pop_15_59", "pop_60_plus",
         "pop_female", "pop_male",
     ]
-    demo_interp = _interpolate_annual_to_daily(
-        demographics, daily, demo_cols, time_col="year"
-    )
-    daily = pd.merge(daily, demo_interp, on=["city", "date"], how="left")
-    logger.info("+ Demographics merge: %d rows", len(daily))
+    demo_interp = annual_to_daily(demographics, daily, demo_cols,
+                                  mode=interpolation, anchor=ANNUAL_ANCHOR)
+    daily[demo_cols] = demo_interp
+    logger.info("+ Demographics (%s): %d rows", interpolation, len(daily))
 
     # Fleet: aggregate months to year-level (take max of monthly fleet_total)
     fleet_yearly = (
         fleet
-        .groupby(["city", "year"], as_index=False)
+        .groupby(["city", "year"], as_index=False, observed=True)
         .agg({"fleet_total": "max", "fleet_automobile": "max",
                "fleet_motorcycle": "max", "fleet_bus": "max",
                "fleet_truck": "max"})
     )
     fleet_cols = ["fleet_total", "fleet_automobile", "fleet_motorcycle",
                   "fleet_bus", "fleet_truck"]
-    fleet_interp = _interpolate_annual_to_daily(
-        fleet_yearly, daily, fleet_cols, time_col="year"
-    )
-    daily = pd.merge(daily, fleet_interp, on=["city", "date"], how="left")
-    logger.info("+ Fleet merge: %d rows", len(daily))
+    fleet_interp = annual_to_daily(fleet_yearly, daily, fleet_cols,
+                                   mode=interpolation, anchor=ANNUAL_ANCHOR)
+    daily[fleet_cols] = fleet_interp
+    logger.info("+ Fleet (%s): %d rows", interpolation, len(daily))
 
     return daily
 
@@ -216,78 +249,152 @@ def merge_annual(
 # =========================================================================
 # 6. Derived features
 # =========================================================================
-def add_derived_features(df: pd.DataFrame) -> pd.DataFrame:
-    """Compute all derived features required for analysis."""
-    df = df.copy()
-    df = df.sort_values(["city", "date"]).reset_index(drop=True)
+def derived_feature_registry(lag_mode: str = LAG_MODE) -> FeatureRegistry:
+    """
+    Every derived column the panel can carry, with its inputs.
+
+    ``lag_mode`` selects row-based or calendar-day lags and moving
+    averages (see ``config.LAG_MODE``).  All builders expect the frame
+    sorted by (city, date).
+    """
+    if lag_mode == "calendar":
+        lagger = calendar_lag_features
+    elif lag_mode == "rows":
+        lagger = lag_features
+    else:
+        raise ValueError(f"Unknown lag mode '{lag_mode}'")
+
+    registry = FeatureRegistry()
 
     # --- Diurnal temperature range ---
-    df["dtr"] = df["temperature_max"] - df["temperature_min"]
-
-    # --- Lagged exposures (within each city) ---
-    for lag in range(1, MAX_LAG_DAYS + 1):
-        for var in ["pm25", "o3", "temperature_mean"]:
-            col_name = f"{var}_lag{lag}"
-            df[col_name] = df.groupby("city")[var].shift(lag)
-
-    # --- Moving averages ---
-    for window in MOVING_AVG_WINDOWS:
-        for var in ["pm25", "o3", "temperature_mean"]:
-            col_name = f"{var}_ma{window}"
-            df[col_name] = (
-                df.groupby("city")[var]
-                .transform(lambda s: s.rolling(window, min_periods=1).mean())
-            )
+    @registry.register(["dtr"], ["temperature_max", "temperature_min"])
+    def _dtr(df, columns):
+        return {"dtr": df["temperature_max"] - df["temperature_min"]}
+
+    # --- Lagged exposures and moving averages (within each city) ---
+    # One batched pass per variable over the sorted frame; see features.py
+    for var in LAG_VARIABLES:
+        lag_cols = {f"{var}_lag{k}": k for k in range(1, MAX_LAG_DAYS + 1)}
+        ma_cols = {f"{var}_ma{w}": w for w in MOVING_AVG_WINDOWS}
+
+        @registry.register([*lag_cols, *ma_cols], ["city", "date", var])
+        def _lags(df, columns, var=var, lag_cols=lag_cols, ma_cols=ma_cols):
+            lags = [lag_cols[c] for c in columns if c in lag_cols]
+            windows = [ma_cols[c] for c in columns if c in ma_cols]
+            return lagger(df, [var], lags, windows)
 
     # --- Fourier terms for seasonality ---
-    day_of_year = df["date"].dt.dayofyear
+    fourier = {}
     for i, period in enumerate(FOURIER_PERIODS):
         suffix = "annual" if i == 0 else "semiannual"
-        df[f"sin_{suffix}"] = np.sin(2 * np.pi * day_of_year / period)
-        df[f"cos_{suffix}"] = np.cos(2 * np.pi * day_of_year / period)
-
-    # --- Day of week dummies ---
-    dow = df["date"].dt.dayofweek  # 0=Monday
-    for d in range(1, 7):  # Monday is reference
-        df[f"dow_{d}"] = (dow == d).astype(int)
+        fourier[f"sin_{suffix}"] = (np.sin, period)
+        fourier[f"cos_{suffix}"] = (np.cos, period)
+
+    @registry.register(fourier, ["date"])
+    def _fourier(df, columns):
+        day_of_year = df["date"].dt.dayofyear.to_numpy()
+        return {
+            col: fourier[col][0](2 * np.pi * day_of_year / fourier[col][1])
+            for col in columns
+        }
+
+    # --- Day of week dummies (Monday is reference) ---
+    @registry.register([f"dow_{d}" for d in range(1, 7)], ["date"])
+    def _dow(df, columns):
+        dow = df["date"].dt.dayofweek.to_numpy()  # 0=Monday
+        return {col: (dow == int(col[4:])).astype(int) for col in columns}
 
     # --- Linear trend (days since start) ---
-    start_date = pd.Timestamp(ANALYSIS_START)
-    df["trend"] = (df["date"] - start_date).dt.days
+    @registry.register(["trend"], ["date"])
+    def _trend(df, columns):
+        return {"trend": (df["date"] - pd.Timestamp(ANALYSIS_START)).dt.days}
 
     # --- Fleet per capita ---
-    df["fleet_per_capita"] = np.where(
-        df["population"].notna() & (df["population"] > 0),
-        df["fleet_total"] / df["population"] * 1000,  # per 1000 inhabitants
-        np.nan,
-    )
+    @registry.register(["fleet_per_capita"], ["population", "fleet_total"])
+    def _fleet_per_capita(df, columns):
+        return {"fleet_per_capita": np.where(
+            df["population"].notna() & (df["population"] > 0),
+            df["fleet_total"] / df["population"] * 1000,  # per 1000 inhabitants
+            np.nan,
+        )}
 
     # --- Population density (computed from population / known city area) ---
-    city_area = {city: meta["area_km2"] for city, meta in CAPITALS.items()}
-    df["city_area_km2"] = df["city"].map(city_area)
-    df["pop_density"] = np.where(
-        df["population"].notna() & (df["population"] > 0) & df["city_area_km2"].notna(),
-        df["population"] / df["city_area_km2"],
-        np.nan,
-    )
+    @registry.register(["city_area_km2"], ["city"])
+    def _city_area(df, columns):
+        city_area = {city: meta["area_km2"] for city, meta in CAPITALS.items()}
+        return {"city_area_km2": df["city"].map(city_area).astype(float)}
+
+    @registry.register(["pop_density"], ["population", "city_area_km2"])
+    def _pop_density(df, columns):
+        return {"pop_density": np.where(
+            df["population"].notna() & (df["population"] > 0)
+            & df["city_area_km2"].notna(),
+            df["population"] / df["city_area_km2"],
+            np.nan,
+        )}
 
     # --- Percent female (proxy for demographic structure) ---
-    df["pct_female"] = np.where(
-        df["population"].notna() & (df["population"] > 0)
-        & df["pop_female"].notna(),
-        df["pop_female"] / df["population"],
-        np.nan,
-    )
-
-    # --- Region dummies ---
-    city_to_region = {city: meta["region"] for city, meta in CAPITALS.items()}
-    df["region"] = df["city"].map(city_to_region)
-    for r in REGION_ORDER:
-        df[f"region_{r}"] = (df["region"] == r).astype(int)
+    @registry.register(["pct_female"], ["population", "pop_female"])
+    def _pct_female(df, columns):
+        return {"pct_female": np.where(
+            df["population"].notna() & (df["population"] > 0)
+            & df["pop_female"].notna(),
+            df["pop_female"] / df["population"],
+            np.nan,
+        )}
+
+    # --- Region label and dummies ---
+    @registry.register(["region"], ["uf"])
+    def _region(df, columns):
+        return {"region": uf_region(df["uf"])}
+
+    @registry.register([f"region_{r}" for r in REGION_ORDER], ["region"])
+    def _region_dummies(df, columns):
+        region = df["region"].to_numpy()
+        return {col: (region == col[len("region_"):]).astype(int) for col in columns}
+
+    # --- UF mapping (capitals by name, other municipalities by IBGE code) ---
+    @registry.register(["uf"], ["city", "ibge_code"])
+    def _uf(df, columns):
+        return {"uf": city_uf(df["city"], df["ibge_code"])}
+
+    return registry
+
+
+def panel_features(extra: list[str] | None = None) -> list[str]:
+    """Derived columns the panel needs: model inputs plus ``extra``."""
+    partition_keys = [c for c in PANEL_PARTITIONS if c != "year"]   # year: from date
+    requested = (ALL_CONFOUNDERS + HETEROGENEITY_MODERATORS + PANEL_EXTRA_FEATURES
+                 + partition_keys)
+    return list(dict.fromkeys(requested + list(extra or [])))
+
+
+def add_derived_features(
+    df: pd.DataFrame,
+    lag_mode: str = LAG_MODE,
+    extra: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Compute the derived features the analysis uses.
+
+    Only the columns named in ``config.ALL_CONFOUNDERS``,
+    ``config.HETEROGENEITY_MODERATORS`` and ``config.PANEL_EXTRA_FEATURES``,
+    plus ``extra`` (e.g. ``["pm25_lag1", "pm25_ma7"]``), are built, along
+    with whatever they are derived from; see ``derived_feature_registry``
+    for everything available.  ``df`` is sorted by (city, date) (a new
+    frame only if it was not already in that order) and the features are
+    added in place.
+    """
+    # Merged frames usually arrive in (city, date) order already; only
+    # reorder (a full copy) when they do not.
+    cities = pd.factorize(df["city"], sort=True)[0]
+    order = np.lexsort((df["date"].to_numpy(), cities))
+    if not np.array_equal(order, np.arange(len(df))):
+        df = df.take(order)
+    df = df.reset_index(drop=True)
 
-    # --- UF mapping ---
-    city_to_uf = {city: meta["uf"] for city, meta in CAPITALS.items()}
-    df["uf"] = df["city"].map(city_to_uf)
+    registry = derived_feature_registry(lag_mode)
+    df = registry.build(df, panel_features(extra))
 
     logger.info("Derived features added: %d columns total", len(df.columns))
     return df
@@ -297,8 +404,7 @@ def add_derived_features(df: pd.DataFrame) -> pd.DataFrame:
 # 7. Treatment indicators
 # =========================================================================
 def add_treatments(df: pd.DataFrame) -> pd.DataFrame:
-    """Add binary treatment indicators."""
-    df = df.copy()
+    """Add binary treatment indicators (in place)."""
     df["pm25_exceed"] = (df["pm25"] > WHO_PM25_THRESHOLD).astype(int)
     df["o3_exceed"] = (df["o3"] > WHO_O3_THRESHOLD).astype(int)
     logger.info(
@@ -329,7 +435,7 @@ def apply_quality_filters(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("Quality filter: %d -> %d rows (dropped %d)", before, after, before - after)
 
     # Log per-city summary
-    city_counts = df.groupby("city").size()
+    city_counts = df.groupby("city", observed=True).size()
     if len(city_counts) > 0:
         logger.info("Cities remaining: %d, days range: %d - %d",
                     len(city_counts), int(city_counts.min()), int(city_counts.max()))
@@ -341,86 +447,434 @@ def apply_quality_filters(df: pd.DataFrame) -> pd.DataFrame:
 # =========================================================================
 # 9. Save
 # =========================================================================
-def save_panel(df: pd.DataFrame) -> Path:
-    """Save the analysis panel to Parquet."""
-    out_path = PROCESSED_DIR / "analysis_panel.parquet"
-    df.to_parquet(out_path, index=False, engine="pyarrow")
-    size_mb = out_path.stat().st_size / 1024 / 1024
-    logger.info("Saved %s (%.2f MB, %d rows x %d cols)",
-                out_path, size_mb, len(df), len(df.columns))
+def compact_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Narrow the panel's dtypes (in place).
 
-    # Also save a lightweight summary
-    summary_path = INTERIM_DIR / "panel_summary.json"
-    summary = {
+    ``PANEL_CATEGORICAL_COLUMNS`` become categoricals, integer columns
+    the narrowest integer type holding their values (0/1 dummies int8)
+    and float64 columns float32, except ``PANEL_FLOAT64_COLUMNS``.
+    Counts (``HEALTH_AGG_COLUMNS``) stay at least int32: they are summed
+    downstream, where int8/int16 would silently wrap.
+    """
+    for col in df.columns:
+        dtype = df[col].dtype
+        if col in PANEL_CATEGORICAL_COLUMNS:
+            if not isinstance(dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        elif isinstance(dtype, np.dtype) and dtype.kind in "iu":
+            narrow = pd.to_numeric(df[col], downcast="integer")
+            if col in HEALTH_AGG_COLUMNS:
+                narrow = narrow.astype(np.promote_types(narrow.dtype, np.int32))
+            df[col] = narrow
+        elif dtype == np.float64 and col not in PANEL_FLOAT64_COLUMNS:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+def dtype_stats(df: pd.DataFrame) -> dict[str, tuple[str, int]]:
+    """``{column: (dtype, bytes)}`` of (a shard of) the panel."""
+    sizes = column_bytes(df)
+    return {col: (str(df[col].dtype), sizes[col]) for col in df.columns}
+
+
+def write_dtype_report(parts: list[tuple[dict, dict]], compact: bool) -> Path:
+    """
+    Bytes per column before and after ``compact_dtypes``, as JSON.
+
+    ``parts`` holds one ``(before, after)`` pair of ``dtype_stats`` per
+    shard (one for a serial build); bytes are summed over shards.
+    """
+    columns: dict[str, dict] = {}
+    for before, after in parts:
+        for col, (dtype, size) in before.items():
+            entry = columns.setdefault(col, {"dtype_before": set(), "dtype_after": set(),
+                                             "bytes_before": 0, "bytes_after": 0})
+            entry["dtype_before"].add(dtype)
+            entry["bytes_before"] += size
+            entry["dtype_after"].add(after[col][0])
+            entry["bytes_after"] += after[col][1]
+    for entry in columns.values():
+        for key in ("dtype_before", "dtype_after"):
+            entry[key] = "/".join(sorted(entry[key]))
+
+    mb_before = sum(e["bytes_before"] for e in columns.values()) / 1024 / 1024
+    mb_after = sum(e["bytes_after"] for e in columns.values()) / 1024 / 1024
+    dataset_mb = sum(f.stat().st_size for f in PANEL_DATASET_DIR.rglob("*.parquet")) / 1024 / 1024
+    report = {
+        "compact": compact,
+        "memory_mb_before": round(mb_before, 2),
+        "memory_mb_after": round(mb_after, 2),
+        "dataset_mb": round(dataset_mb, 2),
+        "columns": columns,
+    }
+    report_path = INTERIM_DIR / "panel_dtypes.json"
+    report_path.write_text(json.dumps(report, indent=2))
+    logger.info("Panel in memory: %.1f MB -> %.1f MB%s; dtype report saved to %s",
+                mb_before, mb_after, "" if compact else " (compact dtypes off)",
+                report_path)
+    return report_path
+
+
+def summary_stats(df: pd.DataFrame) -> dict:
+    """Additive statistics of (a shard of) the panel for ``write_summary``."""
+    return {
         "n_rows": int(len(df)),
-        "n_cols": int(len(df.columns)),
-        "n_cities": int(df["city"].nunique()),
-        "date_range": [str(df["date"].min().date()), str(df["date"].max().date())],
         "columns": list(df.columns),
-        "pm25_exceed_pct": float(round(100 * df["pm25_exceed"].mean(), 2)),
-        "o3_exceed_pct": float(round(100 * df["o3_exceed"].mean(), 2)),
-        "mean_admissions": float(round(df["admissions"].mean(), 2)),
-        "cities": sorted(df["city"].unique().tolist()),
+        "cities": df["city"].unique().tolist(),
+        "date_min": df["date"].min() if len(df) else None,
+        "date_max": df["date"].max() if len(df) else None,
+        "pm25_exceed": int(df["pm25_exceed"].sum()),
+        "o3_exceed": int(df["o3_exceed"].sum()),
+        "admissions_sum": float(df["admissions"].sum()),
+        "admissions_n": int(df["admissions"].count()),
+    }
+
+
+def write_summary(parts: list[dict]) -> Path:
+    """Combine ``summary_stats`` of the whole panel or its shards into JSON."""
+    parts = [p for p in parts if p["n_rows"]]
+    n_rows = sum(p["n_rows"] for p in parts)
+    cities = sorted({city for p in parts for city in p["cities"]})
+    summary_path = INTERIM_DIR / "panel_summary.json"
+    summary = {
+        "n_rows": n_rows,
+        "n_cols": len(parts[0]["columns"]) if parts else 0,
+        "n_cities": len(cities),
+        "date_range": [str(min(p["date_min"] for p in parts).date()),
+                       str(max(p["date_max"] for p in parts).date())] if parts else None,
+        "columns": parts[0]["columns"] if parts else [],
+        "pm25_exceed_pct": round(100 * sum(p["pm25_exceed"] for p in parts) / n_rows, 2)
+                           if n_rows else None,
+        "o3_exceed_pct": round(100 * sum(p["o3_exceed"] for p in parts) / n_rows, 2)
+                         if n_rows else None,
+        "mean_admissions": round(sum(p["admissions_sum"] for p in parts)
+                                 / max(sum(p["admissions_n"] for p in parts), 1), 2),
+        "cities": cities,
     }
-    import json
     summary_path.write_text(json.dumps(summary, indent=2, ensure_ascii=False))
     logger.info("Summary saved to %s", summary_path)
+    return summary_path
+
+
+def save_panel(df: pd.DataFrame, compact: bool = COMPACT_PANEL_DTYPES) -> Path:
+    """Save the analysis panel to Parquet, with compact dtypes if ``compact``."""
+    before = dtype_stats(df)
+    if compact:
+        compact_dtypes(df)
+
+    out_path = PROCESSED_DIR / "analysis_panel.parquet"
+    df.to_parquet(out_path, index=False, engine="pyarrow")
+    size_mb = out_path.stat().st_size / 1024 / 1024
+    logger.info("Saved %s (%.2f MB, %d rows x %d cols)",
+                out_path, size_mb, len(df), len(df.columns))
+
+    with staged_dataset() as tmp_dir:
+        write_panel_dataset(df, tmp_dir)
+    logger.info("Saved %s (partitioned by %s)", PANEL_DATASET_DIR,
+                "/".join(PANEL_PARTITIONS))
 
+    write_dtype_report([(before, dtype_stats(df))], compact)
+
+    # Also save a lightweight summary
+    write_summary([summary_stats(df)])
     return out_path
 
 
 # =========================================================================
-# Main
+# Panel build
 # =========================================================================
-def main() -> None:
-    t0 = time.time()
-
-    # 1. Load
-    weather = load_raw("weather")
-    air_quality = load_raw("air_quality")
-    health = load_raw("health")
-    demographics = load_raw("demographics")
-    fleet = load_raw("fleet")
-
-    # 2-3. Date filter + respiratory filter
-    weather = _parse_dates(weather)
-    air_quality = _parse_dates(air_quality)
-    health = _parse_dates(health)
-    health = _filter_respiratory(health)
-
-    # Demographics / fleet: filter years relevant to analysis
-    demographics["year"] = demographics["year"].astype(int)
-    fleet["year"] = fleet["year"].astype(int)
+def _load_annual(table_key: str, cities: list[str] | None = None) -> pd.DataFrame:
+    """Load an annual table restricted to the years interpolation needs."""
+    df = load_raw(table_key, cities=cities)
+    df["year"] = df["year"].astype(int)
     start_year = int(ANALYSIS_START[:4]) - 1   # one year before for interpolation
     end_year = int(ANALYSIS_END[:4]) + 1
-    demographics = demographics[
-        (demographics["year"] >= start_year) & (demographics["year"] <= end_year)
-    ].reset_index(drop=True)
-    fleet = fleet[
-        (fleet["year"] >= start_year) & (fleet["year"] <= end_year)
-    ].reset_index(drop=True)
+    return df[(df["year"] >= start_year) & (df["year"] <= end_year)].reset_index(drop=True)
 
-    # 4. Merge daily
-    panel = merge_daily(weather, air_quality, health)
 
-    # 5. Merge annual
-    panel = merge_annual(panel, demographics, fleet)
+def build_panel(
+    memory: StageMemory,
+    cities: list[str] | None = None,
+    lag_mode: str = LAG_MODE,
+    extra_features: list[str] | None = None,
+    interpolation: str = ANNUAL_INTERPOLATION,
+    streaming: bool = STREAM_HEALTH,
+) -> pd.DataFrame:
+    """
+    Steps 1-8 for all cities, or only ``cities`` (one shard).
+
+    Every step after loading works city by city, so building shards
+    separately and concatenating them gives the same rows as one build.
+    With ``streaming`` the health table is aggregated batch by batch
+    (``stream_health``) instead of being loaded whole.
+    """
+    # Each stage takes ownership of its input frames: they are handed over
+    # with dict.pop, so once a stage has replaced a frame nothing keeps the
+    # earlier version alive.
+    frames: dict[str, pd.DataFrame] = {}
+
+    # 1-3. Load daily tables, date filter + respiratory filter
+    with memory.stage("load_daily") as rec:
+        frames["weather"] = _parse_dates(load_raw("weather", cities=cities))
+        frames["air_quality"] = _parse_dates(load_raw("air_quality", cities=cities))
+        if streaming:
+            frames["health"] = stream_health(cities)
+        else:
+            # Health: only what the respiratory filter and aggregation read
+            health_cols = ["city", "date", "ibge_code", "cid_category", *HEALTH_AGG_COLUMNS]
+            frames["health"] = _filter_respiratory(
+                _parse_dates(load_raw("health", health_cols, cities=cities)))
+        rec["frame_mb"] = sum(frame_mb(df) for df in frames.values())
+
+    # 4. Merge daily
+    with memory.stage("merge_daily") as rec:
+        frames["panel"] = merge_daily(frames.pop("weather"), frames.pop("air_quality"),
+                                      frames.pop("health"), health_aggregated=streaming)
+        rec["frame_mb"] = frame_mb(frames["panel"])
+
+    # 5. Merge annual (demographics / fleet: years relevant to analysis)
+    with memory.stage("merge_annual") as rec:
+        frames["panel"] = merge_annual(frames.pop("panel"),
+                                       _load_annual("demographics", cities),
+                                       _load_annual("fleet", cities),
+                                       interpolation=interpolation)
+        rec["frame_mb"] = frame_mb(frames["panel"])
 
     # 6. Derived features
-    panel = add_derived_features(panel)
+    with memory.stage("derived_features") as rec:
+        frames["panel"] = add_derived_features(frames.pop("panel"), lag_mode=lag_mode,
+                                               extra=extra_features)
+        rec["frame_mb"] = frame_mb(frames["panel"])
 
     # 7. Treatment indicators
-    panel = add_treatments(panel)
+    with memory.stage("treatments") as rec:
+        frames["panel"] = add_treatments(frames.pop("panel"))
+        rec["frame_mb"] = frame_mb(frames["panel"])
 
     # 8. Quality filters
-    panel = apply_quality_filters(panel)
+    with memory.stage("quality_filters") as rec:
+        frames["panel"] = apply_quality_filters(frames.pop("panel"))
+        rec["frame_mb"] = frame_mb(frames["panel"])
+
+    return frames.pop("panel")
 
-    # 9. Save
-    save_panel(panel)
+
+# =========================================================================
+# Sharded build
+# =========================================================================
+
+def plan_shards(by: str = "uf") -> dict[str, tuple[str, list[str]]]:
+    """
+    Group the cities in the raw health table into shards.
+
+    ``by="uf"`` puts each state's cities in one shard (municipality
+    panels); ``by="city"`` gives every city its own shard.  Returns
+    ``{shard name: (uf, cities)}``; shards are named by UF or by IBGE
+    code.
+    """
+    if by not in ("uf", "city"):
+        raise ValueError(f"Unknown shard key '{by}'")
+    pairs = (
+        read_raw(TABLES["health"], columns=["city", "ibge_code"])
+        .astype(str)
+        .drop_duplicates("city")
+    )
+    ufs = city_uf(pairs["city"], pairs["ibge_code"]).fillna("NA")
+    shards: dict[str, tuple[str, list[str]]] = {}
+    for city, ibge, uf in zip(pairs["city"], pairs["ibge_code"], ufs):
+        name = uf if by == "uf" else ibge
+        shards.setdefault(name, (uf, []))[1].append(city)
+    return dict(sorted(shards.items()))
+
+
+def build_shard(
+    name: str,
+    uf: str,
+    cities: list[str],
+    out_dir: Path,
+    options: dict,
+    compact: bool = COMPACT_PANEL_DTYPES,
+) -> dict:
+    """
+    Build one shard and write it into the dataset at ``out_dir``.
+
+    Runs in a worker process; files are named ``part-<name>-<i>.parquet``.
+    Returns the shard's ``summary_stats`` plus its memory records,
+    ``dtype_stats`` before and after compacting, and Arrow schema (the
+    caller writes ``_common_metadata`` once).
+    """
+    memory = StageMemory()
+    panel = build_panel(memory, cities=cities, **options)
+    before = dtype_stats(panel)
+    if compact:
+        compact_dtypes(panel)
+    schema = None
+    if len(panel):
+        with memory.stage("save"):
+            schema = write_panel_dataset(panel, out_dir, basename=f"part-{name}",
+                                         write_schema=False)
+    stats = summary_stats(panel)
+    stats["memory"] = memory.records
+    stats["dtypes"] = (before, dtype_stats(panel))
+    stats["schema"] = schema
+    return stats
+
+
+def build_sharded(
+    by: str = "uf",
+    workers: int | None = None,
+    trace_memory: bool = False,
+    compact: bool = COMPACT_PANEL_DTYPES,
+    **options,
+) -> Path:
+    """
+    Build the panel shard by shard in a process pool.
+
+    Each worker reads only its shard's cities from the raw files, runs
+    steps 1-8 and writes its rows straight into the ``PANEL_DATASET_DIR``
+    dataset.  The dataset is assembled in a temporary directory and
+    swapped in once every shard has succeeded, then rewritten a batch of
+    cities at a time as ``analysis_panel.parquet``, so both outputs equal
+    those of the serial build.  With compact
+    dtypes each shard narrows its own integers, so the dataset schema
+    takes the widest type of every column.
+    """
+    memory = StageMemory(trace=trace_memory)
+    with memory.stage("plan_shards"):
+        shards = plan_shards(by)
+    workers = min(workers or os.cpu_count() or 1, len(shards)) or 1
+    logger.info("Building %d shards (by %s) with %d workers",
+                len(shards), by, workers)
+
+    results: dict[str, dict] = {}
+    with staged_dataset() as tmp_dir, memory.stage("shards"):
+        # spawn: workers must not inherit Arrow's thread pools via fork
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {
+                pool.submit(build_shard, name, uf, cities, tmp_dir, options, compact): name
+                for name, (uf, cities) in shards.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                results[name] = future.result()
+                logger.info("  shard %s: %d rows (%d/%d done)", name,
+                            results[name]["n_rows"], len(results), len(shards))
+        schemas = [r.pop("schema") for _, r in sorted(results.items())]
+        schemas = [sc for sc in schemas if sc is not None]
+        if not schemas:
+            raise ValueError("No rows in any shard; the panel dataset was not replaced")
+        write_panel_schema(pa.unify_schemas(schemas, promote_options="permissive"),
+                           tmp_dir)
+
+    n_rows = sum(r["n_rows"] for r in results.values())
+    logger.info("Saved %s (%d shards, %d rows)", PANEL_DATASET_DIR, len(results), n_rows)
+    with memory.stage("save_file"):
+        out_path = write_panel_file()
+    logger.info("Saved %s (%.2f MB)", out_path, out_path.stat().st_size / 1024 / 1024)
+    write_dtype_report([r.pop("dtypes") for _, r in sorted(results.items())], compact)
+    write_summary([results[name] for name in sorted(results)])
+    memory.write(INTERIM_DIR / "process_memory.json", rows=n_rows, shard_by=by,
+                 workers=workers,
+                 shards={name: r.pop("memory") for name, r in sorted(results.items())})
+    return PANEL_DATASET_DIR
+
+
+# =========================================================================
+# Main
+# =========================================================================
+def main(
+    lag_mode: str = LAG_MODE,
+    extra_features: list[str] | None = None,
+    interpolation: str = ANNUAL_INTERPOLATION,
+    trace_memory: bool = False,
+    shard_by: str | None = None,
+    workers: int | None = None,
+    compact: bool = COMPACT_PANEL_DTYPES,
+    stream: bool = STREAM_HEALTH,
+) -> None:
+    t0 = time.time()
+    options = dict(lag_mode=lag_mode, extra_features=extra_features,
+                   interpolation=interpolation, streaming=stream)
+
+    if shard_by is not None:
+        build_sharded(shard_by, workers, trace_memory=trace_memory, compact=compact,
+                      **options)
+    else:
+        memory = StageMemory(trace=trace_memory)
+        panel = build_panel(memory, **options)
+
+        # 9. Save
+        with memory.stage("save"):
+            save_panel(panel, compact=compact)
+        memory.write(INTERIM_DIR / "process_memory.json",
+                     rows=len(panel), columns=len(panel.columns),
+                     panel_mb=round(frame_mb(panel), 1))
 
     elapsed = time.time() - t0
     logger.info("Processing complete in %.1f s.", elapsed)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the analysis panel")
+    parser.add_argument(
+        "--lag-mode",
+        choices=["rows", "calendar"],
+        default=LAG_MODE,
+        help="Lag/moving-average axis: observed rows or calendar days "
+             "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--interpolation",
+        choices=INTERPOLATION_MODES,
+        default=ANNUAL_INTERPOLATION,
+        help="Annual-to-daily interpolation of demographics and fleet "
+             "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also record Python/NumPy allocation peaks per stage with "
+             "tracemalloc (slower)",
+    )
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        default=[],
+        metavar="COLUMN",
+        help="Extra derived columns to build beyond the model inputs, "
+             "e.g. pm25_lag1 pm25_ma7",
+    )
+    parser.add_argument(
+        "--shards",
+        choices=["uf", "city"],
+        default=None,
+        help="Build per-state or per-city shards in parallel and write the "
+             "partitioned dataset analysis_panel/ instead of one file",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for --shards (default: CPU count)",
+    )
+    parser.add_argument(
+        "--compact-dtypes",
+        action=argparse.BooleanOptionalAction,
+        default=COMPACT_PANEL_DTYPES,
+        help="Save identifiers as categoricals, integers in the narrowest "
+             "type and most floats as float32 (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stream-health",
+        action=argparse.BooleanOptionalAction,
+        default=STREAM_HEALTH,
+        help="Aggregate the raw health table batch by batch instead of "
+             "loading it whole (default: %(default)s)",
+    )
+    args = parser.parse_args()
+    main(lag_mode=args.lag_mode, extra_features=args.features,
+         interpolation=args.interpolation, trace_memory=args.trace_memory,
+         shard_by=args.shards, workers=args.workers, compact=args.compact_dtypes,
+         stream=args.stream_health)
@@ -0,0 +1,289 @@
+"""
+On-disk layout of the raw extracts in ``data/raw/``.
+
+Each table is stored as a base file written by a full extraction,
+``data/raw/<table>.parquet``, plus zero or more append-only fragments
+written by incremental runs, ``data/raw/fragments/<table>/part-*.parquet``.
+Readers should go through ``read_raw`` so fragments are never missed.
+Fragments are append-only; ``compact`` folds them into the base file and
+is where uniqueness on ``config.TABLE_KEYS`` is enforced.
+
+``data/raw/extract_manifest.json`` records per-table extraction state
+(high-water marks, row counts, timestamps).
+
+Extractions in progress write committed chunks and a ``checkpoint.json``
+to ``data/raw/.staging/<table>-<fingerprint>/`` so an interrupted run can
+resume; the directory is removed once the final file is in place.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections.abc import Callable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.utils.config import RAW_DIR, TABLE_KEYS
+
+logger = logging.getLogger("raw_store")
+
+MANIFEST_PATH = RAW_DIR / "extract_manifest.json"
+STAGING_DIR = RAW_DIR / ".staging"
+
+
+def raw_path(table_name: str) -> Path:
+    """Path of the base Parquet file for ``table_name``."""
+    return RAW_DIR / f"{table_name}.parquet"
+
+
+def fragment_dir(table_name: str) -> Path:
+    """Directory holding the incremental fragments for ``table_name``."""
+    return RAW_DIR / "fragments" / table_name
+
+
+def list_raw_files(table_name: str) -> list[Path]:
+    """Base file (if present) followed by fragments in write order."""
+    files = [raw_path(table_name)] if raw_path(table_name).exists() else []
+    frag_dir = fragment_dir(table_name)
+    if frag_dir.exists():
+        files.extend(sorted(frag_dir.glob("part-*.parquet")))
+    return files
+
+
+def read_raw(
+    table_name: str,
+    columns: list[str] | None = None,
+    filters: list[tuple[str, str, Any]] | None = None,
+) -> pd.DataFrame:
+    """
+    Read the base file and every fragment into one DataFrame.
+
+    ``columns`` restricts the read to those columns (Parquet projection),
+    e.g. only the key columns when looking for gaps.  ``filters`` keeps
+    only matching rows, as ``pyarrow.parquet.read_table`` filters, e.g.
+    ``[("city", "in", cities)]`` for one shard of the panel build.
+
+    Files are concatenated in Arrow, so dictionary-encoded columns become
+    a single pandas categorical (with sorted categories), and ``date32``
+    columns are returned as ``datetime64`` rather than Python ``date``
+    objects.  Files written
+    before the typed schemas existed fall back to a pandas concat.
+    """
+    files = list_raw_files(table_name)
+    if not files:
+        raise FileNotFoundError(f"No raw data for {table_name} in {RAW_DIR}")
+    tables = [pq.read_table(f, columns=columns, filters=filters) for f in files]
+    try:
+        table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    except pa.ArrowInvalid:
+        return pd.concat(
+            [t.to_pandas(date_as_object=False) for t in tables],
+            ignore_index=True,
+        )
+    # Convert column by column and free each Arrow column once converted,
+    # so the read peaks near one copy of the data instead of two.
+    del tables
+    df = table.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+    del table
+    pa.default_memory_pool().release_unused()
+    # Dictionaries come back in order of first appearance; sort them so
+    # groupby/sort order matches that of plain string columns.
+    for col in df.select_dtypes("category").columns:
+        df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return df
+
+
+def iter_raw_batches(
+    table_name: str,
+    columns: list[str] | None = None,
+    filters: Any = None,
+    batch_size: int = 1_000_000,
+) -> Iterator[pa.RecordBatch]:
+    """
+    Stream the base file and every fragment as record batches.
+
+    For tables too large to load at once: only a batch or two is in
+    memory at a time.  ``filters`` (``read_table``-style tuples or a
+    ``pyarrow.compute`` expression) are pushed into the scan, so row
+    groups whose statistics exclude them are never decoded.  Each file
+    is scanned with its own schema, so dictionaries and types may differ
+    between batches of different files; ``filters`` may also be a
+    callable that takes a file's schema and returns the expression (or
+    None) to scan that file with.
+    """
+    files = list_raw_files(table_name)
+    if not files:
+        raise FileNotFoundError(f"No raw data for {table_name} in {RAW_DIR}")
+    if filters is not None and not isinstance(filters, (pc.Expression, Callable)):
+        filters = pq.filters_to_expression(filters)
+    for f in files:
+        dataset = ds.dataset(f, format="parquet")
+        expr = filters(dataset.schema) if callable(filters) else filters
+        yield from dataset.to_batches(
+            columns=columns, filter=expr, batch_size=batch_size,
+            batch_readahead=1, fragment_readahead=1,
+        )
+
+
+def new_fragment_path(table_name: str) -> Path:
+    """Path for the next fragment of ``table_name`` (timestamp-ordered)."""
+    frag_dir = fragment_dir(table_name)
+    frag_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    return frag_dir / f"part-{stamp}.parquet"
+
+
+def append_fragment(table: pa.Table, table_name: str) -> Path:
+    """
+    Append an Arrow table to the raw store as a new fragment file.
+
+    Only the new rows are written (temp file + rename); the base file and
+    existing fragments are not touched.  Duplicate keys are tolerated
+    here and resolved by ``compact``.
+    """
+    out_path = new_fragment_path(table_name)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+_HEX = np.array(list("0123456789abcdef"))
+
+
+def key_ids(df: pd.DataFrame, keys: list[str]) -> np.ndarray:
+    """
+    Deterministic 16-hex-digit row ids hashed from the ``keys`` columns.
+
+    The same key always gets the same id, in any run and on any machine,
+    so re-fetched rows collide with (rather than duplicate) stored ones.
+    Hashing and hex formatting are vectorized over the whole frame.
+    """
+    hashed = pd.util.hash_pandas_object(
+        df[keys].astype(str), index=False
+    ).to_numpy(np.uint64)
+    shifts = np.arange(60, -1, -4, dtype=np.uint64)
+    nibbles = (hashed[:, None] >> shifts) & np.uint64(0xF)
+    return _HEX[nibbles].view("U16").ravel()
+
+
+def compact(table_name: str) -> int:
+    """
+    Fold the fragments of ``table_name`` into its base file.
+
+    Rows are de-duplicated on ``config.TABLE_KEYS[table_name]`` keeping
+    the last occurrence, i.e. the most recent fragment wins.  The new
+    base is written under a temporary name and renamed before the
+    fragments are deleted, so an interruption never loses rows.  Returns
+    the number of rows in the compacted base.
+    """
+    files = list_raw_files(table_name)
+    if not files:
+        raise FileNotFoundError(f"No raw data for {table_name} in {RAW_DIR}")
+    table = pa.concat_tables(
+        [pq.read_table(f) for f in files], promote_options="permissive"
+    ).unify_dictionaries()
+    keys = TABLE_KEYS.get(table_name)
+    if keys:
+        n = table.num_rows
+        last = (
+            table.select(keys)
+            .append_column("_row", pa.array(np.arange(n)))
+            .group_by(keys, use_threads=False)
+            .aggregate([("_row", "max")])
+            .column("_row_max")
+            .to_numpy()
+        )
+        table = table.take(np.sort(last))
+        if n > table.num_rows:
+            logger.info("Dropped %d duplicate %s rows of %s", n - table.num_rows,
+                        keys, table_name)
+
+    out_path = raw_path(table_name)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, out_path)
+    # Only the fragments that were folded in (a concurrent backfill may
+    # have added another since)
+    for f in files:
+        if f != out_path:
+            f.unlink()
+    return table.num_rows
+
+
+def clear_fragments(table_name: str) -> int:
+    """Delete all fragments (after a full re-extraction); return the count."""
+    frag_dir = fragment_dir(table_name)
+    removed = 0
+    if frag_dir.exists():
+        for f in frag_dir.glob("part-*.parquet"):
+            f.unlink()
+            removed += 1
+    return removed
+
+
+def staging_dir(table_name: str, fingerprint: dict[str, Any]) -> Path:
+    """
+    Staging directory for an extraction of ``table_name``.
+
+    The name embeds a hash of ``fingerprint`` (source, columns, schema,
+    paging mode, row filters), so a checkpoint is only ever resumed by a
+    run that would request exactly the same rows.
+    """
+    digest = hashlib.sha256(
+        json.dumps(fingerprint, sort_keys=True, default=str).encode()
+    ).hexdigest()[:12]
+    return STAGING_DIR / f"{table_name}-{digest}"
+
+
+def clear_staging(table_name: str, keep: Path | None = None) -> int:
+    """Delete staging directories of ``table_name`` except ``keep``."""
+    removed = 0
+    if STAGING_DIR.exists():
+        for d in STAGING_DIR.glob(f"{table_name}-*"):
+            if d != keep and d.is_dir():
+                shutil.rmtree(d)
+                removed += 1
+    return removed
+
+
+def load_checkpoint(stage: Path) -> dict[str, Any] | None:
+    """Read ``checkpoint.json`` from a staging directory, if present."""
+    path = stage / "checkpoint.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def save_checkpoint(stage: Path, checkpoint: dict[str, Any]) -> None:
+    """Write ``checkpoint.json`` atomically (temp file + rename)."""
+    path = stage / "checkpoint.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(checkpoint, indent=2, default=str))
+    os.replace(tmp, path)
+
+
+def load_manifest() -> dict[str, Any]:
+    """Load the extraction manifest (empty if it does not exist yet)."""
+    if not MANIFEST_PATH.exists():
+        return {}
+    return json.loads(MANIFEST_PATH.read_text())
+
+
+def save_manifest(manifest: dict[str, Any]) -> None:
+    """Write the manifest atomically (temp file + rename)."""
+    tmp = MANIFEST_PATH.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False, default=str))
+    os.replace(tmp, MANIFEST_PATH)
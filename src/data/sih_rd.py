@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Build the raw health table from local SIH/SUS RD microdata.
+
+DATASUS publishes approved hospitalizations (AIH "reduzidas") as one file
+per state and competence month, ``RD<UF><YY><MM>.dbc``: a DBF table
+compressed with PKWARE implode.  This script reads every such file in
+``config.SIH_RD_DIR`` (``.dbf`` files are read as they are, ``.dbc``
+files are first decompressed with the optional ``pyreaddbc`` package),
+keeps the admissions whose principal diagnosis is in ICD-10 chapter J
+(``config.CID_RESPIRATORY``), and counts them per municipality of
+residence and admission day, by age band, sex and in-hospital death,
+together with the amount paid.  The result replaces
+``data/raw/health_hospitalizations.parquet`` with the columns of the
+Clima360 respiratory city-day view (``config.HEALTH_DAILY_VIEW``), so
+``process.py`` runs on it unchanged.
+
+Files are decoded in a process pool, one file per task.  A DBF record
+has a fixed width, so each field is a strided byte view of the
+memory-mapped file: the chapter-J prefix test, digit parsing and the
+other filters are array operations over all records, and only the
+respiratory rows are ever copied.  Workers return per-file partial sums,
+which are summed again across files (a stay is billed in the competence
+month it ends, so one admission day can appear in several files).
+
+Usage
+-----
+    python src/data/sih_rd.py                    # all files in SIH_RD_DIR
+    python src/data/sih_rd.py --dir /mnt/datasus/SIHSUS --workers 16
+    python src/data/sih_rd.py --all-municipalities   # not only capitals
+    python src/data/sih_rd.py --full-history         # no analysis-window filter
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# ---------------------------------------------------------------------------
+# Project imports
+# ---------------------------------------------------------------------------
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from src.utils.config import (
+    ANALYSIS_END,
+    ANALYSIS_START,
+    CAPITALS,
+    CID_RESPIRATORY,
+    HEALTH_AGG_COLUMNS,
+    HEALTH_DAILY_VIEW,
+    SIH_AGE_BANDS,
+    SIH_MUNICIPALITY_COLUMN,
+    SIH_RD_DIR,
+    TABLES,
+    LOG_FORMAT,
+    LOG_DATE_FORMAT,
+)
+from src.data.extract import arrow_schema
+from src.data.raw_store import clear_fragments, load_manifest, raw_path, save_manifest
+
+# ---------------------------------------------------------------------------
+# Logging
+# ---------------------------------------------------------------------------
+logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
+logger = logging.getLogger("sih_rd")
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+SOURCE = "sih_rd"                          # manifest "source" of the table
+RD_FILE = re.compile(r"^RD([A-Z]{2})(\d{2})(\d{2})\.(dbc|dbf)$", re.IGNORECASE)
+KEYS = ["munic", "date"]
+# SEXO: 1 male; 3 female (2 in files before 2008); 0/9 not recorded
+SEX_CODES = {"male": (1,), "female": (2, 3)}
+# COD_IDADE: unit of IDADE.  4 = years, 5 = years above 100; 0-3 (hours,
+# days, months) are infants
+AGE_UNIT_YEARS, AGE_UNIT_CENTURY = 4, 5
+
+_MUNIC_BY_CAPITAL = {int(meta["ibge"][:6]): name for name, meta in CAPITALS.items()}
+
+
+# ---------------------------------------------------------------------------
+# Files
+# ---------------------------------------------------------------------------
+def list_rd_files(directory: Path = SIH_RD_DIR, since: str | None = ANALYSIS_START) -> list[Path]:
+    """
+    RD files in ``directory``, one per (UF, competence month).
+
+    A ``.dbf`` is preferred over the ``.dbc`` it was decompressed from.
+    With ``since``, competence months ending before that date are
+    skipped: a stay is billed at or after discharge, so those files hold
+    no admission on or after ``since``.
+    """
+    files: dict[str, Path] = {}
+    for path in sorted(directory.glob("*")):
+        match = RD_FILE.match(path.name)
+        if match is None:
+            continue
+        uf, yy, mm, ext = match.groups()
+        year = 2000 + int(yy) if int(yy) < 90 else 1900 + int(yy)
+        if since is not None and (year, int(mm)) < (int(since[:4]), int(since[5:7])):
+            continue
+        key = f"{uf.upper()}{yy}{mm}"
+        if key not in files or ext.lower() == "dbf":
+            files[key] = path
+    return [files[k] for k in sorted(files)]
+
+
+def decompress_dbc(path: Path, out_dir: Path) -> Path:
+    """Decompress a DATASUS ``.dbc`` into ``out_dir`` (needs ``pyreaddbc``)."""
+    try:
+        from pyreaddbc import dbc2dbf
+    except ImportError as exc:
+        raise ImportError(
+            f"Reading {path.name} needs the optional 'pyreaddbc' package "
+            "(pip install pyreaddbc), or decompress the .dbc files to .dbf first"
+        ) from exc
+    out_path = out_dir / (path.stem + ".dbf")
+    dbc2dbf(str(path), str(out_path))
+    return out_path
+
+
+# ---------------------------------------------------------------------------
+# DBF decoding
+# ---------------------------------------------------------------------------
+class DbfTable:
+    """
+    Fixed-width records of a dBASE III file, memory-mapped.
+
+    ``field(name)`` is a zero-copy ``(n_records, width)`` uint8 view of one
+    column.  Records flagged as deleted are excluded by ``live``.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        header = self.data[:32].tobytes()
+        self.n_records = int.from_bytes(header[4:8], "little")
+        header_len = int.from_bytes(header[8:10], "little")
+        self.record_len = int.from_bytes(header[10:12], "little")
+
+        self.fields: dict[str, tuple[int, int]] = {}   # name -> (offset, width)
+        offset = 1                                      # byte 0: deletion flag
+        for pos in range(32, header_len - 1, 32):
+            desc = self.data[pos:pos + 32].tobytes()
+            if desc[0] == 0x0D:
+                break
+            name = desc[:11].split(b"\x00")[0].decode("ascii").strip().upper()
+            self.fields[name] = (offset, desc[16])
+            offset += desc[16]
+        self._start = header_len
+        # Truncated files: only the records actually present
+        available = (len(self.data) - header_len) // max(self.record_len, 1)
+        self.n_records = min(self.n_records, available)
+
+    def _view(self, offset: int, width: int) -> np.ndarray:
+        return np.ndarray(
+            (self.n_records, width), dtype=np.uint8, buffer=self.data,
+            offset=self._start + offset, strides=(self.record_len, 1),
+        )
+
+    def field(self, name: str) -> np.ndarray:
+        if name not in self.fields:
+            raise KeyError(f"DBF has no field {name!r} (fields: {list(self.fields)})")
+        return self._view(*self.fields[name])
+
+    @property
+    def live(self) -> np.ndarray:
+        """Records not flagged as deleted."""
+        return self._view(0, 1)[:, 0] != ord("*")
+
+
+def has_prefix(field: np.ndarray, prefix: str) -> np.ndarray:
+    """Rows of a byte field starting with ``prefix`` (case-insensitive)."""
+    code = np.frombuffer(prefix.upper().encode("ascii"), dtype=np.uint8)
+    head = field[:, :len(code)]
+    # ASCII upper case: clear bit 5 of letters only
+    upper = np.where((head >= ord("a")) & (head <= ord("z")), head - 32, head)
+    return (upper == code).all(axis=1)
+
+
+def parse_int(field: np.ndarray, missing: int = -1) -> np.ndarray:
+    """
+    Integers written as ASCII digits, left or right aligned.
+
+    Rows without digits, or with anything but blanks around one run of
+    digits, get ``missing``.
+    """
+    digits = field.astype(np.int64) - ord("0")
+    is_digit = (digits >= 0) & (digits <= 9)
+    blank = (field == ord(" ")) | (field == 0)
+    width = field.shape[1]
+    first = np.argmax(is_digit, axis=1)
+    last = width - 1 - np.argmax(is_digit[:, ::-1], axis=1)
+    # Drop trailing blanks: divide by the weight of the last digit
+    weights = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    value = (np.where(is_digit, digits, 0) * weights).sum(axis=1) // weights[last]
+    valid = (is_digit.any(axis=1) & (is_digit | blank).all(axis=1)
+             & (is_digit.sum(axis=1) == last - first + 1))
+    return np.where(valid, value, missing)
+
+
+def parse_float(field: np.ndarray) -> np.ndarray:
+    """Decimal numbers written as ASCII (``NaN`` where blank or invalid)."""
+    text = np.ascontiguousarray(field).view(f"S{field.shape[1]}").ravel()
+    return pd.to_numeric(pd.Series(text).str.decode("latin-1").str.strip(),
+                         errors="coerce").to_numpy(np.float64)
+
+
+def parse_date(field: np.ndarray) -> np.ndarray:
+    """``YYYYMMDD`` fields as ``datetime64[D]`` (NaT where invalid)."""
+    value = parse_int(field)
+    year, rest = np.divmod(value, 10_000)
+    month, day = np.divmod(rest, 100)
+    ok = (value > 0) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    dates = months.astype("datetime64[D]") + np.where(ok, day - 1, 0)
+    # Days past the end of the month (e.g. 20220231) roll over; reject them
+    ok &= dates.astype("datetime64[M]") == months
+    return np.where(ok, dates, np.datetime64("NaT"))
+
+
+def ibge_code(munic: np.ndarray) -> np.ndarray:
+    """Seven-digit IBGE codes from the six-digit codes used by DATASUS."""
+    digits = (munic[:, None] // 10 ** np.arange(5, -1, -1)) % 10
+    products = digits * np.array([1, 2, 1, 2, 1, 2])
+    total = (products // 10 + products % 10).sum(axis=1)
+    return munic * 10 + (10 - total % 10) % 10
+
+
+# ---------------------------------------------------------------------------
+# Per-file aggregation (runs in the workers)
+# ---------------------------------------------------------------------------
+def _age_years(age: np.ndarray, unit: np.ndarray) -> np.ndarray:
+    """Age in whole years (-1 when not recorded)."""
+    return np.select(
+        [unit == AGE_UNIT_YEARS, unit == AGE_UNIT_CENTURY, (unit >= 0) & (unit < 4)],
+        [age, age + 100, 0],
+        default=-1,
+    )
+
+
+def aggregate_file(
+    path: Path,
+    start: str | None = ANALYSIS_START,
+    end: str | None = ANALYSIS_END,
+    municipalities: list[int] | None = None,
+) -> tuple[pd.DataFrame, int]:
+    """
+    Respiratory admissions of one RD file summed per (municipality, day).
+
+    Returns the partial sums, keyed by the six-digit municipality code
+    ``munic`` and ``date``, and the number of records read.  Only
+    admissions between ``start`` and ``end`` and, if given, in
+    ``municipalities`` are kept.
+    """
+    with tempfile.TemporaryDirectory(prefix="sih-") as tmp:
+        if path.suffix.lower() == ".dbc":
+            path = decompress_dbc(path, Path(tmp))
+        dbf = DbfTable(path)
+
+        keep = dbf.live & has_prefix(dbf.field("DIAG_PRINC"), CID_RESPIRATORY)
+        munic = parse_int(dbf.field(SIH_MUNICIPALITY_COLUMN))
+        if municipalities is not None:
+            keep &= np.isin(munic, municipalities)
+        rows = np.flatnonzero(keep)
+        dates = parse_date(dbf.field("DT_INTER")[rows])
+        in_window = ~np.isnat(dates)
+        if start is not None:
+            in_window &= dates >= np.datetime64(start, "D")
+        if end is not None:
+            in_window &= dates <= np.datetime64(end, "D")
+        rows, dates = rows[in_window], dates[in_window]
+
+        def take(name: str) -> np.ndarray:
+            return parse_int(dbf.field(name)[rows])
+
+        age = _age_years(take("IDADE"), take("COD_IDADE"))
+        sex = take("SEXO")
+        died = take("MORTE") == 1
+        cost = np.nan_to_num(parse_float(dbf.field("VAL_TOT")[rows]))
+        n_records = dbf.n_records
+        munic = munic[rows]
+        del dbf
+
+    counts = {"admissions": np.ones(len(rows), dtype=bool)}
+    for band, (low, high) in SIH_AGE_BANDS.items():
+        counts[f"admissions_age_{band}"] = (age >= low) & (age <= high)
+    for label, codes in SEX_CODES.items():
+        counts[f"admissions_{label}"] = np.isin(sex, codes)
+    df = pd.DataFrame({"munic": munic.astype(np.int32), "date": dates})
+    for col, mask in counts.items():
+        df[col] = mask.astype(np.int32)
+        df[col.replace("admissions", "deaths")] = (mask & died).astype(np.int32)
+    df["total_cost"] = cost
+    partial = df.groupby(KEYS, as_index=False, sort=False)[HEALTH_AGG_COLUMNS].sum()
+    return partial, n_records
+
+
+# ---------------------------------------------------------------------------
+# Ingestion
+# ---------------------------------------------------------------------------
+def to_health_table(sums: pd.DataFrame, all_municipalities: bool = False) -> pa.Table:
+    """
+    City-day sums as the respiratory city-day table ``process.py`` reads.
+
+    Capitals are named as in ``config.CAPITALS``; other municipalities
+    (``all_municipalities``) are named by their IBGE code.
+    """
+    sums = sums.copy()
+    codes = ibge_code(sums["munic"].to_numpy(np.int64))
+    sums["ibge_code"] = codes.astype(str)
+    sums["city"] = sums["munic"].map(_MUNIC_BY_CAPITAL)
+    if all_municipalities:
+        sums["city"] = sums["city"].fillna(sums["ibge_code"])
+    sums = (sums.dropna(subset=["city"])
+            .sort_values(["ibge_code", "date"], ignore_index=True))
+    sums["date"] = sums["date"].astype("datetime64[ns]")
+    sums["id"] = sums["ibge_code"] + ":" + sums["date"].dt.strftime("%Y-%m-%d")
+    sums["cid_category"] = "respiratory"
+    schema = arrow_schema(HEALTH_DAILY_VIEW)
+    return pa.Table.from_pandas(sums[schema.names], schema=schema, preserve_index=False)
+
+
+def ingest(
+    directory: Path = SIH_RD_DIR,
+    workers: int | None = None,
+    all_municipalities: bool = False,
+    full_history: bool = False,
+) -> int:
+    """
+    Decode every RD file in ``directory`` and write the health table.
+
+    Returns the number of city-day rows written to the raw store.
+    """
+    t0 = time.time()
+    files = list_rd_files(directory, since=None if full_history else ANALYSIS_START)
+    if not files:
+        raise FileNotFoundError(f"No RD<UF><YY><MM>.dbc/.dbf files in {directory}")
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    start, end = (None, None) if full_history else (ANALYSIS_START, ANALYSIS_END)
+    municipalities = None if all_municipalities else sorted(_MUNIC_BY_CAPITAL)
+    logger.info("Decoding %d RD files with %d workers", len(files), workers)
+
+    parts: list[pd.DataFrame] = []
+    n_records = 0
+    # spawn: workers must not inherit Arrow's thread pools via fork
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {
+            pool.submit(aggregate_file, f, start, end, municipalities): f
+            for f in files
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            partial, n = future.result()
+            parts.append(partial)
+            n_records += n
+            logger.info("  %s: %d records -> %d municipality-days (%d/%d)",
+                        futures[future].name, n, len(partial), i, len(files))
+
+    sums = pd.concat(parts, ignore_index=True).groupby(KEYS, as_index=False)[
+        HEALTH_AGG_COLUMNS].sum()
+    table = to_health_table(sums, all_municipalities)
+
+    table_name = TABLES["health"]
+    out_path = raw_path(table_name)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, out_path)
+    removed = clear_fragments(table_name)
+    if removed:
+        logger.info("Removed %d stale fragments of %s", removed, table_name)
+
+    # A later ``extract.py --incremental`` sees another source and
+    # re-extracts in full instead of appending to these rows
+    manifest = load_manifest()
+    manifest[table_name] = {
+        "source": SOURCE,
+        "filters": [] if full_history else [["date", f"gte.{ANALYSIS_START}"],
+                                            ["date", f"lte.{ANALYSIS_END}"]],
+        "rows": table.num_rows,
+        "files": len(files),
+        "last_run": {"mode": "full", "rows": table.num_rows,
+                     "at": time.strftime("%Y-%m-%dT%H:%M:%S%z")},
+    }
+    save_manifest(manifest)
+
+    logger.info("Saved %s: %d records -> %d city-days, %d admissions (%.1f s)",
+                out_path, n_records, table.num_rows,
+                pc.sum(table["admissions"]).as_py() or 0, time.time() - t0)
+    return table.num_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the raw health table from local SIH/SUS RD files")
+    parser.add_argument(
+        "--dir",
+        type=Path,
+        default=SIH_RD_DIR,
+        help="Directory with RD<UF><YY><MM>.dbc/.dbf files (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Decoding processes (default: one per core)",
+    )
+    parser.add_argument(
+        "--all-municipalities",
+        action="store_true",
+        help="Keep every municipality of residence, not only the capitals",
+    )
+    parser.add_argument(
+        "--full-history",
+        action="store_true",
+        help="Keep admissions outside the analysis window",
+    )
+    args = parser.parse_args()
+    ingest(args.dir, workers=args.workers,
+           all_municipalities=args.all_municipalities,
+           full_history=args.full_history)
@@ -0,0 +1,35 @@
+-- Daily respiratory hospitalizations per city, pre-aggregated on the server.
+--
+-- Read by src/data/extract.py (config.HEALTH_DAILY_VIEW) instead of the
+-- per-CID-subcategory rows of health_hospitalizations.  Collapses rows
+-- exactly as process.merge_daily does: respiratory categories only, one
+-- row per (city, ibge_code, date), counts and costs summed.  ``id`` is a
+-- synthetic text key so the view can be walked with keyset pagination.
+--
+-- Deploy once on the Clima360 database (Supabase SQL editor or psql).
+
+create or replace view public.health_daily_respiratory as
+select
+    h.ibge_code::text || ':' || h.date::text as id,
+    h.city,
+    h.ibge_code::text                        as ibge_code,
+    h.date,
+    'respiratory'::text                      as cid_category,
+    sum(h.admissions)                        as admissions,
+    sum(h.admissions_age_0_14)               as admissions_age_0_14,
+    sum(h.admissions_age_15_59)              as admissions_age_15_59,
+    sum(h.admissions_age_60_plus)            as admissions_age_60_plus,
+    sum(h.admissions_female)                 as admissions_female,
+    sum(h.admissions_male)                   as admissions_male,
+    sum(h.deaths)                            as deaths,
+    sum(h.deaths_age_0_14)                   as deaths_age_0_14,
+    sum(h.deaths_age_15_59)                  as deaths_age_15_59,
+    sum(h.deaths_age_60_plus)                as deaths_age_60_plus,
+    sum(h.deaths_female)                     as deaths_female,
+    sum(h.deaths_male)                       as deaths_male,
+    sum(h.total_cost)                        as total_cost
+from public.health_hospitalizations h
+where h.cid_category ilike '%respiratory%'
+group by h.city, h.ibge_code, h.date;
+
+grant select on public.health_daily_respiratory to anon;
@@ -34,7 +34,6 @@ from econml.dml import CausalForestDML
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     TABLES_DIR,
     RANDOM_SEED,
@@ -49,6 +48,7 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("causal_forest")
@@ -59,11 +59,14 @@ np.random.seed(RANDOM_SEED)
 # ---------------------------------------------------------------------------
 # Data preparation
 # ---------------------------------------------------------------------------
-def load_panel() -> pd.DataFrame:
-    """Load the processed analysis panel."""
-    path = PROCESSED_DIR / "analysis_panel.parquet"
-    logger.info("Loading %s", path)
-    df = pd.read_parquet(path)
+def load_panel(filters=None) -> pd.DataFrame:
+    """
+    Load the analysis panel columns the models use.
+
+    ``filters`` restricts the rows read, e.g. ``[("region", "=", "NE")]``
+    for a per-region fit (see ``panel_store.load_panel``).
+    """
+    df = panel_store.load_panel(panel_store.model_columns(ALL_OUTCOMES), filters)
     logger.info("Panel: %d rows x %d cols", len(df), len(df.columns))
     return df
 
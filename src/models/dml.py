@@ -31,7 +31,6 @@ from econml.dml import LinearDML
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     RANDOM_SEED,
     ALL_CONFOUNDERS,
@@ -42,6 +41,7 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("dml")
@@ -52,10 +52,8 @@ np.random.seed(RANDOM_SEED)
 # ---------------------------------------------------------------------------
 # Data preparation (shared logic with causal_forest.py)
 # ---------------------------------------------------------------------------
-def load_panel() -> pd.DataFrame:
-    path = PROCESSED_DIR / "analysis_panel.parquet"
-    logger.info("Loading %s", path)
-    return pd.read_parquet(path)
+def load_panel(filters=None) -> pd.DataFrame:
+    return panel_store.load_panel(panel_store.model_columns(ALL_OUTCOMES), filters)
 
 
 def prepare_matrices(
@@ -16,6 +16,9 @@ DATA_DIR = PROJECT_ROOT / "data"
 RAW_DIR = DATA_DIR / "raw"
 INTERIM_DIR = DATA_DIR / "interim"
 PROCESSED_DIR = DATA_DIR / "processed"
+# The panel as a Parquet dataset partitioned region=<R>/uf=<UF>/year=<Y>/
+PANEL_DATASET_DIR = PROCESSED_DIR / "analysis_panel"
+PANEL_PARTITIONS = ["region", "uf", "year"]
 OUTPUTS_DIR = PROJECT_ROOT / "outputs"
 FIGURES_DIR = OUTPUTS_DIR / "figures"
 TABLES_DIR = OUTPUTS_DIR / "tables"
@@ -53,6 +56,51 @@ TABLES = {
     "fleet":         "fleet_history",
 }
 
+# Count columns summed when health rows are collapsed to one row per
+# city-day (server-side in HEALTH_DAILY_VIEW, locally in process.py).
+HEALTH_AGG_COLUMNS = [
+    "admissions", "admissions_age_0_14", "admissions_age_15_59",
+    "admissions_age_60_plus", "admissions_female", "admissions_male",
+    "deaths", "deaths_age_0_14", "deaths_age_15_59",
+    "deaths_age_60_plus", "deaths_female", "deaths_male",
+    "total_cost",
+]
+
+# process.py --stream-health: aggregate the raw health table batch by
+# batch (src/data/health_stream.py) instead of loading it whole; memory is
+# then bounded by the aggregated city-days rather than the raw rows.
+STREAM_HEALTH = False
+HEALTH_STREAM_BATCH_ROWS = 250_000   # rows per batch (a fraction of a row group)
+
+# Server-side view with respiratory admissions already summed per city-day
+# (definition in src/data/sql/health_daily_respiratory.sql).  extract.py
+# reads it instead of health_hospitalizations and falls back to streaming
+# local aggregation when the view is not deployed.
+HEALTH_DAILY_VIEW = "health_daily_respiratory"
+
+# Pagination strategy per table.  "keyset" filters id=gt.<last id> so every
+# page costs the same; "offset" uses OFFSET/LIMIT (needed for concurrent
+# fetching, which plans page offsets up front).
+TABLE_PAGINATION = {name: "keyset" for name in [*TABLES.values(), HEALTH_DAILY_VIEW]}
+
+# High-water mark columns per table for incremental extraction
+# (``extract.py --incremental`` requests only rows past the recorded mark).
+TABLE_WATERMARKS = {
+    "weather_history":         ["date"],
+    "air_quality_history":     ["date"],
+    "health_hospitalizations": ["date"],
+    "demographics_history":    ["year"],
+    "fleet_history":           ["year", "month"],
+    HEALTH_DAILY_VIEW:         ["date"],
+}
+
+# Natural key per raw table.  Backfills append fragments freely and
+# ``raw_store.compact`` keeps one row per key (the newest).  Tables not
+# listed are compacted without de-duplication.
+TABLE_KEYS = {
+    "weather_history": ["city", "date"],
+}
+
 # Select columns per table (to minimize transfer size)
 TABLE_COLUMNS = {
     "weather_history": [
@@ -93,6 +141,63 @@ TABLE_COLUMNS = {
         "fleet_tractor", "fleet_trailer", "fleet_other",
     ],
 }
+TABLE_COLUMNS[HEALTH_DAILY_VIEW] = [
+    "id", "city", "ibge_code", "date", "cid_category", *HEALTH_AGG_COLUMNS,
+]
+
+# Arrow schema registry: declared type per column, as ``pyarrow`` type
+# names plus "dictionary" (dictionary-encoded string, read back by pandas
+# as a categorical).  Every page fetched by ``extract.py`` is cast to this
+# schema before it is written, so raw files carry typed dates, compact
+# categoricals and the narrowest numeric type that holds the data.  Casts
+# are checked: a value that does not fit fails the extraction loudly.
+_ID = "string"          # unique per row, nothing to gain from a dictionary
+_CAT = "dictionary"     # low-cardinality labels (city, source, CID, ...)
+_DATE = "date32"
+# Measurements feed the lags, moving averages and models, so they keep
+# float64; only process.py --compact-dtypes narrows them, as an opt-in.
+_REAL = "float64"
+_COUNT = "int32"        # daily/annual counts (populations up to ~2.1e9)
+_MONEY = "float64"      # currency keeps full precision
+
+TABLE_SCHEMAS = {
+    "weather_history": {
+        "id": _ID, "city": _CAT, "date": _DATE, "lat": _REAL, "lon": _REAL,
+        **{c: _REAL for c in TABLE_COLUMNS["weather_history"]
+           if c not in ("id", "city", "date", "lat", "lon")},
+    },
+    "air_quality_history": {
+        "id": _ID, "city": _CAT, "date": _DATE, "lat": _REAL, "lon": _REAL,
+        "pm25": _REAL, "pm10": _REAL, "o3": _REAL, "no2": _REAL,
+        "so2": _REAL, "co": _REAL, "aqi": _REAL,
+        "dominant_pollutant": _CAT, "data_quality": _CAT,
+        "source": _CAT, "station_name": _CAT,
+    },
+    "health_hospitalizations": {
+        "id": _ID, "city": _CAT, "ibge_code": _CAT, "date": _DATE,
+        "cid_category": _CAT,
+        **{c: _COUNT for c in TABLE_COLUMNS["health_hospitalizations"]
+           if c.startswith(("admissions", "deaths"))},
+        "total_cost": _MONEY, "data_quality": _CAT, "source": _CAT,
+    },
+    "demographics_history": {
+        "id": _ID, "city": _CAT, "ibge_code": _CAT, "year": "int16",
+        "population": _COUNT, "density": _REAL, "growth_rate": _REAL,
+        **{c: _COUNT for c in TABLE_COLUMNS["demographics_history"]
+           if c.startswith("pop_")},
+        "source": _CAT,
+    },
+    "fleet_history": {
+        "id": _ID, "city": _CAT, "ibge_code": _CAT,
+        "year": "int16", "month": "int8",
+        **{c: _COUNT for c in TABLE_COLUMNS["fleet_history"]
+           if c.startswith("fleet_")},
+    },
+}
+TABLE_SCHEMAS[HEALTH_DAILY_VIEW] = {
+    col: TABLE_SCHEMAS["health_hospitalizations"][col]
+    for col in TABLE_COLUMNS[HEALTH_DAILY_VIEW]
+}
 
 # ---------------------------------------------------------------------------
 # Analysis parameters
@@ -101,6 +206,25 @@ ANALYSIS_START = "2022-01-01"
 ANALYSIS_END = "2025-12-31"
 RANDOM_SEED = 42
 
+# Row predicates pushed down to PostgREST at extraction time, as
+# (column, "op.value") filters.  They mirror what process.py keeps anyway:
+# the analysis window, respiratory CIDs, and the year range needed to
+# interpolate annual tables.  ``extract.py --full-history`` disables them.
+RESPIRATORY_FILTER = ("cid_category", "ilike.*respiratory*")
+_ANALYSIS_WINDOW = [("date", f"gte.{ANALYSIS_START}"), ("date", f"lte.{ANALYSIS_END}")]
+_ANNUAL_WINDOW = [
+    ("year", f"gte.{int(ANALYSIS_START[:4]) - 1}"),
+    ("year", f"lte.{int(ANALYSIS_END[:4]) + 1}"),
+]
+TABLE_FILTERS = {
+    "weather_history":         _ANALYSIS_WINDOW,
+    "air_quality_history":     _ANALYSIS_WINDOW,
+    "health_hospitalizations": _ANALYSIS_WINDOW + [RESPIRATORY_FILTER],
+    "demographics_history":    _ANNUAL_WINDOW,
+    "fleet_history":           _ANNUAL_WINDOW,
+    HEALTH_DAILY_VIEW:         _ANALYSIS_WINDOW,
+}
+
 # WHO air quality guideline thresholds
 WHO_PM25_THRESHOLD = 15.0   # ug/m3, 24h mean
 WHO_O3_THRESHOLD = 100.0    # ug/m3, 8h mean
@@ -111,10 +235,60 @@ ALT_PM25_THRESHOLDS = [25.0, 35.0, 50.0]
 # Lag structure for exposure variables
 MAX_LAG_DAYS = 7
 MOVING_AVG_WINDOWS = [7, 14]
+# "rows": lag k is the k-th previous observed row of the city (as in the
+# published panel).  "calendar": lag k is exactly k days earlier, and
+# moving averages cover the last w calendar days; days missing from the
+# panel count as missing values instead of being skipped over.
+LAG_MODE = "rows"
+
+# Annual tables (demographics, fleet) on the daily panel: "linear" between
+# anchor dates, "step" (each year's value for the whole calendar year, as
+# the panel did before) or "spline" (monotone cubic).  ANNUAL_ANCHOR is the
+# month-day an annual figure refers to (IBGE estimates are dated 1 July).
+ANNUAL_INTERPOLATION = "linear"
+ANNUAL_ANCHOR = "07-01"
+
+# Compact panel dtypes (process.py --compact-dtypes): identifiers become
+# categoricals, integer columns the narrowest int type that holds them
+# (0/1 dummies int8) and float64 columns float32, except the large
+# interpolated counts and costs below, whose sums need float64 (float32
+# keeps ~7 significant digits).
+COMPACT_PANEL_DTYPES = False
+PANEL_CATEGORICAL_COLUMNS = [
+    "city", "region", "uf", "ibge_code",
+    "dominant_pollutant", "data_quality", "source", "station_name",
+]
+PANEL_FLOAT64_COLUMNS = [
+    "total_cost", "population", "pop_0_14", "pop_15_59", "pop_60_plus",
+    "pop_female", "pop_male", "fleet_total", "fleet_automobile",
+    "fleet_motorcycle", "fleet_bus", "fleet_truck",
+]
 
 # CID-10 respiratory codes (Chapter X: J00-J99)
 CID_RESPIRATORY = "J"
 
+# Local SIH/SUS microdata (src/data/sih_rd.py): DATASUS "RD<UF><YY><MM>"
+# monthly files of approved hospitalizations, as published (.dbc) or
+# decompressed (.dbf).  Admissions are counted on DT_INTER in the
+# municipality of residence (MUNIC_RES; MUNIC_MOV is where the hospital is).
+SIH_RD_DIR = DATA_DIR / "sih" / "rd"
+SIH_MUNICIPALITY_COLUMN = "MUNIC_RES"
+# Age bands of the health table (years, inclusive)
+SIH_AGE_BANDS = {"0_14": (0, 14), "15_59": (15, 59), "60_plus": (60, 200)}
+
+# Local gridded reanalysis (src/data/gridded.py): ERA5 hourly single-level
+# fields for weather and CAMS global reanalysis (EAC4) surface fields for
+# air quality, as NetCDF or Zarr.  Fields are sampled at city coordinates
+# ("nearest" grid point or "bilinear") and reduced to local days; UTC-3
+# gives the America/Sao_Paulo days the Open-Meteo tables use.
+GRIDDED_DIRS = {
+    "weather":     DATA_DIR / "gridded" / "era5",
+    "air_quality": DATA_DIR / "gridded" / "cams",
+}
+GRIDDED_INTERPOLATION = "bilinear"
+GRIDDED_UTC_OFFSET_HOURS = -3
+GRIDDED_BLOCK_DAYS = 31     # local days of fields read per block
+
 # Fourier terms for seasonality control
 FOURIER_PERIODS = [365.25, 365.25 / 2]  # annual and semi-annual
 
@@ -166,6 +340,39 @@ CAPITALS = {
     "Vitória":        {"uf": "ES", "ibge": "3205309", "region": "SE", "area_km2": 97},
 }
 
+# City-centre coordinates of the capitals: the points gridded reanalysis is
+# sampled at (src/data/gridded.py), and the fallback of
+# fetch_missing_weather.py for capitals without stored coordinates.
+CAPITAL_COORDS = {
+    "Aracaju":        {"lat": -10.9472, "lon": -37.0731},
+    "Belém":          {"lat": -1.4558,  "lon": -48.4902},
+    "Belo Horizonte": {"lat": -19.9167, "lon": -43.9345},
+    "Boa Vista":      {"lat": 2.8195,   "lon": -60.6714},
+    "Brasília":       {"lat": -15.7939, "lon": -47.8828},
+    "Campo Grande":   {"lat": -20.4697, "lon": -54.6201},
+    "Cuiabá":         {"lat": -15.6014, "lon": -56.0979},
+    "Curitiba":       {"lat": -25.4284, "lon": -49.2733},
+    "Florianópolis":  {"lat": -27.5954, "lon": -48.5480},
+    "Fortaleza":      {"lat": -3.7172,  "lon": -38.5433},
+    "Goiânia":        {"lat": -16.6869, "lon": -49.2648},
+    "João Pessoa":    {"lat": -7.1195,  "lon": -34.8450},
+    "Macapá":         {"lat": 0.0349,   "lon": -51.0694},
+    "Maceió":         {"lat": -9.6658,  "lon": -35.7353},
+    "Manaus":         {"lat": -3.1190,  "lon": -60.0217},
+    "Natal":          {"lat": -5.7945,  "lon": -35.2110},
+    "Palmas":         {"lat": -10.1689, "lon": -48.3317},
+    "Porto Alegre":   {"lat": -30.0346, "lon": -51.2177},
+    "Porto Velho":    {"lat": -8.7612,  "lon": -63.9004},
+    "Recife":         {"lat": -8.0476,  "lon": -34.8770},
+    "Rio Branco":     {"lat": -9.9754,  "lon": -67.8249},
+    "Rio de Janeiro": {"lat": -22.9068, "lon": -43.1729},
+    "Salvador":       {"lat": -12.9714, "lon": -38.5014},
+    "São Luís":       {"lat": -2.5297,  "lon": -44.2825},
+    "São Paulo":      {"lat": -23.5505, "lon": -46.6333},
+    "Teresina":       {"lat": -5.0892,  "lon": -42.8019},
+    "Vitória":        {"lat": -20.3155, "lon": -40.3128},
+}
+
 REGION_ORDER = ["N", "NE", "CO", "SE", "S"]
 
 # ---------------------------------------------------------------------------
@@ -190,6 +397,12 @@ HETEROGENEITY_MODERATORS = [
     "dtr", "region_N", "region_NE", "region_CO", "region_SE", "region_S",
 ]
 
+# Derived columns kept in the panel besides the model inputs above
+# (process.py builds only these, the lists above and what they depend on;
+# lags/moving averages such as "pm25_lag1" or "pm25_ma7" on request).
+# "region" and "uf" are also the dataset's partition keys.
+PANEL_EXTRA_FEATURES = ["region", "uf"]
+
 TREATMENT_PM25 = "pm25_exceed"
 TREATMENT_O3 = "o3_exceed"
 
@@ -205,6 +418,20 @@ OUTCOME_SEX_GROUPS = [
 ]
 ALL_OUTCOMES = [OUTCOME_TOTAL] + OUTCOME_AGE_GROUPS + OUTCOME_SEX_GROUPS
 
+# ---------------------------------------------------------------------------
+# Outbound HTTP cache (src/utils/http_cache.py)
+# Responses from Open-Meteo, IBGE, ... are stored content-addressed under
+# HTTP_CACHE_DIR.  Archive data older than HTTP_CACHE_ARCHIVE_AGE_DAYS never
+# changes and is kept forever; everything else expires after
+# HTTP_CACHE_TTL seconds.  HTTP_OFFLINE=1 serves only from the cache and
+# fails immediately on a miss (air-gapped CI).
+# ---------------------------------------------------------------------------
+HTTP_CACHE_DIR = DATA_DIR / "cache" / "http"
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", 2 * 1024**3))
+HTTP_CACHE_TTL = 24 * 3600
+HTTP_CACHE_ARCHIVE_AGE_DAYS = 7
+HTTP_OFFLINE = os.getenv("HTTP_OFFLINE", "").lower() in ("1", "true", "yes")
+
 # ---------------------------------------------------------------------------
 # Logging format
 # ---------------------------------------------------------------------------
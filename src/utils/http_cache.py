@@ -0,0 +1,313 @@
+"""
+Content-addressed on-disk cache for outbound HTTP GET requests.
+
+Every external download in ``src/data`` and ``src/visualization``
+(Open-Meteo archive, IBGE shapefiles) goes through ``get`` or
+``fetch_path``.  Layout under ``config.HTTP_CACHE_DIR``::
+
+    entries/<kk>/<key>.json     request key -> body hash, expiry, headers
+    objects/<hh>/<sha256><ext>  response bodies, named by their SHA-256
+
+The key is the SHA-256 of the URL plus the sorted, stringified query
+parameters, so ``{"a": 1, "b": 2}`` and ``[("b", "2"), ("a", "1")]`` hit
+the same entry.  Identical bodies are stored once, and every body is
+re-hashed when read, so a truncated or corrupted file is treated as a
+miss instead of being served.  Entry files' mtimes record last use; when
+the objects exceed ``config.HTTP_CACHE_MAX_BYTES`` the least recently
+used entries are evicted.  With ``config.HTTP_OFFLINE`` (``HTTP_OFFLINE=1``)
+nothing is fetched: entries are served even when expired and a miss
+raises ``HttpCacheMiss`` immediately.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http import HTTPStatus
+from pathlib import Path, PurePosixPath
+from typing import Any
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from src.utils.config import (
+    HTTP_CACHE_ARCHIVE_AGE_DAYS,
+    HTTP_CACHE_DIR,
+    HTTP_CACHE_MAX_BYTES,
+    HTTP_CACHE_TTL,
+    HTTP_OFFLINE,
+)
+
+logger = logging.getLogger("http_cache")
+
+ENTRIES_DIR = HTTP_CACHE_DIR / "entries"
+OBJECTS_DIR = HTTP_CACHE_DIR / "objects"
+FOREVER = math.inf
+
+Params = dict[str, Any] | list[tuple[str, Any]] | None
+
+# Running size of objects/ (None until the first scan).  _store adds new
+# bodies to it, so the tree is only walked when the limit may be exceeded.
+_objects_bytes: int | None = None
+_size_lock = threading.Lock()
+# Evict down to this fraction of the limit, so a full cache is not
+# rescanned on every subsequent write.
+_EVICT_TO = 0.9
+
+
+class HttpCacheMiss(RuntimeError):
+    """Raised in offline mode when a request is not in the cache."""
+
+
+# ---------------------------------------------------------------------------
+# Keys and TTLs
+# ---------------------------------------------------------------------------
+def cache_key(url: str, params: Params = None) -> str:
+    """SHA-256 of the URL and its normalized (sorted, stringified) params."""
+    items = params.items() if isinstance(params, dict) else (params or [])
+    query = urlencode(sorted((str(k), str(v)) for k, v in items))
+    return hashlib.sha256(f"GET {url}?{query}".encode()).hexdigest()
+
+
+def archive_ttl(last_day: str | date) -> float:
+    """
+    TTL for archive data ending on ``last_day``.
+
+    Reanalysis archives are final once they are more than
+    ``HTTP_CACHE_ARCHIVE_AGE_DAYS`` old, so such responses never expire;
+    more recent ones may still be revised and get ``HTTP_CACHE_TTL``.
+    """
+    last = date.fromisoformat(str(last_day)[:10])
+    if last <= date.today() - timedelta(days=HTTP_CACHE_ARCHIVE_AGE_DAYS):
+        return FOREVER
+    return HTTP_CACHE_TTL
+
+
+def _entry_path(key: str) -> Path:
+    return ENTRIES_DIR / key[:2] / f"{key}.json"
+
+
+def _object_path(digest: str, suffix: str = "") -> Path:
+    return OBJECTS_DIR / digest[:2] / f"{digest}{suffix}"
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Write ``data`` to ``path`` via a unique temp file and rename."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+# ---------------------------------------------------------------------------
+# Lookup and store
+# ---------------------------------------------------------------------------
+def _load(key: str, allow_expired: bool) -> tuple[dict[str, Any], Path, bytes] | None:
+    """Return (entry, object path, body) for a valid cached response, else None."""
+    entry_path = _entry_path(key)
+    try:
+        entry = json.loads(entry_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    expires = entry.get("expires")
+    if expires is not None and expires < time.time() and not allow_expired:
+        return None
+    obj = _object_path(entry["sha256"], entry.get("suffix", ""))
+    try:
+        body = obj.read_bytes()
+    except FileNotFoundError:
+        entry_path.unlink(missing_ok=True)
+        return None
+    if hashlib.sha256(body).hexdigest() != entry["sha256"]:
+        logger.warning("Corrupt cache object %s; discarding", obj)
+        obj.unlink(missing_ok=True)
+        entry_path.unlink(missing_ok=True)
+        return None
+    os.utime(entry_path)  # mark as recently used
+    return entry, obj, body
+
+
+def _to_response(entry: dict[str, Any], body: bytes) -> requests.Response:
+    """Rebuild a ``requests.Response`` from a cache entry."""
+    resp = requests.Response()
+    resp.status_code = entry["status"]
+    resp.reason = entry.get("reason") or HTTPStatus(entry["status"]).phrase
+    resp.url = entry["url"]
+    resp.headers = CaseInsensitiveDict(entry.get("headers", {}))
+    resp.headers["X-Cache"] = "HIT"
+    resp.encoding = entry.get("encoding")
+    resp._content = body
+    return resp
+
+
+def _store(key: str, url: str, resp: requests.Response, ttl: float) -> Path:
+    """Store a successful response; return the object path."""
+    body = resp.content
+    digest = hashlib.sha256(body).hexdigest()
+    suffix = PurePosixPath(urlsplit(url).path).suffix
+    obj = _object_path(digest, suffix)
+    added = 0
+    if not obj.exists():
+        _atomic_write(obj, body)
+        added = len(body)
+    entry = {
+        "url": resp.url,
+        "status": resp.status_code,
+        "reason": resp.reason,
+        "sha256": digest,
+        "suffix": suffix,
+        "size": len(body),
+        "stored": time.time(),
+        "expires": None if ttl == FOREVER else time.time() + ttl,
+        "encoding": resp.encoding,
+        "headers": {k: v for k, v in resp.headers.items()
+                    if k.lower() in ("content-type", "last-modified", "etag")},
+    }
+    _atomic_write(_entry_path(key), json.dumps(entry).encode())
+    _account(added)
+    return obj
+
+
+def _account(added: int) -> None:
+    """Add ``added`` bytes to the running size; evict once over the limit."""
+    global _objects_bytes
+    with _size_lock:
+        if _objects_bytes is not None:
+            _objects_bytes += added
+            if _objects_bytes <= HTTP_CACHE_MAX_BYTES:
+                return
+        evict(int(HTTP_CACHE_MAX_BYTES * _EVICT_TO))
+
+
+def lookup(url: str, params: Params = None,
+           offline: bool | None = None) -> requests.Response | None:
+    """Cached response for ``url`` + ``params``, or None (never fetches)."""
+    offline = HTTP_OFFLINE if offline is None else offline
+    hit = _load(cache_key(url, params), allow_expired=offline)
+    if hit is None:
+        return None
+    entry, _, body = hit
+    return _to_response(entry, body)
+
+
+def get(
+    url: str,
+    params: Params = None,
+    ttl: float | None = None,
+    session: requests.Session | None = None,
+    offline: bool | None = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    ``requests.get`` through the cache.
+
+    Parameters
+    ----------
+    ttl : float or None
+        Seconds a fresh response stays valid; ``FOREVER`` never expires.
+        Defaults to ``config.HTTP_CACHE_TTL``.
+    session : requests.Session or None
+        Session used on a miss (keeps connection pooling per caller).
+    offline : bool or None
+        Override ``config.HTTP_OFFLINE``.
+    **kwargs
+        Passed to ``session.get`` (``timeout``, ``headers``, ...).
+
+    Only 200 responses are stored; anything else is returned as-is so
+    callers keep handling 429/5xx themselves.
+    """
+    offline = HTTP_OFFLINE if offline is None else offline
+    cached = lookup(url, params, offline=offline)
+    if cached is not None:
+        return cached
+    if offline:
+        raise HttpCacheMiss(f"Offline and not cached: {url} {params or ''}")
+
+    resp = (session or requests).get(url, params=params, **kwargs)
+    if resp.status_code == 200:
+        _store(cache_key(url, params), url, resp,
+               HTTP_CACHE_TTL if ttl is None else ttl)
+    resp.headers["X-Cache"] = "MISS"
+    return resp
+
+
+def fetch_path(url: str, params: Params = None, ttl: float | None = None,
+               **kwargs: Any) -> Path:
+    """
+    Local path of the cached body of ``url`` (downloading it if needed).
+
+    For consumers that need a file rather than bytes, e.g. a zipped
+    shapefile opened by GeoPandas.  The file keeps the URL's extension.
+    """
+    key = cache_key(url, params)
+    offline = kwargs.pop("offline", None)
+    offline = HTTP_OFFLINE if offline is None else offline
+    hit = _load(key, allow_expired=offline)
+    if hit is None:
+        resp = get(url, params, ttl=ttl, offline=offline, **kwargs)
+        resp.raise_for_status()
+        hit = _load(key, allow_expired=True)
+        if hit is None:
+            raise RuntimeError(f"{url} is larger than the HTTP cache limit")
+    return hit[1]
+
+
+# ---------------------------------------------------------------------------
+# Eviction
+# ---------------------------------------------------------------------------
+def evict(max_bytes: int = HTTP_CACHE_MAX_BYTES) -> int:
+    """
+    Drop least recently used entries until objects fit in ``max_bytes``.
+
+    An object is deleted once no remaining entry refers to it.  Returns
+    the number of entries removed.  Walks the whole tree, so ``_store``
+    only calls it when its running size estimate crosses the limit.
+    """
+    global _objects_bytes
+    if not OBJECTS_DIR.exists():
+        _objects_bytes = 0
+        return 0
+    sizes = {p.name: p.stat().st_size for p in OBJECTS_DIR.glob("*/*")
+             if not p.name.startswith(".tmp-")}
+    total = sum(sizes.values())
+    _objects_bytes = total
+    if total <= max_bytes:
+        return 0
+
+    entries = []
+    for path in ENTRIES_DIR.glob("*/*.json"):
+        try:
+            entry = json.loads(path.read_text())
+            entries.append((path.stat().st_mtime, path, entry))
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+    refs = Counter(e["sha256"] + e.get("suffix", "") for _, _, e in entries)
+
+    removed = 0
+    for _, path, entry in sorted(entries, key=lambda t: t[0]):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        removed += 1
+        name = entry["sha256"] + entry.get("suffix", "")
+        refs[name] -= 1
+        if refs[name] == 0 and name in sizes:
+            _object_path(entry["sha256"], entry.get("suffix", "")).unlink(missing_ok=True)
+            total -= sizes.pop(name)
+    _objects_bytes = total
+    logger.info("HTTP cache: evicted %d entries (%.1f MB left)", removed, total / 1e6)
+    return removed
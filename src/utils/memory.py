@@ -0,0 +1,162 @@
+"""
+Per-stage memory accounting for the batch pipelines.
+
+``StageMemory.stage(name)`` wraps one step of a pipeline and records:
+
+- resident set size before and after the stage and its peak *during*
+  the stage (Linux resets the high-water mark through
+  ``/proc/self/clear_refs``; elsewhere the process-lifetime peak from
+  ``getrusage`` is reported instead).  The reset also applies to
+  ``ru_maxrss``, so outside tools such as ``/usr/bin/time`` only see the
+  last stage's peak; ``write`` reports the maximum over all stages;
+- with ``trace=True``, the peak of Python/NumPy allocations during the
+  stage from ``tracemalloc`` (slows the run down noticeably);
+- the Arrow memory pool in use (Arrow buffers bypass ``tracemalloc``);
+  unused pool pages are released at the end of every stage.
+
+Records are logged as each stage ends and written as JSON by ``write``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger("memory")
+
+MB = 1024 * 1024
+_STATUS = Path("/proc/self/status")
+_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+
+def _status_kb(field: str) -> int | None:
+    """A ``VmRSS``/``VmHWM``-style field of /proc/self/status, in kB."""
+    try:
+        for line in _STATUS.read_text().splitlines():
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def rss_mb() -> float | None:
+    """Current resident set size in MB (None where /proc is unavailable)."""
+    kb = _status_kb("VmRSS")
+    return None if kb is None else kb / 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's RSS high-water mark; False if not supported."""
+    try:
+        _CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb(reset: bool) -> float:
+    """Peak RSS since the last reset (or since process start) in MB."""
+    kb = _status_kb("VmHWM") if reset else None
+    if kb is not None:
+        return kb / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    return peak / MB if sys.platform == "darwin" else peak / 1024
+
+
+def frame_mb(df: pd.DataFrame) -> float:
+    """Memory held by ``df``'s columns in MB (object columns included)."""
+    return float(df.memory_usage(index=True, deep=True).sum()) / MB
+
+
+def column_bytes(df: pd.DataFrame) -> dict[str, int]:
+    """Memory held by each column of ``df`` in bytes (deep)."""
+    usage = df.memory_usage(index=False, deep=True)
+    return {col: int(usage[col]) for col in df.columns}
+
+
+class StageMemory:
+    """
+    Collects time and memory records for named pipeline stages.
+
+    Parameters
+    ----------
+    trace : bool
+        Also track Python/NumPy allocation peaks with ``tracemalloc``.
+    """
+
+    def __init__(self, trace: bool = False) -> None:
+        self.trace = trace
+        self.records: list[dict[str, Any]] = []
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict[str, Any]]:
+        """
+        Measure the enclosed block as stage ``name``.
+
+        Yields the stage's record so the caller can add fields (e.g.
+        ``frame_mb`` of the frame the stage produced).
+        """
+        record: dict[str, Any] = {"stage": name, "rss_before_mb": rss_mb()}
+        reset = _reset_peak_rss()
+        if self.trace:
+            tracemalloc.reset_peak()
+        pa_before = pa.total_allocated_bytes()
+        t0 = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - t0, 3)
+            # Arrow's allocator keeps freed pages around; hand them back so
+            # the next stage starts from what is actually live.
+            pa.default_memory_pool().release_unused()
+            record["rss_after_mb"] = rss_mb()
+            record["rss_peak_mb"] = _peak_rss_mb(reset)
+            record["rss_peak_scope"] = "stage" if reset else "process"
+            record["arrow_mb"] = pa.total_allocated_bytes() / MB
+            record["arrow_delta_mb"] = (pa.total_allocated_bytes() - pa_before) / MB
+            if self.trace:
+                current, peak = tracemalloc.get_traced_memory()
+                record["traced_current_mb"] = current / MB
+                record["traced_peak_mb"] = peak / MB
+            for key, value in record.items():
+                if isinstance(value, float):
+                    record[key] = round(value, 1)
+            self.records.append(record)
+            logger.info(
+                "[%s] %.1f s, RSS %s -> %s MB (peak %s MB%s)%s",
+                name, record["seconds"], record["rss_before_mb"],
+                record["rss_after_mb"], record["rss_peak_mb"],
+                "" if reset else ", process lifetime",
+                f", traced peak {record['traced_peak_mb']} MB" if self.trace else "",
+            )
+
+    def write(self, path: Path, **meta: Any) -> Path:
+        """Write all records (plus ``meta`` fields) to ``path`` as JSON."""
+        peak = max((r["rss_peak_mb"] for r in self.records), default=None)
+        payload = {
+            "pid": os.getpid(),
+            "tracemalloc": self.trace,
+            "peak_rss_mb": peak,
+            **meta,
+            "stages": self.records,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, indent=2))
+        logger.info("Memory report saved to %s (peak RSS %s MB)", path, peak)
+        return path
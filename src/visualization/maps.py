@@ -29,10 +29,8 @@ import geopandas as gpd
 # ---------------------------------------------------------------------------
 sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 from src.utils.config import (
-    PROCESSED_DIR,
     MODELS_DIR,
     FIGURES_DIR,
-    RAW_DIR,
     RANDOM_SEED,
     ALL_CONFOUNDERS,
     HETEROGENEITY_MODERATORS,
@@ -42,6 +40,8 @@ from src.utils.config import (
     LOG_FORMAT,
     LOG_DATE_FORMAT,
 )
+from src.utils import http_cache
+from src.data import panel_store
 
 logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 logger = logging.getLogger("maps")
@@ -58,22 +58,15 @@ IBGE_UF_URL = (
 
 def get_brazil_shapefile() -> gpd.GeoDataFrame:
     """
-    Load the IBGE UF-level shapefile.  Downloads once, caches locally.
+    Load the IBGE UF-level shapefile.
+
+    The zip is downloaded once into the shared HTTP cache, where it is
+    stored under its SHA-256 and re-validated on every read; the 2022
+    mesh is a fixed release, so the entry never expires.
     """
-    cache_dir = RAW_DIR / "shapefiles"
-    cache_dir.mkdir(parents=True, exist_ok=True)
-    local_path = cache_dir / "BR_UF_2022.zip"
-
-    if not local_path.exists():
-        logger.info("Downloading IBGE shapefile from %s", IBGE_UF_URL)
-        import requests
-        resp = requests.get(IBGE_UF_URL, timeout=120)
-        resp.raise_for_status()
-        local_path.write_bytes(resp.content)
-        logger.info("Saved shapefile to %s (%.1f MB)",
-                     local_path, local_path.stat().st_size / 1e6)
-    else:
-        logger.info("Using cached shapefile %s", local_path)
+    local_path = http_cache.fetch_path(IBGE_UF_URL, ttl=http_cache.FOREVER,
+                                       timeout=120)
+    logger.info("Using shapefile %s", local_path)
 
     gdf = gpd.read_file(f"zip://{local_path}")
     logger.info("Shapefile loaded: %d features, CRS=%s", len(gdf), gdf.crs)
@@ -92,7 +85,7 @@ def compute_city_cate() -> pd.DataFrame:
     with open(model_path, "rb") as f:
         cf = pickle.load(f)
 
-    panel = pd.read_parquet(PROCESSED_DIR / "analysis_panel.parquet")
+    panel = panel_store.load_panel(panel_store.model_columns([OUTCOME_TOTAL], extra=["city"]))
 
     available_moderators = [c for c in HETEROGENEITY_MODERATORS if c in panel.columns]
     available_confounders = [c for c in ALL_CONFOUNDERS if c in panel.columns]
@@ -105,7 +98,7 @@ def compute_city_cate() -> pd.DataFrame:
 
     city_cate = (
         subset
-        .groupby("city")
+        .groupby("city", observed=True)
         .agg(
             mean_cate=("cate", "mean"),
             median_cate=("cate", "median"),
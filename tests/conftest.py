@@ -0,0 +1,6 @@
+"""Put the repository root on ``sys.path`` so tests import ``src.*``."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
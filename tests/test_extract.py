@@ -0,0 +1,50 @@
+"""Page typing and incremental extraction marks."""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from src.data import extract
+
+
+def test_watermark_of_datetimes_is_an_iso_date():
+    df = pd.DataFrame({"date": pd.to_datetime(["2025-10-15", "2025-10-16", None])})
+    assert extract.compute_watermark(df, "weather_history") == {"date": "2025-10-16"}
+
+
+def test_watermark_keeps_time_and_plain_numbers():
+    df = pd.DataFrame({"date": pd.to_datetime(["2025-10-16 12:30"])})
+    assert extract.compute_watermark(df, "weather_history") == {"date": "2025-10-16T12:30:00"}
+    df = pd.DataFrame({"date": [dt.date(2025, 1, 2), dt.date(2024, 5, 1)]})
+    assert extract.compute_watermark(df, "weather_history") == {"date": "2025-01-02"}
+
+    fleet = pd.DataFrame({"year": np.array([2024, 2025, 2025], dtype=np.int16),
+                          "month": np.array([12, 3, 1], dtype=np.int8)})
+    mark = extract.compute_watermark(fleet, "fleet_history")
+    assert mark == {"year": 2025, "month": 3}
+    assert type(mark["year"]) is int
+
+
+def test_watermark_of_empty_table_is_none():
+    assert extract.compute_watermark(pd.DataFrame({"date": []}), "weather_history") is None
+    assert extract.compute_watermark(pd.DataFrame({"id": [1]}), "weather_history") is None
+
+
+def test_watermark_filters():
+    assert extract.watermark_filters("weather_history", {"date": "2025-10-16"}) == [
+        ("date", "gt.2025-10-16")]
+    assert extract.watermark_filters("fleet_history", {"year": 2025, "month": 6}) == [
+        ("or", "(year.gt.2025,and(year.eq.2025,month.gt.6))")]
+
+
+def test_rows_to_table_casts_numeric_codes_to_dictionary():
+    schema = extract.arrow_schema("demographics_history")
+    rows = [{"id": "a", "city": "Recife", "ibge_code": 2611606, "year": 2022,
+             "population": 1_500_000, "density": 7000.5}]
+    table = extract._rows_to_table(rows, schema)
+    assert table.schema == schema
+    assert table.column("ibge_code").to_pylist() == ["2611606"]
+    assert table.column("pop_0_14").null_count == 1
+    assert table.column("density").type == pa.float64()
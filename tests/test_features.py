@@ -0,0 +1,71 @@
+"""Vectorized per-city lags and moving averages against pandas groupby."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.features import block_positions, lag_features, rolling_means
+
+WINDOWS = [3, 7, 14]
+
+
+def _panel(seed: int) -> pd.DataFrame:
+    """Cities of uneven length with NaNs, repeated values and one-signed runs."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(1, 40, 25)
+    city = np.repeat([f"city{i:02d}" for i in range(len(lengths))], lengths)
+    n = len(city)
+    pm25 = rng.lognormal(2.5, 0.8, n)
+    pm25[rng.random(n) < 0.15] = np.nan
+    temperature = np.round(rng.normal(0, 5, n), 1)         # both signs, many ties
+    temperature[rng.random(n) < 0.3] = 21.5
+    negative = -rng.exponential(1e-3, n)                   # one sign, tiny values
+    return pd.DataFrame({
+        "city": city,
+        "date": np.concatenate([pd.date_range("2022-01-01", periods=k) for k in lengths]),
+        "pm25": pm25,
+        "temperature_mean": temperature,
+        "anomaly": negative,
+        "admissions": rng.integers(0, 50, n).astype(np.int32),
+    })
+
+
+def test_block_positions():
+    keys = np.array([3, 3, 3, 1, 2, 2])
+    np.testing.assert_array_equal(block_positions(keys), [0, 1, 2, 0, 0, 1])
+    assert len(block_positions(np.array([]))) == 0
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_lag_features_match_groupby(seed):
+    df = _panel(seed)
+    variables = ["pm25", "temperature_mean", "anomaly", "admissions"]
+    got = lag_features(df, variables, max_lag=3, windows=WINDOWS)
+
+    grouped = df.groupby("city", sort=False)
+    for var in variables:
+        for lag in range(1, 4):
+            expected = grouped[var].shift(lag)
+            pd.testing.assert_series_equal(got[f"{var}_lag{lag}"], expected,
+                                           check_names=False, check_dtype=False)
+        for w in WINDOWS:
+            expected = grouped[var].transform(
+                lambda s: s.rolling(w, min_periods=1).mean())
+            # Bit for bit, not approximately
+            np.testing.assert_array_equal(got[f"{var}_ma{w}"].to_numpy(),
+                                          expected.to_numpy(np.float64))
+    assert list(got.columns[:len(variables)]) == [f"{v}_lag1" for v in variables]
+
+
+def test_rolling_means_all_nan_block_stays_nan():
+    values = np.array([[np.nan, np.nan, 1.0, np.nan, np.nan, np.nan, 4.0]])
+    pos = np.array([0, 1, 0, 1, 2, 3, 0])
+    got = rolling_means(values, pos, [2])[0, 0]
+    np.testing.assert_array_equal(got, [np.nan, np.nan, 1.0, 1.0, np.nan, np.nan, 4.0])
+
+
+def test_empty_frame():
+    df = _panel(0).iloc[:0]
+    got = lag_features(df, ["pm25"], max_lag=1, windows=[7])
+    assert list(got.columns) == ["pm25_lag1", "pm25_ma7"]
+    assert len(got) == 0
@@ -0,0 +1,139 @@
+"""Point sampling and daily reduction of gridded ERA5/CAMS fields."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data import gridded
+from src.data.gridded import GridIndex, reduce_daily
+
+xr = pytest.importorskip("xarray")
+
+# ERA5 layout: latitudes descend, longitudes run 0..360
+LAT = np.arange(0.0, -10.25, -0.25)
+LON = np.arange(300.0, 310.25, 0.25)
+POINTS = pd.DataFrame({
+    "city": ["A", "B", "C"],
+    "lat": [-3.1, -7.93, -0.25],
+    "lon": [-58.37, -55.01, -59.9],
+})
+
+
+def _linear(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    return 2.0 * lat - 0.5 * lon + 3.0
+
+
+# ---------------------------------------------------------------------------
+# GridIndex
+# ---------------------------------------------------------------------------
+def test_bilinear_is_exact_on_linear_fields():
+    index = GridIndex(LAT, LON, POINTS["lat"], POINTS["lon"], "bilinear")
+    assert len(index.corners) == 4
+    np.testing.assert_allclose(sum(w for _, _, w in index.corners), 1.0)
+
+    field = _linear(LAT[:, None], LON[None, :])
+    got = index.sample(field[index.window])
+    np.testing.assert_allclose(got, _linear(POINTS["lat"], POINTS["lon"] % 360))
+
+
+def test_window_covers_only_the_points():
+    index = GridIndex(LAT, LON, POINTS["lat"], POINTS["lon"], "bilinear")
+    rows, cols = index.window
+    assert (rows.start, rows.stop) == (1, 33)     # -0.25 .. -8.0
+    assert (cols.start, cols.stop) == (0, 21)     # 300.0 .. 305.0
+
+
+def test_nearest_picks_the_closest_grid_point():
+    index = GridIndex(LAT, LON, POINTS["lat"], POINTS["lon"], "nearest")
+    field = _linear(LAT[:, None], LON[None, :])
+    expected = _linear(np.array([-3.0, -8.0, -0.25]), np.array([301.75, 305.0, 300.0]))
+    np.testing.assert_allclose(index.sample(field[index.window]), expected)
+
+
+def test_points_outside_the_grid_raise():
+    with pytest.raises(ValueError, match="outside the grid"):
+        GridIndex(LAT, LON, np.array([5.0]), np.array([-55.0]))
+
+
+# ---------------------------------------------------------------------------
+# Daily reduction
+# ---------------------------------------------------------------------------
+def test_reduce_daily_skips_missing_values():
+    values = np.array([[1.0], [np.nan], [3.0], [4.0], [np.nan]])
+    day = np.array([0, 0, 0, 2, 2])
+    np.testing.assert_array_equal(reduce_daily(values, day, 3, "mean")[:, 0], [2, np.nan, 4])
+    np.testing.assert_array_equal(reduce_daily(values, day, 3, "sum")[:, 0], [4, np.nan, 4])
+    np.testing.assert_array_equal(reduce_daily(values, day, 3, "max")[:, 0], [3, np.nan, 4])
+
+
+def test_wind_direction_is_where_the_wind_comes_from():
+    # u + iv per hour; day 0: from the north, day 1: from the west,
+    # day 2: the mean of a westerly and a southerly wind (south-west)
+    wind = np.array([[0 - 1j], [1 + 0j], [1 + 0j], [0 + 1j]])
+    day = np.array([0, 1, 2, 2])
+    got = reduce_daily(wind, day, 3, "direction")[:, 0]
+    np.testing.assert_allclose(got, [0.0, 270.0, 225.0], atol=1e-9)
+
+
+# ---------------------------------------------------------------------------
+# Files
+# ---------------------------------------------------------------------------
+def _era5(path, times: pd.DatetimeIndex, first_hour: int = 0) -> None:
+    """Hourly t2m of 273.15 + hour number + 0.1 * lat; 2 m/s easterly wind."""
+    hours = first_hour + np.arange(len(times), dtype=np.float64)[:, None, None]
+    shape = (len(times), len(LAT), len(LON))
+    t2m = np.broadcast_to(273.15 + hours + 0.1 * LAT[None, :, None], shape)
+    xr.Dataset(
+        {"t2m": (("valid_time", "latitude", "longitude"), t2m.astype("float32")),
+         "u10": (("valid_time", "latitude", "longitude"), np.full(shape, -2.0, "float32")),
+         "v10": (("valid_time", "latitude", "longitude"), np.zeros(shape, "float32"))},
+        coords={"valid_time": times, "latitude": LAT, "longitude": LON},
+    ).to_netcdf(path, engine="scipy")
+
+
+def test_extract_daily_uses_complete_local_days(tmp_path):
+    # 2022-01-01 00:00 to 2022-01-03 12:00 UTC, split over two files.
+    # Local (UTC-3) days: Dec 31 and Jan 3 are partial, Jan 1 and 2 full.
+    times = pd.date_range("2022-01-01 00:00", "2022-01-03 12:00", freq="h")
+    _era5(tmp_path / "era5_a.nc", times[:30])
+    _era5(tmp_path / "era5_b.nc", times[25:], first_hour=25)   # overlaps the first
+    files = gridded.list_grid_files(tmp_path)
+    got = gridded.extract_daily("weather", files, POINTS, "bilinear",
+                                start="2021-12-31", end="2022-01-03", block_days=2)
+
+    assert sorted(got["date"].dt.strftime("%Y-%m-%d").unique()) == ["2022-01-01", "2022-01-02"]
+    assert len(got) == 2 * len(POINTS)
+    got = got.set_index(["city", "date"])
+    for city, lat in zip(POINTS["city"], POINTS["lat"]):
+        # Local Jan 1 is UTC hours 3..26, Jan 2 hours 27..50
+        for date, mean_hour in [("2022-01-01", 14.5), ("2022-01-02", 38.5)]:
+            row = got.loc[(city, pd.Timestamp(date))]
+            assert row["temperature_mean"] == pytest.approx(mean_hour + 0.1 * lat, abs=1e-3)
+            assert row["temperature_max"] == pytest.approx(mean_hour + 11.5 + 0.1 * lat,
+                                                           abs=1e-3)
+            assert row["wind_direction_dominant"] == pytest.approx(90.0)
+            assert row["wind_speed_max"] == pytest.approx(7.2)
+    assert "precipitation_sum" not in got.columns
+
+
+def test_concentrations_need_units(tmp_path):
+    times = pd.date_range("2022-01-01", periods=16, freq="3h")
+    shape = (len(times), len(LAT), len(LON))
+    data = np.full(shape, 1e-9, dtype="float32")
+    ds = xr.Dataset(
+        {"pm2p5": (("time", "latitude", "longitude"), data, {"units": "kg m**-3"}),
+         "go3": (("time", "latitude", "longitude"), data, {"units": "kg kg**-1"})},
+        coords={"time": times, "latitude": LAT, "longitude": LON},
+    )
+    ds.to_netcdf(tmp_path / "cams.nc", engine="scipy")
+    got = gridded.extract_daily("air_quality", [tmp_path / "cams.nc"], POINTS, "nearest",
+                                start="2022-01-01", end="2022-01-02")
+    # 3-hourly: local Jan 1 needs all eight steps from 03:00 UTC to 00:00 UTC
+    assert list(got["date"].unique()) == [pd.Timestamp("2022-01-01")]
+    np.testing.assert_allclose(got["pm25"], 1.0, rtol=1e-6)
+    np.testing.assert_allclose(got["o3"], gridded.AIR_DENSITY, rtol=1e-6)
+
+    del ds["go3"].attrs["units"]
+    ds.to_netcdf(tmp_path / "cams_nounits.nc", engine="scipy")
+    with pytest.raises(ValueError, match="no units"):
+        gridded.extract_daily("air_quality", [tmp_path / "cams_nounits.nc"], POINTS)
@@ -0,0 +1,108 @@
+"""Streaming city-day aggregation of the raw health table."""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.data import health_stream, raw_store
+from src.data.health_stream import CityDayAccumulator, _day_offsets, respiratory_mask
+from src.utils.config import ANALYSIS_END, ANALYSIS_START, HEALTH_AGG_COLUMNS
+
+KEYS = ["city", "date", "ibge_code"]
+DATES = ["2021-12-31", "2022-01-01", "2022-01-02", "2023-06-15", "2025-12-31", "2026-01-01"]
+
+
+def _health_rows(n: int, n_cities: int, seed: int) -> pd.DataFrame:
+    """A tiny raw health table straddling both ends of the analysis window."""
+    rng = np.random.default_rng(seed)
+    city = rng.integers(0, n_cities, n)
+    df = pd.DataFrame({
+        "city": [f"city{c:03d}" for c in city],
+        "date": pd.to_datetime(rng.choice(DATES, n)).astype("datetime64[ns]"),
+        "ibge_code": [f"{1_000_000 + c}" for c in city],
+        "cid_category": rng.choice(["respiratory", "Respiratory (other)",
+                                    "cardiovascular", None], n),
+    })
+    for col in HEALTH_AGG_COLUMNS[:-1]:
+        df[col] = rng.integers(0, 5, n).astype(np.int32)
+    cost = rng.uniform(0, 1000, n)
+    cost[rng.random(n) < 0.1] = np.nan
+    df["total_cost"] = cost
+    return df
+
+
+def _expected(df: pd.DataFrame, cities: list[str] | None = None) -> pd.DataFrame:
+    """The in-memory aggregation ``stream_health`` replaces."""
+    keep = (respiratory_mask(df["cid_category"])
+            & (df["date"] >= ANALYSIS_START) & (df["date"] <= ANALYSIS_END))
+    if cities is not None:
+        keep &= df["city"].isin(cities)
+    return (df[keep].groupby(KEYS, observed=True)[HEALTH_AGG_COLUMNS]
+            .sum().reset_index())
+
+
+def _assert_same(got: pd.DataFrame, expected: pd.DataFrame) -> None:
+    got = got.astype({"city": str, "ibge_code": str})
+    pd.testing.assert_frame_equal(got, expected)
+
+
+@pytest.fixture
+def raw_files(tmp_path, monkeypatch):
+    """Point the raw store at a typed base file and a legacy fragment."""
+    df = _health_rows(3000, n_cities=90, seed=1)
+    base, legacy = df.iloc[:2000], df.iloc[2000:]
+
+    typed = pa.Table.from_pandas(
+        base.assign(date=base["date"].dt.date), preserve_index=False)
+    assert typed.schema.field("date").type == pa.date32()
+    typed_path = tmp_path / "health_hospitalizations.parquet"
+    pq.write_table(typed, typed_path, row_group_size=250)
+
+    # Older extracts stored the date as text
+    strings = legacy.assign(date=legacy["date"].dt.strftime("%Y-%m-%d"))
+    legacy_path = tmp_path / "part-legacy.parquet"
+    pq.write_table(pa.Table.from_pandas(strings, preserve_index=False), legacy_path)
+
+    monkeypatch.setattr(raw_store, "list_raw_files",
+                        lambda table_name: [typed_path, legacy_path])
+    return df
+
+
+def test_accumulator_matches_groupby():
+    df = _health_rows(500, n_cities=5, seed=0)
+    df = df[df["date"].between(ANALYSIS_START, ANALYSIS_END)]
+    acc = CityDayAccumulator(ANALYSIS_START, ANALYSIS_END, HEALTH_AGG_COLUMNS)
+    for chunk in np.array_split(np.arange(len(df)), 4):
+        batch = df.iloc[chunk]
+        acc.add(batch, _day_offsets(batch["date"], acc.start))
+    expected = df.groupby(KEYS)[HEALTH_AGG_COLUMNS].sum().reset_index()
+    _assert_same(acc.result(), expected)
+
+
+def test_day_offsets_parse_strings():
+    dates = pd.Series(["2022-01-01", "2022-01-03", "not a date", None])
+    offsets = _day_offsets(dates, np.datetime64("2022-01-01"))
+    np.testing.assert_array_equal(offsets, [0, 2, -1, -1])
+
+
+def test_stream_health_matches_in_memory(raw_files):
+    # Small batches: many batches per file and several capacity increases
+    got = health_stream.stream_health(batch_rows=97)
+    _assert_same(got, _expected(raw_files))
+
+
+def test_stream_health_city_shard(raw_files):
+    cities = ["city001", "city042", "city077"]
+    got = health_stream.stream_health(cities=cities, batch_rows=50)
+    assert set(got["city"].astype(str)) == set(cities)
+    _assert_same(got, _expected(raw_files, cities))
+
+
+def test_scan_filter_skips_window_on_string_dates():
+    typed = pa.schema([("city", pa.string()), ("date", pa.date32())])
+    legacy = pa.schema([("city", pa.string()), ("date", pa.string())])
+    assert "date" in str(health_stream._scan_filter(typed, None))
+    assert health_stream._scan_filter(legacy, None) is None
+    assert "date" not in str(health_stream._scan_filter(legacy, ["city001"]))
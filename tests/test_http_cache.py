@@ -0,0 +1,125 @@
+"""Content-addressed HTTP cache: keys, TTLs, offline mode and eviction."""
+
+import datetime as dt
+import os
+
+import pytest
+import requests
+
+from src.utils import http_cache
+
+URL = "https://example.org/archive"
+
+
+class FakeSession:
+    """Answers every GET with ``body`` and counts the calls."""
+
+    def __init__(self, body: bytes = b'{"ok": 1}', status: int = 200) -> None:
+        self.body, self.status, self.calls = body, status, 0
+
+    def get(self, url, params=None, **kwargs) -> requests.Response:
+        self.calls += 1
+        resp = requests.Response()
+        resp.status_code = self.status
+        resp.reason = "Too Many Requests" if self.status == 429 else "OK"
+        resp.url = url
+        resp._content = self.body
+        resp.headers["Content-Type"] = "application/json"
+        return resp
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "ENTRIES_DIR", tmp_path / "entries")
+    monkeypatch.setattr(http_cache, "OBJECTS_DIR", tmp_path / "objects")
+    monkeypatch.setattr(http_cache, "HTTP_OFFLINE", False)
+    monkeypatch.setattr(http_cache, "_objects_bytes", None)
+    return tmp_path
+
+
+def test_key_ignores_param_order_and_types():
+    assert (http_cache.cache_key(URL, {"a": 1, "b": "x"})
+            == http_cache.cache_key(URL, [("b", "x"), ("a", "1")]))
+    assert http_cache.cache_key(URL, {"a": 1}) != http_cache.cache_key(URL, {"a": 2})
+
+
+def test_archive_ttl():
+    assert http_cache.archive_ttl("2020-01-01") == http_cache.FOREVER
+    today = dt.date.today().isoformat()
+    assert http_cache.archive_ttl(today) == http_cache.HTTP_CACHE_TTL
+
+
+def test_miss_then_hit():
+    session = FakeSession()
+    first = http_cache.get(URL, {"a": 1}, session=session)
+    second = http_cache.get(URL, {"a": 1}, session=session)
+    assert session.calls == 1
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == {"ok": 1}
+    assert (second.status_code, second.reason) == (200, "OK")
+
+
+def test_expired_entries_are_refetched_unless_offline():
+    session = FakeSession()
+    http_cache.get(URL, session=session, ttl=-1)
+    http_cache.get(URL, session=session, ttl=-1)
+    assert session.calls == 2
+    assert http_cache.get(URL, session=session, offline=True).headers["X-Cache"] == "HIT"
+    with pytest.raises(http_cache.HttpCacheMiss):
+        http_cache.get(URL, {"other": 1}, session=session, offline=True)
+
+
+def test_errors_are_not_stored():
+    session = FakeSession(status=429)
+    resp = http_cache.get(URL, session=session)
+    assert (resp.status_code, resp.reason) == (429, "Too Many Requests")
+    assert http_cache.lookup(URL) is None
+
+
+def test_corrupt_object_is_a_miss():
+    session = FakeSession()
+    path = http_cache.fetch_path(URL, session=session)
+    path.write_bytes(b"truncated")
+    assert http_cache.lookup(URL) is None
+    http_cache.get(URL, session=session)
+    assert session.calls == 2
+
+
+def _store(key: str, body: bytes, used: float) -> None:
+    http_cache.get(URL, {"k": key}, session=FakeSession(body))
+    entry = http_cache._entry_path(http_cache.cache_key(URL, {"k": key}))
+    os.utime(entry, (used, used))
+
+
+def test_evict_drops_least_recently_used(monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_MAX_BYTES", 10_000)
+    _store("old", b"a" * 1000, used=1_000)
+    _store("shared-1", b"b" * 1000, used=2_000)
+    _store("shared-2", b"b" * 1000, used=3_000)     # same body, stored once
+    _store("new", b"c" * 1000, used=4_000)
+
+    assert http_cache.evict(max_bytes=1500) == 3
+    assert http_cache.lookup(URL, {"k": "old"}) is None
+    # The shared body goes only once both of its entries are gone
+    assert http_cache.lookup(URL, {"k": "shared-1"}) is None
+    assert http_cache.lookup(URL, {"k": "shared-2"}) is None
+    assert http_cache.lookup(URL, {"k": "new"}) is not None
+    assert http_cache._objects_bytes == 1000
+
+
+def test_store_evicts_only_past_the_limit(monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_CACHE_MAX_BYTES", 5000)
+    scans = []
+    evict = http_cache.evict
+    monkeypatch.setattr(http_cache, "evict", lambda max_bytes: scans.append(max_bytes)
+                        or evict(max_bytes))
+    for i in range(12):
+        http_cache.get(URL, {"k": i}, session=FakeSession(bytes([i]) * 1000))
+    # One scan to seed the running size, then one per overflow: each trims
+    # to 90% of the limit, so a full cache is not rescanned on every write
+    assert len(scans) < 12
+    assert all(limit == 4500 for limit in scans[1:])
+    total = sum(p.stat().st_size for p in http_cache.OBJECTS_DIR.glob("*/*"))
+    assert total <= 5000
+    assert http_cache._objects_bytes == total
@@ -0,0 +1,90 @@
+"""Annual-to-daily interpolation against per-city numpy/scipy references."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data.interpolate import _anchor_days, annual_to_daily
+
+COLS = ["population", "density"]
+
+
+def _tables(seed: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Annual rows with missing values and shuffled order; daily targets."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(12):
+        years = np.sort(rng.choice(np.arange(2018, 2027), rng.integers(1, 7), replace=False))
+        for year in years:
+            rows.append((f"city{i:02d}", year, int(rng.integers(10_000, 2_000_000)),
+                         rng.uniform(10, 8000)))
+    annual = pd.DataFrame(rows, columns=["city", "year", *COLS])
+    annual.loc[rng.random(len(annual)) < 0.2, "density"] = np.nan
+    annual = annual.sample(frac=1.0, random_state=seed, ignore_index=True)
+
+    dates = pd.date_range("2017-06-01", "2027-03-01", freq="17D")
+    targets = pd.DataFrame({
+        "city": np.repeat([f"city{i:02d}" for i in range(13)], len(dates)),  # city12: none
+        "date": np.tile(dates, 13),
+    }).sample(frac=1.0, random_state=seed)
+    return annual, targets
+
+
+def _reference(annual, targets, col, interpolate) -> np.ndarray:
+    """One city at a time, with ``interpolate(x, xp, fp)``."""
+    out = np.full(len(targets), np.nan)
+    day = targets["date"].to_numpy("datetime64[D]").astype(np.int64)
+    for city, rows in annual.dropna(subset=[col]).groupby("city"):
+        rows = rows.sort_values("year")
+        xp = _anchor_days(rows["year"].to_numpy(), "07-01")
+        mask = (targets["city"] == city).to_numpy()
+        x = np.clip(day[mask], xp[0], xp[-1])
+        fp = rows[col].to_numpy(np.float64)
+        out[mask] = fp[0] if len(xp) == 1 else interpolate(x, xp, fp)
+    return out
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_linear_matches_np_interp(seed):
+    annual, targets = _tables(seed)
+    got = annual_to_daily(annual, targets, COLS, mode="linear")
+    assert got.index.equals(targets.index)
+    for col in COLS:
+        np.testing.assert_allclose(got[col], _reference(annual, targets, col, np.interp),
+                                   rtol=1e-12)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_spline_matches_scipy_pchip(seed):
+    interpolate = pytest.importorskip("scipy.interpolate")
+    annual, targets = _tables(seed)
+    got = annual_to_daily(annual, targets, COLS, mode="spline")
+    pchip = lambda x, xp, fp: interpolate.PchipInterpolator(xp, fp)(x)  # noqa: E731
+    for col in COLS:
+        np.testing.assert_allclose(got[col], _reference(annual, targets, col, pchip),
+                                   rtol=1e-10)
+
+
+def test_step_holds_the_calendar_year():
+    annual = pd.DataFrame({"city": ["A", "A", "A"], "year": [2020, 2022, 2022],
+                           "population": [100, 300, 400]})
+    targets = pd.DataFrame({"city": ["A"] * 5 + ["B"], "date": pd.to_datetime(
+        ["2019-06-01", "2020-12-31", "2021-01-01", "2022-01-01", "2030-01-01", "2022-01-01"])})
+    got = annual_to_daily(annual, targets, ["population"], mode="step")["population"]
+    # 2021 carries 2020 forward; a duplicated year keeps the last row
+    np.testing.assert_array_equal(got, [100, 100, 100, 400, 400, np.nan])
+    assert got.dtype == np.float64
+
+
+def test_float32_columns_keep_their_dtype():
+    annual = pd.DataFrame({"city": ["A", "A"], "year": [2020, 2021],
+                           "density": np.array([1.0, 2.0], dtype=np.float32)})
+    targets = pd.DataFrame({"city": ["A"], "date": pd.to_datetime(["2020-12-31"])})
+    got = annual_to_daily(annual, targets, ["density"])
+    assert got["density"].dtype == np.float32
+
+
+def test_unknown_mode_raises():
+    annual, targets = _tables(0)
+    with pytest.raises(ValueError, match="Unknown interpolation mode"):
+        annual_to_daily(annual, targets, COLS, mode="cubic")
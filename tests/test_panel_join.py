@@ -0,0 +1,75 @@
+"""Integer-keyed (city, date) joins against pd.merge."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data import panel_join
+from src.data.panel_join import city_codes, join
+from src.utils.config import CAPITALS
+
+NAMES = list(CAPITALS)
+
+
+def _daily(cities: list[str], dates: pd.DatetimeIndex, seed: int, *columns: str) -> pd.DataFrame:
+    """Every (city, date) once, shuffled, with random float columns."""
+    rng = np.random.default_rng(seed)
+    df = pd.MultiIndex.from_product([cities, dates], names=["city", "date"]).to_frame(
+        index=False)
+    for name in columns:
+        df[name] = rng.normal(size=len(df))
+    return df.sample(frac=1.0, random_state=seed, ignore_index=True)
+
+
+@pytest.fixture
+def frames():
+    left = _daily(NAMES[:6], pd.date_range("2022-01-01", periods=40), 0,
+                  "pm25", "temperature_mean")
+    right = _daily(NAMES[2:9] + ["Campinas"], pd.date_range("2022-01-20", periods=40), 1,
+                   "admissions", "temperature_mean")
+    left.loc[3, "city"] = None
+    left.loc[5, "date"] = pd.NaT
+    return left, right
+
+
+def test_city_codes_put_capitals_first():
+    a, b = city_codes(pd.Series(["Campinas", NAMES[3], None]),
+                      pd.Series([NAMES[0], "Abaetetuba"], dtype="category"))
+    np.testing.assert_array_equal(a, [28, 3, -1])
+    np.testing.assert_array_equal(b, [0, 27])
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+@pytest.mark.parametrize("direct", [True, False])
+def test_join_matches_merge(frames, how, direct, monkeypatch):
+    if not direct:
+        monkeypatch.setattr(panel_join, "DIRECT_INDEX_FACTOR", 0)   # sort + searchsorted
+    left, right = frames
+    got = join(left, right, how=how)
+    # pd.merge pairs a missing key with nothing on the right here either
+    expected = pd.merge(left, right, on=["city", "date"], how=how)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_join_keeps_left_categoricals(frames):
+    left, right = frames
+    left = left.dropna().astype({"city": "category"})
+    right = right.astype({"city": "category"})
+    got = join(left, right)
+    assert got["city"].dtype == left["city"].dtype
+    expected = pd.merge(left.astype({"city": str}), right.astype({"city": str}),
+                        on=["city", "date"])
+    pd.testing.assert_frame_equal(got.astype({"city": str}), expected)
+
+
+def test_duplicate_right_keys_fall_back_to_merge(frames, caplog):
+    left, right = frames
+    right = pd.concat([right, right.iloc[:5]], ignore_index=True)
+    got = join(left, right, how="left")
+    pd.testing.assert_frame_equal(got, pd.merge(left, right, on=["city", "date"], how="left"))
+    assert "duplicate" in caplog.text
+
+
+def test_unsupported_join_type():
+    with pytest.raises(ValueError, match="Unsupported join type"):
+        join(pd.DataFrame(), pd.DataFrame(), how="outer")
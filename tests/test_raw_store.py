@@ -0,0 +1,55 @@
+"""Raw store fragments, compaction and deterministic row ids."""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.data import raw_store
+
+TABLE = "weather_history"
+
+
+@pytest.fixture(autouse=True)
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(raw_store, "RAW_DIR", tmp_path)
+    return tmp_path
+
+
+def _weather(cities: list[str], dates: list[str], temperature: float) -> pa.Table:
+    df = pd.DataFrame({"city": cities, "date": dates})
+    df["id"] = raw_store.key_ids(df, ["city", "date"])
+    df["temperature_mean"] = temperature
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def test_key_ids_are_deterministic():
+    df = pd.DataFrame({"city": ["Recife", "Recife", "Belém"],
+                       "date": ["2022-01-01", "2022-01-02", "2022-01-01"]})
+    ids = raw_store.key_ids(df, ["city", "date"])
+    assert len(set(ids)) == 3
+    assert all(len(i) == 16 for i in ids)
+    assert list(raw_store.key_ids(df.iloc[::-1], ["city", "date"])) == list(ids[::-1])
+
+
+def test_compact_keeps_the_newest_row_per_key():
+    pq.write_table(_weather(["A", "A", "B"], ["2022-01-01", "2022-01-02", "2022-01-01"], 1.0),
+                   raw_store.raw_path(TABLE))
+    # A re-fetch of A on Jan 2 and a new day, then a second revision of Jan 2
+    raw_store.append_fragment(_weather(["A", "A"], ["2022-01-02", "2022-01-03"], 2.0), TABLE)
+    raw_store.append_fragment(_weather(["A"], ["2022-01-02"], 3.0), TABLE)
+    assert len(raw_store.list_raw_files(TABLE)) == 3
+
+    assert raw_store.compact(TABLE) == 4
+    assert raw_store.list_raw_files(TABLE) == [raw_store.raw_path(TABLE)]
+    got = (raw_store.read_raw(TABLE).sort_values(["city", "date"], ignore_index=True)
+           [["city", "date", "temperature_mean"]])
+    expected = pd.DataFrame({"city": ["A", "A", "A", "B"],
+                             "date": ["2022-01-01", "2022-01-02", "2022-01-03", "2022-01-01"],
+                             "temperature_mean": [1.0, 3.0, 2.0, 1.0]})
+    pd.testing.assert_frame_equal(got.astype({"city": str, "date": str}), expected)
+
+
+def test_compact_without_data_raises():
+    with pytest.raises(FileNotFoundError):
+        raw_store.compact(TABLE)
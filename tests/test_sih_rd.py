@@ -0,0 +1,176 @@
+"""Decoding and aggregation of SIH/SUS RD (AIH reduzida) DBF files."""
+
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from src.data import sih_rd
+from src.utils.config import ANALYSIS_END, ANALYSIS_START, HEALTH_AGG_COLUMNS
+
+# (name, type, width) of the RD columns the reader uses
+FIELDS = [
+    ("MUNIC_RES", "C", 6), ("DT_INTER", "C", 8), ("DIAG_PRINC", "C", 4),
+    ("IDADE", "N", 3), ("COD_IDADE", "C", 1), ("SEXO", "C", 1),
+    ("MORTE", "N", 1), ("VAL_TOT", "N", 10),
+]
+
+# munic, admission day, diagnosis, age, age unit, sex, death, amount, deleted
+RECORDS = [
+    ("355030", "20220105", "J189", "30", "4", "1", "0", "100.50", False),
+    ("355030", "20220105", "j45 ", "70", "4", "3", "1", "200.00", False),  # lower case
+    ("355030", "20220105", "J069", "5", "2", "2", "0", "50.00", False),    # 5 months old
+    ("355030", "20220106", "J10 ", "3", "5", "0", "1", "", False),         # 103 years
+    ("355030", "20220105", "I10 ", "40", "4", "1", "0", "75.00", False),   # not chapter J
+    ("355030", "20220105", "J189", "40", "4", "1", "0", "75.00", True),    # deleted
+    ("355030", "20211231", "J189", "40", "4", "1", "0", "75.00", False),   # before window
+    ("355030", "20220231", "J189", "40", "4", "1", "0", "75.00", False),   # invalid date
+    ("350950", "20220105", "J189", "40", "4", "1", "0", "75.00", False),   # not a capital
+    ("261160", "20220301", "J189", "40", "4", "1", "0", "10.00", False),
+]
+
+
+def write_dbf(path, records) -> None:
+    """A dBASE III file with ``FIELDS`` holding ``records``."""
+    record_len = 1 + sum(width for _, _, width in FIELDS)
+    header_len = 32 + 32 * len(FIELDS) + 1
+    out = bytearray(struct.pack("<B3BIHH20x", 3, 122, 1, 1, len(records),
+                                header_len, record_len))
+    for name, kind, width in FIELDS:
+        out += struct.pack("<11sc4xBB14x", name.encode(), kind.encode(), width, 0)
+    out += b"\r"
+    for *values, deleted in records:
+        out += b"*" if deleted else b" "
+        for (_, kind, width), value in zip(FIELDS, values):
+            out += (value.rjust(width) if kind == "N" else value.ljust(width)).encode()
+    out += b"\x1a"
+    path.write_bytes(bytes(out))
+
+
+def _column(values: list[str]) -> np.ndarray:
+    """Byte field ``(n, width)`` as ``DbfTable.field`` returns it."""
+    width = max(len(v) for v in values)
+    return np.frombuffer("".join(v.ljust(width) for v in values).encode(),
+                         dtype=np.uint8).reshape(len(values), width)
+
+
+@pytest.fixture
+def rd_file(tmp_path):
+    path = tmp_path / "RDSP2201.dbf"
+    write_dbf(path, RECORDS)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Field parsers
+# ---------------------------------------------------------------------------
+def test_parse_int_alignment_and_junk():
+    field = _column(["  5", "5  ", "   ", "5 3", "12a", "007", " 42"])
+    np.testing.assert_array_equal(sih_rd.parse_int(field), [5, 5, -1, -1, -1, 7, 42])
+
+
+def test_parse_date_rejects_invalid_days():
+    field = _column(["20220105", "20220231", "20221301", "        ", "20240229"])
+    expected = np.array(["2022-01-05", "NaT", "NaT", "NaT", "2024-02-29"],
+                        dtype="datetime64[D]")
+    np.testing.assert_array_equal(sih_rd.parse_date(field), expected)
+
+
+def test_parse_float_blank_is_nan():
+    np.testing.assert_array_equal(
+        sih_rd.parse_float(_column([" 100.50", "       ", "  12"])), [100.5, np.nan, 12.0])
+
+
+def test_has_prefix_ignores_case():
+    field = _column(["J189", "j45 ", "I10 ", "    "])
+    np.testing.assert_array_equal(sih_rd.has_prefix(field, "J"), [True, True, False, False])
+
+
+def test_ibge_check_digit():
+    munic = np.array([355030, 530010, 261160, 330455])
+    np.testing.assert_array_equal(sih_rd.ibge_code(munic),
+                                  [3550308, 5300108, 2611606, 3304557])
+
+
+def test_age_units():
+    age = np.array([30, 3, 5, 12, 40])
+    unit = np.array([4, 5, 2, 0, 9])
+    np.testing.assert_array_equal(sih_rd._age_years(age, unit), [30, 103, 0, 0, -1])
+
+
+# ---------------------------------------------------------------------------
+# Files and aggregation
+# ---------------------------------------------------------------------------
+def test_dbf_table_fields(rd_file):
+    dbf = sih_rd.DbfTable(rd_file)
+    assert dbf.n_records == len(RECORDS)
+    assert dbf.field("MUNIC_RES").shape == (len(RECORDS), 6)
+    assert bytes(dbf.field("DIAG_PRINC")[1]) == b"j45 "
+    np.testing.assert_array_equal(~dbf.live, [r[-1] for r in RECORDS])
+    with pytest.raises(KeyError):
+        dbf.field("NOPE")
+
+
+def test_list_rd_files(tmp_path):
+    for name in ["RDSP2201.dbc", "RDSP2201.dbf", "RDSP2112.dbf", "RDPE2203.DBC", "notes.txt"]:
+        (tmp_path / name).touch()
+    names = [p.name for p in sih_rd.list_rd_files(tmp_path, since="2022-01-01")]
+    assert names == ["RDPE2203.DBC", "RDSP2201.dbf"]
+    assert len(sih_rd.list_rd_files(tmp_path, since=None)) == 3
+
+
+def _expected_sums() -> pd.DataFrame:
+    rows = [
+        # munic, date, admissions by (all, 0-14, 15-59, 60+, female, male),
+        # deaths by the same, cost
+        (355030, "2022-01-05", 3, 1, 1, 1, 2, 1, 1, 0, 0, 1, 1, 0, 350.5),
+        (355030, "2022-01-06", 1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 0, 0.0),
+        (261160, "2022-03-01", 1, 0, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 10.0),
+    ]
+    df = pd.DataFrame(rows, columns=["munic", "date", *HEALTH_AGG_COLUMNS])
+    df["date"] = pd.to_datetime(df["date"]).astype("datetime64[ns]")
+    return df
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    return df.sort_values(sih_rd.KEYS, ignore_index=True)
+
+
+def test_aggregate_file(rd_file):
+    capitals = sorted(sih_rd._MUNIC_BY_CAPITAL)
+    partial, n_records = sih_rd.aggregate_file(rd_file, ANALYSIS_START, ANALYSIS_END, capitals)
+    assert n_records == len(RECORDS)
+    got = _sorted(partial).astype({"date": "datetime64[ns]"})
+    expected = _sorted(_expected_sums())
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+    # Without the municipality filter the non-capital is kept as well
+    partial, _ = sih_rd.aggregate_file(rd_file, ANALYSIS_START, ANALYSIS_END, None)
+    assert set(partial["munic"]) == {355030, 350950, 261160}
+
+
+def test_to_health_table():
+    table = sih_rd.to_health_table(_expected_sums()).to_pandas()
+    assert list(table["city"]) == ["Recife", "São Paulo", "São Paulo"]
+    assert list(table["ibge_code"]) == ["2611606", "3550308", "3550308"]
+    assert table["id"].iloc[1] == "3550308:2022-01-05"
+    assert (table["cid_category"] == "respiratory").all()
+
+
+def test_ingest(tmp_path, rd_file, monkeypatch):
+    out_path = tmp_path / "health_hospitalizations.parquet"
+    manifests = []
+    monkeypatch.setattr(sih_rd, "raw_path", lambda table_name: out_path)
+    monkeypatch.setattr(sih_rd, "clear_fragments", lambda table_name: 0)
+    monkeypatch.setattr(sih_rd, "load_manifest", dict)
+    monkeypatch.setattr(sih_rd, "save_manifest", manifests.append)
+
+    assert sih_rd.ingest(rd_file.parent, workers=1) == 3
+    table = pq.read_table(out_path).to_pandas()
+    assert table["admissions"].sum() == 5
+    assert table["deaths"].sum() == 2
+    (entry,) = manifests[0].values()
+    assert entry["source"] == sih_rd.SOURCE
+    assert ANALYSIS_END in str(entry["filters"])